@@ -0,0 +1,24 @@
+import os
+import sys
+
+import django
+
+
+# Общая настройка для скриптов замеров: подключаем настройки проекта
+# и инициализируем Django, чтобы скрипты можно было запускать как
+# python -m benchmarks.<имя_скрипта> из корня проекта.
+# database - путь к отдельному файлу SQLite, чтобы замеры не трогали db.sqlite3.
+# Кэш и очередь задач в этом случае тоже отдельные (рядом с базой), иначе версии
+# и данные из кэша рабочей базы смешались бы с данными замера.
+# Замеры выполняются с DEBUG = False, как на рабочем сервере: в режиме отладки
+# Django сохраняет текст каждого SQL-запроса, а панель отладки встраивается в страницы.
+def setup(database=None):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coolsite.settings')
+    from django.conf import settings
+    settings.DEBUG = False
+    if database:
+        settings.DATABASES['default']['NAME'] = database
+        settings.CACHES['default']['LOCATION'] = database + '.cache'
+        settings.WOMEN_JOBS_DATABASE = database + '.jobs'
+    django.setup()
@@ -0,0 +1,175 @@
+"""Сравнение пропускной способности под ASGI и WSGI при 100+ одновременных клиентах.
+
+Скрипт готовит отдельную базу (как bench_load) и дважды запускает себя
+в отдельном процессе: с синхронными представлениями через WSGI-приложение
+(клиенты - потоки) и с асинхронными представлениями (WOMEN_ASYNC_VIEWS=1)
+через ASGI-приложение (клиенты - задачи asyncio в одном цикле событий).
+Клиенты запрашивают главную, категории, статьи и страницу "О сайте".
+
+Запуск:
+    python -m benchmarks.bench_asgi [--clients 100,200] [--requests 2000] [--no-page-cache]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--db', default=None, help='Файл базы (по умолчанию временный)')
+parser.add_argument('--posts', type=int, default=10000, help='Количество статей при заполнении пустой базы')
+parser.add_argument('--clients', default='100,200', help='Количество одновременных клиентов через запятую')
+parser.add_argument('--requests', type=int, default=2000, help='Запросов на каждый уровень')
+parser.add_argument('--no-page-cache', action='store_true', help='Не использовать кэш страниц')
+parser.add_argument('--worker', choices=('wsgi', 'asgi'), help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+db = args.db or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+if args.worker == 'asgi':
+    os.environ['WOMEN_ASYNC_VIEWS'] = '1'
+setup(database=db)
+
+from django.conf import settings
+from django.core.management import call_command
+
+from women.models import Category, Women
+
+
+def urls():
+    rnd = random.Random(1)
+    slugs = list(Women.objects.filter(is_published=True).values_list('slug', flat=True)[:5000])
+    cats = list(Category.objects.filter(published_count__gt=0).values_list('slug', flat=True))
+    result = ['/', '/about/']
+    result += ['/category/%s/' % slug for slug in cats]
+    result += ['/post/%s/' % slug for slug in rnd.sample(slugs, min(len(slugs), 200))]
+    return result
+
+
+def summary(latencies, wall, errors):
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {'rps': len(latencies) / wall, 'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98], 'errors': errors}
+
+
+# WSGI: каждый клиент - поток, запросы выполняются WSGI-приложением.
+def run_wsgi(paths, clients):
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+
+    def request(url):
+        path, _, query = url.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+            'SERVER_NAME': '127.0.0.1', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.multithread': True,
+            'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        status = []
+        start = time.perf_counter()
+        result = application(environ, lambda s, h, e=None: status.append(int(s.split()[0])))
+        try:
+            for _ in result:
+                pass
+        finally:
+            result.close()
+        return time.perf_counter() - start, status[0]
+
+    for url in paths:
+        request(url)
+    work = [paths[i % len(paths)] for i in range(args.requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(request, work))
+    wall = time.perf_counter() - start
+    return summary([r[0] for r in results], wall, sum(1 for r in results if r[1] >= 400))
+
+
+# ASGI: каждый клиент - задача asyncio, запросы выполняются ASGI-приложением.
+def run_asgi(paths, clients):
+    from django.core.asgi import get_asgi_application
+    application = get_asgi_application()
+
+    async def request(url):
+        path, _, query = url.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', b'127.0.0.1')],
+            'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 80),
+        }
+        status = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        start = time.perf_counter()
+        await application(scope, receive, send)
+        return time.perf_counter() - start, status[0]
+
+    async def main():
+        for url in paths:
+            await request(url)
+        work = iter([paths[i % len(paths)] for i in range(args.requests)])
+        results = []
+
+        async def client():
+            for url in work:
+                results.append(await request(url))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        wall = time.perf_counter() - start
+        return summary([r[0] for r in results], wall, sum(1 for r in results if r[1] >= 400))
+
+    return asyncio.run(main())
+
+
+def worker():
+    if args.no_page_cache:
+        # Страницы сохраняются с нулевым сроком, то есть кэш страниц не используется.
+        settings.WOMEN_PAGE_CACHE_TIMEOUT = 0
+    paths = urls()
+    run = run_asgi if args.worker == 'asgi' else run_wsgi
+    results = {clients: run(paths, clients) for clients in (int(c) for c in args.clients.split(','))}
+    json.dump(results, sys.stdout)
+
+
+def main():
+    call_command('migrate', verbosity=0)
+    if not Women.objects.exists():
+        call_command('seed_women', posts=args.posts, stdout=io.StringIO())
+
+    results = {}
+    for mode in ('wsgi', 'asgi'):
+        command = [sys.executable, '-m', 'benchmarks.bench_asgi', '--worker', mode, '--db', db,
+                   '--clients', args.clients, '--requests', str(args.requests)]
+        if args.no_page_cache:
+            command.append('--no-page-cache')
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(output)
+
+    print('%-6s %8s %10s %9s %9s %9s %7s' % ('mode', 'clients', 'rps', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for mode, levels in results.items():
+        for clients, r in levels.items():
+            print('%-6s %8s %10.1f %9.1f %9.1f %9.1f %7d' % (mode, clients, r['rps'], r['p50'] * 1000,
+                                                             r['p95'] * 1000, r['p99'] * 1000, r['errors']))
+
+
+if __name__ == '__main__':
+    if args.worker:
+        worker()
+    else:
+        main()
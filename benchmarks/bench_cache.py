@@ -0,0 +1,71 @@
+"""Замер бэкендов кэша: FileBasedCache против TwoTierCache.
+
+Сценарии: чтение одного горячего ключа (как cache.get('cats') на каждом запросе),
+чтение набора ключей, запись и чтение отсутствующего ключа.
+
+Запуск: python -m benchmarks.bench_cache [--ops 20000] [--keys 500]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from benchmarks import setup
+
+setup()
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+from coolsite.cache import TwoTierCache
+
+# Значение по размеру близкое к списку категорий.
+VALUE = [{'pk': i, 'name': 'Категория %d' % i, 'slug': 'category-%d' % i, 'count': i} for i in range(50)]
+
+
+def rate(ops, func):
+    start = time.perf_counter()
+    for i in range(ops):
+        func(i)
+    return ops / (time.perf_counter() - start)
+
+
+def run(name, cache, ops, keys):
+    cache.set('cats', VALUE)
+    for i in range(keys):
+        cache.set('key:%d' % i, VALUE)
+
+    results = {
+        'get hot key': rate(ops, lambda i: cache.get('cats')),
+        'get %d keys' % keys: rate(ops, lambda i: cache.get('key:%d' % (i % keys))),
+        'get missing': rate(ops, lambda i: cache.get('missing:%d' % i)),
+        'set': rate(ops // 10, lambda i: cache.set('key:%d' % (i % keys), VALUE)),
+    }
+    print(name)
+    for label, value in results.items():
+        print('  %-16s %12.0f ops/s' % (label, value))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--keys', type=int, default=500)
+    args = parser.parse_args()
+
+    file_dir, tier_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        params = {'OPTIONS': {'MAX_ENTRIES': args.keys * 10}}
+        old = run('FileBasedCache', FileBasedCache(file_dir, params), args.ops, args.keys)
+        tier = TwoTierCache(tier_dir, params)
+        new = run('TwoTierCache', tier, args.ops, args.keys)
+        print('stats:', tier.stats())
+        print('speedup:')
+        for label in old:
+            print('  %-16s %12.1fx' % (label, new[label] / old[label]))
+    finally:
+        shutil.rmtree(file_dir)
+        shutil.rmtree(tier_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Замер формы обратной связи: капча django-simple-captcha против пула капч.
+
+Сценарий имитирует наплыв спама: клиент открывает /contact/, загружает
+картинку капчи и отправляет форму с неверным ответом. Для каждой капчи
+выводятся запросов в секунду для страницы, картинки и полного цикла, а также среднее
+количество SQL-запросов на запись за цикл. Пул перед замером заполняется так же,
+как это делает фоновая задача; время заполнения выводится отдельно.
+
+Запуск: python -m benchmarks.bench_captcha [--requests 300] [--concurrency 8]
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--requests', type=int, default=300, help='Циклов на каждый вариант')
+parser.add_argument('--concurrency', type=int, default=8)
+args = parser.parse_args()
+
+setup(database=os.path.join(tempfile.mkdtemp(), 'bench.sqlite3'))
+
+from captcha.fields import CaptchaField
+from captcha.models import CaptchaStore
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from women import captcha
+from women.forms import ContactForm
+
+KEY = re.compile(r'name="captcha_0" value="(\w+)"')
+IMAGE = re.compile(r'<img src="([^"]+)"')
+
+settings.ALLOWED_HOSTS = ['*']
+# Пул должен вместить все капчи замера, иначе замер покажет рисование в запросе.
+settings.WOMEN_CAPTCHA_POOL_SIZE = args.requests * 4
+
+
+def writes(func):
+    count = 0
+
+    def wrapper(execute, sql, params, many, context):
+        nonlocal count
+        if not sql.lstrip().upper().startswith('SELECT'):
+            count += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        func()
+    return count
+
+
+def cycle(client):
+    page = client.get('/contact/').content.decode()
+    client.get(IMAGE.search(page).group(1))
+    client.post('/contact/', {'name': 'spam', 'email': 'spam@example.com', 'content': 'spam',
+                              'captcha_0': KEY.search(page).group(1), 'captcha_1': 'wrong'})
+
+
+def rate(func):
+    clients = [Client() for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda i: func(clients[i % len(clients)]), range(args.requests)))
+    return args.requests / (time.perf_counter() - start)
+
+
+def run(name, field, issue, image_url):
+    ContactForm.base_fields['captcha'] = field
+    cycle(Client())
+    keys = [issue() for _ in range(args.requests)]
+    results = {
+        'page': rate(lambda client: client.get('/contact/')),
+        'image': rate(lambda client: client.get(image_url(keys.pop()))),
+        'cycle': rate(cycle),
+        'writes/cycle': sum(writes(lambda: cycle(Client())) for _ in range(20)) / 20,
+    }
+    print(name)
+    for label, value in results.items():
+        print('  %-14s %10.1f' % (label, value))
+    return results
+
+
+def main():
+    call_command('migrate', verbosity=0)
+    field = ContactForm.base_fields['captcha']
+    old = run('django-simple-captcha', CaptchaField(label=field.label), CaptchaStore.generate_key,
+              lambda key: reverse('captcha-image', kwargs={'key': key}))
+
+    start = time.perf_counter()
+    created = captcha.refill()
+    print('refill: %d captchas, %.1f ms each' % (created, (time.perf_counter() - start) * 1000 / max(created, 1)))
+    new = run('pool', field, captcha.issue, lambda key: reverse('captcha_image', kwargs={'key': key}))
+
+    print('speedup:')
+    for label in ('page', 'image', 'cycle'):
+        print('  %-14s %10.1fx' % (label, new[label] / old[label]))
+
+
+if __name__ == '__main__':
+    main()
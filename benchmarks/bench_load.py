@@ -0,0 +1,256 @@
+"""Нагрузочный замер страниц сайта через WSGI-приложение в том же процессе.
+
+Скрипт создает (или использует готовую) отдельную базу, при необходимости
+заполняет ее командой seed_women и запрашивает все страницы из women/urls.py
+и список статей в админ-панели с разным количеством одновременных клиентов
+(потоков). Для каждой страницы и уровня конкурентности выводятся задержки
+p50/p95/p99, пропускная способность, среднее количество SQL-запросов и доля
+ответов из кэша страниц, а для всего процесса - пиковый объем памяти (RSS).
+
+Результат записывается в JSON. Если указан --baseline, результат сравнивается
+с сохраненным: при росте p95 или количества запросов скрипт завершается с кодом 1.
+
+Запуск:
+    python -m benchmarks.bench_load --posts 100000 --output results.json
+    python -m benchmarks.bench_load --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_load --baseline benchmarks/baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks import setup
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--db', default=None, help='Файл базы (по умолчанию временный)')
+parser.add_argument('--categories', type=int, default=20)
+parser.add_argument('--posts', type=int, default=10000, help='Количество статей при заполнении пустой базы')
+parser.add_argument('--concurrency', default='1,8,32', help='Уровни конкурентности через запятую')
+parser.add_argument('--requests', type=int, default=200, help='Запросов на страницу и уровень конкурентности')
+parser.add_argument('--warmup', type=int, default=5)
+parser.add_argument('--routes', default=None, help='Только эти страницы (имена через запятую)')
+parser.add_argument('--output', default=None, help='Файл для результата в JSON')
+parser.add_argument('--baseline', default=None, help='Сравнить с сохраненным результатом')
+parser.add_argument('--save-baseline', default=None, help='Сохранить результат как базовый')
+parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимый рост p95 (доля)')
+args = parser.parse_args()
+
+db = args.db or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+setup(database=db)
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+
+from women.models import Category, Women
+
+application = get_wsgi_application()
+
+# Минимальный прирост p95 (в секундах), который считается регрессией,
+# чтобы шум на очень быстрых страницах не давал ложных срабатываний.
+MIN_REGRESSION = 0.001
+
+
+def seed():
+    call_command('migrate', verbosity=0)
+    if not Women.objects.exists():
+        call_command('seed_women', categories=args.categories, posts=args.posts, stdout=io.StringIO())
+    if not User.objects.filter(is_superuser=True).exists():
+        User.objects.create_superuser('bench', 'bench@example.com', 'bench')
+
+
+# Страницы для замера: имя -> (список адресов, нужна ли авторизация).
+# Адреса статей и категорий перебираются по кругу, чтобы замер
+# не сводился к одной и той же записи.
+def routes():
+    rnd = random.Random(1)
+    ids = list(Women.objects.filter(is_published=True).values_list('pk', flat=True)[:100000])
+    posts = list(Women.objects.filter(pk__in=rnd.sample(ids, min(len(ids), 500))).values_list('slug', flat=True))
+    cats = list(Category.objects.filter(published_count__gt=0).values_list('slug', flat=True))
+    word = Women.objects.filter(pk=ids[0]).values_list('title', flat=True).first().split()[0]
+    return {
+        'home': (['/'], False),
+        'category': (['/category/%s/' % slug for slug in cats], False),
+        'post': (['/post/%s/' % slug for slug in posts], False),
+        'about': (['/about/', '/about/?page=2'], False),
+        'search': (['/search/?' + urlencode({'q': word})], False),
+        'contact': (['/contact/'], False),
+        'login': (['/login/'], False),
+        'register': (['/register/'], False),
+        'add_page': (['/addpage/'], True),
+        'post_authenticated': (['/post/%s/' % slug for slug in posts], True),
+        'admin_changelist': (['/admin/women/women/'], True),
+    }
+
+
+def session_cookie():
+    client = Client()
+    client.force_login(User.objects.filter(is_superuser=True).first())
+    return '%s=%s' % (settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+
+def environ(url, cookie):
+    path, _, query = url.partition('?')
+    env = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': '127.0.0.1',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if cookie:
+        env['HTTP_COOKIE'] = cookie
+    return env
+
+
+# Один запрос через WSGI-приложение. Возвращает время, количество
+# SQL-запросов, код ответа и признак ответа из кэша страниц.
+def request(url, cookie):
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split()[0])
+        response['headers'] = dict(headers)
+
+    start = time.perf_counter()
+    with connection.execute_wrapper(count):
+        result = application(environ(url, cookie), start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            result.close()
+    elapsed = time.perf_counter() - start
+    return elapsed, queries, response['status'], response['headers'].get('X-Page-Cache') == 'hit'
+
+
+def percentile(cuts, p):
+    return cuts[p - 1] if cuts else 0
+
+
+def run_route(urls, cookie, concurrency):
+    for i in range(args.warmup):
+        request(urls[i % len(urls)], cookie)
+
+    work = [urls[i % len(urls)] for i in range(args.requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda url: request(url, cookie), work))
+    wall = time.perf_counter() - start
+
+    latencies = [r[0] for r in results]
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'p50': percentile(cuts, 50),
+        'p95': percentile(cuts, 95),
+        'p99': percentile(cuts, 99),
+        'rps': len(results) / wall,
+        'queries': statistics.mean(r[1] for r in results),
+        'errors': sum(1 for r in results if r[2] >= 400),
+        'page_cache_hits': sum(1 for r in results if r[3]) / len(results),
+    }
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux значение в килобайтах, в macOS - в байтах.
+    return rss / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+# Сравнение с базовым результатом. Возвращает список описаний регрессий.
+def compare(result, baseline):
+    regressions = []
+    for name, levels in baseline['routes'].items():
+        for level, old in levels.items():
+            new = result['routes'].get(name, {}).get(level)
+            if new is None:
+                continue
+            if new['p95'] > old['p95'] * (1 + args.tolerance) and new['p95'] - old['p95'] > MIN_REGRESSION:
+                regressions.append('%s c=%s: p95 %.1f ms -> %.1f ms'
+                                   % (name, level, old['p95'] * 1000, new['p95'] * 1000))
+            if new['queries'] > old['queries'] + 0.5:
+                regressions.append('%s c=%s: SQL-запросов %.1f -> %.1f'
+                                   % (name, level, old['queries'], new['queries']))
+    return regressions
+
+
+def main():
+    seed()
+    cookie = session_cookie()
+    selected = args.routes.split(',') if args.routes else None
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    result = {
+        'meta': {
+            'posts': Women.objects.count(),
+            'categories': Category.objects.count(),
+            'requests': args.requests,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'routes': {},
+    }
+
+    print('%-20s %4s %9s %9s %9s %9s %8s %7s %6s' % ('route', 'c', 'p50 ms', 'p95 ms', 'p99 ms', 'rps',
+                                                      'queries', 'cached', 'errors'))
+    for name, (urls, auth) in routes().items():
+        if selected and name not in selected:
+            continue
+        result['routes'][name] = {}
+        for level in levels:
+            stats = run_route(urls, cookie if auth else None, level)
+            result['routes'][name][str(level)] = stats
+            print('%-20s %4d %9.2f %9.2f %9.2f %9.1f %8.1f %6.0f%% %6d' % (
+                name, level, stats['p50'] * 1000, stats['p95'] * 1000, stats['p99'] * 1000,
+                stats['rps'], stats['queries'], stats['page_cache_hits'] * 100, stats['errors']))
+
+    result['peak_rss_mb'] = peak_rss_mb()
+    print('peak RSS: %.1f MB' % result['peak_rss_mb'])
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f))
+        if regressions:
+            print('Регрессии относительно %s:' % args.baseline)
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print('Регрессий относительно %s нет' % args.baseline)
+
+
+if __name__ == '__main__':
+    main()
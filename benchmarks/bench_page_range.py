@@ -0,0 +1,61 @@
+"""Замер отрисовки блока пагинации: перебор page_range против окна страниц.
+
+Запуск: python -m benchmarks.bench_page_range [--rows 1000000] [--repeat 5]
+"""
+import argparse
+import time
+
+from benchmarks import setup
+
+setup()
+
+from django.core.paginator import Paginator
+from django.template import Context, Template
+
+from women.pagination import page_window
+
+# Старый вариант из base.html: цикл по всем номерам страниц с фильтрацией в шаблоне.
+OLD = Template("""{% for p in paginator.page_range %}
+{% if page_obj.number == p %}<li class="page-num page-num-selected">{{ p }}</li>
+{% elif p >= page_obj.number|add:-2 and p <= page_obj.number|add:2 %}<li class="page-num"><a href="?page={{ p }}">{{ p }}</a></li>
+{% endif %}{% endfor %}""")
+
+# Новый вариант: окно номеров вычисляется в представлении.
+NEW = Template("""{% for p in page_window %}
+{% if page_obj.number == p %}<li class="page-num page-num-selected">{{ p }}</li>
+{% else %}<li class="page-num"><a href="?page={{ p }}">{{ p }}</a></li>
+{% endif %}{% endfor %}""")
+
+
+def measure(template, context, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        template.render(context)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--per-page', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Paginator считает количество через len(), поэтому range не создает строки в памяти.
+    paginator = Paginator(range(args.rows), args.per_page)
+    page = paginator.page(paginator.num_pages // 2)
+
+    old = measure(OLD, Context({'paginator': paginator, 'page_obj': page}), args.repeat)
+    new = measure(NEW, Context({'page_window': page_window(page), 'page_obj': page}), args.repeat)
+
+    print('rows=%d pages=%d' % (args.rows, paginator.num_pages))
+    print('page_range loop: %10.3f ms' % (old * 1000))
+    print('page window:     %10.3f ms' % (new * 1000))
+    print('speedup:         %10.1fx' % (old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Замер поиска по статьям: LIKE '%...%' (icontains) против индекса FTS5.
+
+Скрипт создает отдельную базу SQLite, заполняет ее статьями со случайным
+текстом и сравнивает поиск админ-панели по search_fields = ('title', 'content')
+с поиском через women_search.
+
+Запуск: python -m benchmarks.bench_search [--rows 1000000] [--db /tmp/bench.sqlite3]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import setup
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--rows', type=int, default=100000)
+parser.add_argument('--words', type=int, default=200, help='Слов в тексте статьи')
+parser.add_argument('--db', default=None, help='Файл базы (по умолчанию временный)')
+parser.add_argument('--repeat', type=int, default=3)
+args = parser.parse_args()
+
+db = args.db or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+setup(database=db)
+
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from women import search
+from women.models import Category, Women
+
+VOCABULARY = ['слово%d' % i for i in range(20000)]
+
+
+def seed():
+    call_command('migrate', verbosity=0)
+    if Women.objects.exists():
+        return
+    cat = Category.objects.create(name='Бенчмарк', slug='bench')
+    rnd = random.Random(1)
+    batch = []
+    for i in range(args.rows):
+        batch.append(Women(title='Статья %d %s' % (i, rnd.choice(VOCABULARY)), slug='post-%d' % i,
+                           content=' '.join(rnd.choices(VOCABULARY, k=args.words)), photo='', cat=cat))
+        if len(batch) == 5000:
+            with transaction.atomic():
+                Women.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        with transaction.atomic():
+            Women.objects.bulk_create(batch)
+
+
+def measure(func):
+    best = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    start = time.perf_counter()
+    seed()
+    print('rows=%d db=%s seed=%.1fs' % (Women.objects.count(), db, time.perf_counter() - start))
+
+    term = VOCABULARY[12345]
+
+    # Как в списке админ-панели: количество и первая страница из 100 записей.
+    def like():
+        qs = Women.objects.filter(Q(title__icontains=term) | Q(content__icontains=term))
+        qs.count()
+        list(qs.only('id', 'title')[:100])
+
+    def fts():
+        qs = Women.objects.filter(pk__in=RawSQL(search.matching_ids_sql(), (search.build_match(term),)))
+        qs.count()
+        list(qs.only('id', 'title')[:100])
+
+    def public():
+        results = search.SearchResults(term)
+        results.count()
+        results[0:3]
+
+    old, new, site = measure(like), measure(fts), measure(public)
+    print('icontains:         %10.1f ms' % (old * 1000))
+    print('fts5 (admin):      %10.1f ms' % (new * 1000))
+    print('fts5 (/search/):   %10.1f ms' % (site * 1000))
+    print('speedup (admin):   %10.1fx' % (old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coolsite.settings')
 
+# Под ASGI публичные страницы обслуживаются асинхронными представлениями
+# (women/async_views.py, настройка WOMEN_ASYNC_VIEWS).
+os.environ.setdefault('WOMEN_ASYNC_VIEWS', '1')
+
 application = get_asgi_application()
@@ -0,0 +1,375 @@
+"""Двухуровневый бэкенд кэша.
+
+Первый уровень - ограниченный LRU-словарь в памяти процесса (по количеству
+записей и по объему), второй - общий для всех процессов файл SQLite.
+Чтение горячего ключа не обращается к диску. Оба уровня хранят значение
+в pickle и распаковывают его при каждом чтении: вызывающий код получает
+собственную копию, и ее изменение не меняет значение в кэше.
+
+Чтобы процессы не отдавали устаревшие данные после записи в другом процессе,
+рядом с базой лежит файл версий, отображенный в память (mmap). Каждый ключ
+попадает в один из слотов файла; любая запись увеличивает счетчик слота.
+Запись первого уровня хранит версию слота, с которой она была прочитана,
+и при несовпадении считается недействительной.
+
+Настройка в settings.CACHES:
+
+    'BACKEND': 'coolsite.cache.TwoTierCache',
+    'LOCATION': '<каталог>',
+    'OPTIONS': {
+        'MAX_ENTRIES': 100000,            # записей в общем хранилище
+        'CULL_FREQUENCY': 3,              # при переполнении удаляется 1/3 самых старых
+        'LOCAL_MAX_ENTRIES': 1000,        # записей в памяти процесса
+        'LOCAL_MAX_BYTES': 8 * 1024 * 1024,
+        'VERSION_SLOTS': 4096,
+    }
+"""
+import contextvars
+import fcntl
+import mmap
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_VERSION = struct.Struct('Q')
+
+# Учет попаданий и промахов в рамках одного запроса. Обработчик запроса
+# кладет сюда объект с полями cache_hits и cache_misses (см. women/middleware.py).
+# Контекстная переменная, в отличие от threading.local, правильно разделяет
+# асинхронные запросы в одном потоке и передается в sync_to_async.
+request_stats = contextvars.ContextVar('cache_request_stats', default=None)
+
+
+def _count(name):
+    stats = request_stats.get()
+    if stats is not None:
+        setattr(stats, name, getattr(stats, name) + 1)
+
+
+class _LocalEntry:
+    __slots__ = ('blob', 'size', 'expires', 'version')
+
+    def __init__(self, blob, size, expires, version):
+        self.blob = blob
+        self.size = size
+        self.expires = expires
+        self.version = version
+
+
+class TwoTierCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._dir = location
+        self._db_path = os.path.join(location, options.get('FILENAME', 'cache.sqlite3'))
+        self._versions_path = self._db_path + '.versions'
+        self._slots = int(options.get('VERSION_SLOTS', 4096))
+        self._local_max_entries = int(options.get('LOCAL_MAX_ENTRIES', 1000))
+        self._local_max_bytes = int(options.get('LOCAL_MAX_BYTES', 8 * 1024 * 1024))
+
+        self._local = OrderedDict()
+        self._local_bytes = 0
+        self._lock = threading.Lock()
+        self._threads = threading.local()
+        self._pid = None
+        self._versions = None
+        self._versions_fd = None
+        self._stats = dict.fromkeys(
+            ('local_hits', 'shared_hits', 'misses', 'sets', 'deletes',
+             'local_evictions', 'shared_evictions'), 0)
+
+    # Соединения и mmap создаются лениво и заново после fork(),
+    # поэтому бэкенд можно создавать до запуска рабочих процессов.
+    def _check_pid(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._open_versions()
+                    self._local.clear()
+                    self._local_bytes = 0
+                    self._threads = threading.local()
+                    self._pid = pid
+
+    def _open_versions(self):
+        os.makedirs(self._dir, exist_ok=True)
+        size = (self._slots + 1) * _VERSION.size
+        fd = os.open(self._versions_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._versions_fd = fd
+        self._versions = mmap.mmap(fd, size)
+
+    def _connection(self):
+        self._check_pid()
+        conn = getattr(self._threads, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # INSERT OR REPLACE удаляет прежнюю строку ключа; без recursive_triggers
+            # это удаление не вызывает триггер cache_del и счетчик записей растет.
+            conn.execute('PRAGMA recursive_triggers=ON')
+            # Количество записей поддерживается триггерами в таблице cache_meta,
+            # чтобы проверка переполнения не выполняла COUNT(*). При открытии
+            # соединения счетчик сверяется с таблицей.
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL);
+                CREATE TABLE IF NOT EXISTS cache_meta (id INTEGER PRIMARY KEY, entries INTEGER NOT NULL);
+                INSERT OR REPLACE INTO cache_meta VALUES (1, (SELECT count(*) FROM cache));
+                CREATE TRIGGER IF NOT EXISTS cache_ins AFTER INSERT ON cache
+                    BEGIN UPDATE cache_meta SET entries = entries + 1 WHERE id = 1; END;
+                CREATE TRIGGER IF NOT EXISTS cache_del AFTER DELETE ON cache
+                    BEGIN UPDATE cache_meta SET entries = entries - 1 WHERE id = 1; END;
+            """)
+            self._threads.conn = conn
+        return conn
+
+    # Версии: слот 0 - общая эпоха (меняется при clear()), слоты 1..N - ключи.
+    def _slot(self, key):
+        return zlib.crc32(key.encode()) % self._slots + 1
+
+    def _version(self, slot):
+        return (_VERSION.unpack_from(self._versions, 0)[0],
+                _VERSION.unpack_from(self._versions, slot * _VERSION.size)[0])
+
+    # Увеличение счетчика слота под файловой блокировкой, чтобы одновременные
+    # записи из разных процессов не теряли инкременты.
+    def _bump(self, slot):
+        fcntl.flock(self._versions_fd, fcntl.LOCK_EX)
+        try:
+            offset = slot * _VERSION.size
+            value = _VERSION.unpack_from(self._versions, offset)[0]
+            _VERSION.pack_into(self._versions, offset, value + 1)
+        finally:
+            fcntl.flock(self._versions_fd, fcntl.LOCK_UN)
+
+    # Первый уровень
+
+    def _local_get(self, key, version):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            if entry.version != version or (entry.expires is not None and entry.expires <= time.time()):
+                self._local_pop(key)
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _local_set(self, key, blob, expires, version):
+        size = len(blob)
+        if size > self._local_max_bytes:
+            return
+        with self._lock:
+            self._local_pop(key)
+            self._local[key] = _LocalEntry(blob, size, expires, version)
+            self._local_bytes += size
+            while len(self._local) > self._local_max_entries or self._local_bytes > self._local_max_bytes:
+                _, old = self._local.popitem(last=False)
+                self._local_bytes -= old.size
+                self._stats['local_evictions'] += 1
+
+    def _local_pop(self, key):
+        entry = self._local.pop(key, None)
+        if entry is not None:
+            self._local_bytes -= entry.size
+
+    # Второй уровень
+
+    def _cull(self, conn):
+        entries = conn.execute('SELECT entries FROM cache_meta WHERE id = 1').fetchone()[0]
+        if entries <= self._max_entries:
+            return
+        # Сначала удаляются просроченные записи, и только если их не хватило - самые старые.
+        entries -= conn.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),)).rowcount
+        if entries <= self._max_entries:
+            return
+        # Строки вставляются с возрастающим rowid, поэтому самые старые записи
+        # удаляются по первичному ключу таблицы без сортировки.
+        count = entries // self._cull_frequency if self._cull_frequency else entries
+        conn.execute('DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY rowid LIMIT ?)',
+                     (count,))
+        self._stats['shared_evictions'] += count
+
+    def _write(self, key, statements):
+        return self._write_many((key,), statements)
+
+    # Запись нескольких ключей одной транзакцией.
+    def _write_many(self, keys, statements):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = statements(conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        with self._lock:
+            for key in keys:
+                self._local_pop(key)
+        for slot in {self._slot(key) for key in keys}:
+            self._bump(slot)
+        return result
+
+    # API кэша Django
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        slot_version = self._version(self._slot(key))
+
+        entry = self._local_get(key, slot_version)
+        if entry is not None:
+            self._stats['local_hits'] += 1
+            _count('cache_hits')
+            return pickle.loads(entry.blob)
+
+        row = conn.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            self._stats['misses'] += 1
+            _count('cache_misses')
+            return default
+
+        self._local_set(key, row[0], row[1], slot_version)
+        self._stats['shared_hits'] += 1
+        _count('cache_hits')
+        return pickle.loads(row[0])
+
+    # Асинхронное чтение. Запись первого уровня проверяется прямо в цикле событий
+    # (это только обращение к памяти процесса, mmap и pickle), и лишь при промахе
+    # чтение из SQLite выполняется в потоке.
+    async def aget(self, key, default=None, version=None):
+        made_key = self.make_and_validate_key(key, version=version)
+        self._check_pid()
+        entry = self._local_get(made_key, self._version(self._slot(made_key)))
+        if entry is not None:
+            self._stats['local_hits'] += 1
+            _count('cache_hits')
+            return pickle.loads(entry.blob)
+        return await sync_to_async(self.get, thread_sensitive=False)(key, default, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        def statements(conn):
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                         (key, blob, expires))
+            self._cull(conn)
+
+        self._write(key, statements)
+        self._stats['sets'] += 1
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        def statements(conn):
+            conn.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, time.time()))
+            cursor = conn.execute('INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                  (key, blob, expires))
+            if cursor.rowcount:
+                self._cull(conn)
+            return bool(cursor.rowcount)
+
+        return self._write(key, statements)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+
+        def statements(conn):
+            cursor = conn.execute('UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                  (expires, key, time.time()))
+            return bool(cursor.rowcount)
+
+        return self._write(key, statements)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def statements(conn):
+            return bool(conn.execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount)
+
+        self._stats['deletes'] += 1
+        return self._write(key, statements)
+
+    # Пакетные запись и удаление выполняются одной транзакцией SQLite,
+    # а не отдельной транзакцией на каждый ключ, как в BaseCache.
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self.make_and_validate_key(key, version=version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 expires) for key, value in data.items()]
+
+        def statements(conn):
+            conn.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', rows)
+            self._cull(conn)
+
+        if rows:
+            self._write_many([row[0] for row in rows], statements)
+            self._stats['sets'] += len(rows)
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+
+        def statements(conn):
+            conn.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+
+        if keys:
+            self._write_many(keys, statements)
+            self._stats['deletes'] += len(keys)
+
+    def has_key(self, key, version=None):
+        sentinel = object()
+        return self.get(key, sentinel, version=version) is not sentinel
+
+    # Атомарное изменение числа: чтение и запись выполняются в одной
+    # транзакции с блокировкой на запись, поэтому счетчики не теряют шаги
+    # при одновременных запросах из разных процессов.
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def statements(conn):
+            row = conn.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            # INSERT OR REPLACE вместо UPDATE: строка получает новый rowid, и часто
+            # изменяемые счетчики (версии) не вытесняются первыми как самые старые.
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                         (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), row[1]))
+            return value
+
+        return self._write(key, statements)
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM cache')
+        with self._lock:
+            self._local.clear()
+            self._local_bytes = 0
+        self._bump(0)
+
+    def close(self, **kwargs):
+        # Соединения остаются открытыми между запросами, как и у других локальных бэкендов.
+        pass
+
+    # Статистика обращений в текущем процессе.
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, local_entries=len(self._local), local_bytes=self._local_bytes)
@@ -43,16 +43,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Замер времени, SQL-запросов и кэша для каждого запроса (заголовок Server-Timing и /metrics/).
+    'women.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # Сессии: без Vary: Cookie на публичных страницах для анонимных посетителей (women/sessions.py).
+    'women.sessions.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    # Чтение публичных страниц с реплик БД и закрепление за основной БД после записи.
+    'women.routers.ReplicaMiddleware',
 ]
 
+# Панель отладки нужна только в режиме отладки. Ее middleware синхронный,
+# и под ASGI из-за него каждый запрос выполнялся бы в потоке.
+if DEBUG:
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'coolsite.urls'
 
 TEMPLATES = [
@@ -84,6 +93,23 @@ DATABASES = {
     }
 }
 
+# Реплики основной БД для чтения публичных страниц (см. women/routers.py).
+# Количество задается переменной окружения WOMEN_DB_REPLICAS, файлы реплик
+# обновляет команда sync_replicas. В тестах реплики указывают на основную БД.
+# Соединения с репликами не сохраняются между запросами (CONN_MAX_AGE = 0),
+# иначе после подмены файла рабочие процессы читали бы старый снимок.
+WOMEN_DB_REPLICAS = []
+for i in range(1, int(os.environ.get('WOMEN_DB_REPLICAS', 0)) + 1):
+    WOMEN_DB_REPLICAS.append('replica%d' % i)
+    DATABASES['replica%d' % i] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / ('db.replica%d.sqlite3' % i),
+        'CONN_MAX_AGE': 0,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['women.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -123,6 +149,14 @@ STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 STATICFILES_DIRS = []
 
+# collectstatic записывает файлы с хэшем содержимого в имени и сжатые копии .gz/.br
+# (см. coolsite/storage.py), {% static %} выводит имена с хэшем.
+STATICFILES_STORAGE = 'coolsite.storage.CompressedManifestStorage'
+
+# Сколько секунд браузер хранит статические файлы без хэша в имени
+# (файлы с хэшем кэшируются на год).
+WOMEN_STATIC_MAX_AGE = 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -131,14 +165,111 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Передача загруженных файлов веб-сервером (см. women/media.py):
+# 'nginx' - заголовок X-Accel-Redirect на внутренний location WOMEN_MEDIA_ACCEL_PREFIX
+# (location /protected-media/ { internal; alias <MEDIA_ROOT>/; }),
+# 'sendfile' - заголовок X-Sendfile (Apache mod_xsendfile), None - файлы отдает Django.
+WOMEN_MEDIA_ACCEL = os.environ.get('WOMEN_MEDIA_ACCEL') or None
+WOMEN_MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Сколько секунд браузер хранит загруженные файлы, кроме фото статей
+# (фото в каталогах photo/%Y/%m/%d/ не меняются и кэшируются на год).
+WOMEN_MEDIA_MAX_AGE = 24 * 60 * 60
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
 # Константа для настройки кэша.
+# Двухуровневый кэш: LRU в памяти процесса перед общим файлом SQLite (см. coolsite/cache.py).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'BACKEND': 'coolsite.cache.TwoTierCache',
         'LOCATION': os.path.join(BASE_DIR, 'coolsite_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'LOCAL_MAX_ENTRIES': 2000,
+            'LOCAL_MAX_BYTES': 16 * 1024 * 1024,
+        },
     }
-}
\ No newline at end of file
+}
+
+# Режим пагинации списков статей: 'page' - по номерам страниц,
+# 'keyset' - по курсору, глубокие страницы стоят столько же, сколько первая.
+WOMEN_PAGINATION_MODE = 'keyset'
+
+# Сколько секунд кэшируется приблизительное количество статей в режиме 'keyset'.
+WOMEN_PAGINATION_COUNT_TIMEOUT = 300
+
+# Сколько секунд хранятся в кэше страницы для анонимных посетителей.
+# Страницы сбрасываются при изменении статей и категорий, поэтому срок может быть большим.
+WOMEN_PAGE_CACHE_TIMEOUT = 6 * 60 * 60
+
+# Сколько секунд статья хранится в кэше статей (сбрасывается и при изменении статьи)
+# и сколько секунд кэшируется отсутствие статьи с запрошенным slug.
+WOMEN_POST_CACHE_TIMEOUT = 24 * 60 * 60
+WOMEN_POST_NOT_FOUND_TIMEOUT = 60
+
+# Добавлять ли к ответам заголовок Server-Timing (SQL, шаблон, кэш, общее время).
+# Метрики для /metrics/ собираются в любом случае.
+WOMEN_SERVER_TIMING = True
+
+# Асинхронные представления публичных страниц (women/async_views.py).
+# Включаются при запуске под ASGI (coolsite/asgi.py задает переменную окружения).
+WOMEN_ASYNC_VIEWS = os.environ.get('WOMEN_ASYNC_VIEWS') == '1'
+
+# Количество адресов статей в одном разделе карты сайта (протокол допускает до 50 000)
+# и количество статей в ленте Atom.
+WOMEN_SITEMAP_SIZE = 50000
+WOMEN_FEED_SIZE = 50
+
+# Допустимое отставание реплики от основной БД (секунды). Если реплика отстает
+# больше, страницы читаются с основной БД.
+WOMEN_REPLICA_MAX_LAG = 0
+
+# Сколько секунд после записи пользователь читает только с основной БД.
+WOMEN_REPLICA_PIN_SECONDS = 30
+
+# Очередь фоновых задач (women/jobs.py): файл SQLite, размер пула команды run_worker,
+# количество попыток, задержка первого повтора и наибольшая задержка (секунды),
+# через сколько секунд задача упавшего обработчика возвращается в очередь
+# и сколько секунд хранятся выполненные и упавшие задачи (ключи идемпотентности
+# выполненных действуют на это время, у упавших ключ освобождается сразу).
+WOMEN_JOBS_DATABASE = os.path.join(BASE_DIR, 'jobs.sqlite3')
+WOMEN_JOBS_WORKERS = 4
+WOMEN_JOBS_MAX_ATTEMPTS = 5
+WOMEN_JOBS_RETRY_DELAY = 10
+WOMEN_JOBS_RETRY_MAX_DELAY = 60 * 60
+WOMEN_JOBS_TIMEOUT = 10 * 60
+WOMEN_JOBS_KEEP = 7 * 24 * 60 * 60
+
+# Почта. По умолчанию письма выводятся в консоль обработчика очереди;
+# для отправки через SMTP задайте переменную окружения EMAIL_BACKEND.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = 'noreply@coolsite.local'
+
+# Адрес, на который пересылаются сообщения формы обратной связи.
+WOMEN_CONTACT_EMAIL = os.environ.get('WOMEN_CONTACT_EMAIL', 'admin@coolsite.local')
+
+# Пул капч формы обратной связи (women/captcha.py): сколько готовых капч держать,
+# по сколько рисовать за раз и сколько секунд капча может ждать выдачи.
+WOMEN_CAPTCHA_POOL_SIZE = 200
+WOMEN_CAPTCHA_BATCH = 20
+WOMEN_CAPTCHA_MAX_AGE = 30 * 60
+
+# Ограничение частоты отправки форм, вычисляющих хэш пароля (women/ratelimit.py):
+# запросов с одного адреса, попыток для одного логина с одного адреса и для одного логина
+# со всех адресов ('N/s', 'N/m', 'N/h', 'N/d') и одновременно обрабатываемых запросов в одном процессе.
+WOMEN_RATELIMITS = {
+    'login': {'ip': '20/m', 'username_ip': '5/m', 'username': '30/h', 'concurrency': 2},
+    'register': {'ip': '5/h', 'concurrency': 1},
+}
+
+# Адреса и сети обратных прокси, которым доверяется заголовок X-Forwarded-For
+# при определении адреса клиента (women/ratelimit.py), например ['127.0.0.1'].
+WOMEN_TRUSTED_PROXIES = []
+
+# Сессии хранятся в кэше с чтением из БД при промахе (women/sessions.py).
+# Срок сессии продлевается при посещении сайта, но не чаще раза в указанное количество секунд.
+SESSION_ENGINE = 'women.sessions'
+WOMEN_SESSION_REFRESH_INTERVAL = 24 * 60 * 60
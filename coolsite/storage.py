@@ -0,0 +1,85 @@
+"""Хранилище статических файлов с хэшем содержимого в именах и сжатыми копиями.
+
+collectstatic копирует файлы в STATIC_ROOT под именами с хэшем содержимого
+(styles.css -> styles.5f2b8a1c3d4e.css, как ManifestStaticFilesStorage), а {% static %}
+выводит эти имена. Файл с хэшем в имени никогда не меняется, поэтому браузер
+может хранить его сколько угодно (см. women.media.serve_static).
+
+Для текстовых файлов рядом записываются заранее сжатые копии: .gz (gzip,
+максимальное сжатие) и .br (brotli, если установлен пакет brotli). Копия
+сохраняется, только если она меньше оригинала. При отдаче файла сжимать
+ничего не нужно - выбирается готовая копия по заголовку Accept-Encoding.
+
+Если collectstatic еще не выполнялся (например, в тестах), {% static %}
+выводит исходные имена файлов.
+
+Настройка в settings:
+
+    STATICFILES_STORAGE = 'coolsite.storage.CompressedManifestStorage'
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Файлы, которые имеет смысл сжимать (изображения PNG/JPEG уже сжаты).
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.txt', '.json', '.xml', '.html', '.map', '.ttf', '.eot')
+
+# Меньшие файлы не сжимаются: выигрыш меньше накладных расходов.
+MIN_SIZE = 256
+
+
+def _compress(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < MIN_SIZE:
+        return
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+        elif os.path.exists(path + suffix):
+            # Копия от прежнего содержимого файла без хэша в имени.
+            os.remove(path + suffix)
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    # Во время collectstatic отсутствующий файл остается ошибкой.
+    collecting = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        self.collecting = True
+        try:
+            for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+                if not isinstance(processed, Exception):
+                    names.add(name)
+                    if hashed_name:
+                        names.add(hashed_name)
+                yield name, hashed_name, processed
+        finally:
+            self.collecting = False
+        if dry_run:
+            return
+        for name in sorted(names):
+            if name.lower().endswith(COMPRESSIBLE):
+                _compress(self.path(name))
+
+    # Файла нет в STATIC_ROOT (collectstatic не выполнялся) - выводится исходное имя.
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if self.collecting:
+                raise
+            return name
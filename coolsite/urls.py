@@ -14,18 +14,29 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
-from django.conf.urls.static import static
-
 from coolsite import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from women.media import serve_media, serve_static
+from women.metrics import metrics_view
 from women.views import pageNotFound
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('women.urls')),
     path('captcha/', include('captcha.urls')),
+
+    # Метрики производительности в формате Prometheus (только для INTERNAL_IPS).
+    path('metrics/', metrics_view, name='metrics'),
+
+    # Загруженные файлы (фото статей) отдаются и без режима отладки:
+    # через веб-сервер (X-Accel-Redirect/X-Sendfile) или FileResponse (см. women/media.py).
+    path(settings.MEDIA_URL.lstrip('/') + '<path:path>', serve_media, name='media'),
+
+    # Статические файлы из STATIC_ROOT с заранее сжатыми копиями - для запуска
+    # без веб-сервера перед Django. В режиме отладки их отдает runserver.
+    path(settings.STATIC_URL.lstrip('/') + '<path:path>', serve_static, name='static'),
 ]
 
 if settings.DEBUG:
@@ -35,13 +46,4 @@ if settings.DEBUG:
         path('__debug__/', include(debug_toolbar.urls)),
     ] + urlpatterns
 
-    # В процессе отладки сайта, то есть, когда мы используем
-    # отладочный веб-сервер, нужно сэмулировать работу
-    # реального сервера для получения ранее загруженных
-    # файлов и передачи их нашему приложению.
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
-    # к уже существующим маршрутам добавляем еще один маршрут
-    # для статических данных – графических файлов, указывая
-    # вначале URL, а затем, корневую папку, где они будут храниться.
 handler404 = pageNotFound
\ No newline at end of file
@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 from django.utils.safestring import mark_safe
 
+from . import search
+from .images import picture_sources
 # Нужно импортировать модель для регистрации её в панели админа
 # В данном случае импортируем все
 from .models import *
@@ -55,13 +58,24 @@ class WomenAdmin(admin.ModelAdmin):
         if object.photo:
 
             # Функция mark_safe указывает, что теги должны быть рабочими (они не экранируются).
-            return mark_safe(f'<img src="{ object.photo.url }" width="50">')
+            # Выводится миниатюра для админ-панели, а не оригинал (см. images.py).
+            sources = picture_sources(object.photo, 'admin')
+            srcset = f' srcset="{ sources["srcset"] }"' if sources['srcset'] else ''
+            return mark_safe(f'<img src="{ sources["src"] }"{ srcset } width="50">')
 
     # Изменение отображаемого название столбца.
     get_html_photo.short_description = 'Миниатюра'
 
+    # Поиск по заголовку и тексту идет через полнотекстовый индекс (search.py)
+    # вместо LIKE '%...%' по всему тексту каждой статьи.
+    def get_search_results(self, request, queryset, search_term):
+        match = search.build_match(search_term)
+        if not match or not search.is_supported():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=RawSQL(search.matching_ids_sql(), (match,))), False
+
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name')
+    list_display = ('id', 'name', 'published_count')
     list_display_links = ('id', 'name')
 
     # Нужно обязательно ставить запятую при одном параметре,
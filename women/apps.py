@@ -12,3 +12,7 @@ class WomenConfig(AppConfig):
     # Атрибут verbose_name отображает название приложения Women
     # в панели админа (заголовок таблицы).
     verbose_name = 'Женщины мира'
+
+    # Подключаем обработчики сигналов модели и проверку настроек реплик при запуске приложения.
+    def ready(self):
+        from . import routers, signals
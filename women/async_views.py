@@ -0,0 +1,126 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404
+from django.shortcuts import render
+
+from . import postcache
+from .categories import registry
+from .fragments import aabout_sidebar_html, amenu_html, asidebar_html
+from .metrics import timer
+from .models import Women
+from .pagination import KeysetPaginator, page_window
+from .utils import DataMixin, auser, menu
+
+# Асинхронные варианты публичных страниц для работы под ASGI
+# (включаются настройкой WOMEN_ASYNC_VIEWS, см. coolsite/asgi.py и urls.py).
+#
+# Синхронное представление занимает поток на все время запроса, включая
+# ожидание SQLite и кэша. Здесь данные читаются асинхронным ORM (aget, afirst,
+# async for) и асинхронными методами кэша, а реестр категорий, кэш статей
+# и фрагменты оформления при попадании в кэш вообще не переходят в поток.
+# Шаблон отрисовывается уже после того, как все данные загружены, поэтому
+# во время отрисовки запросов к БД нет. Отрисовка выполняется в потоке:
+# она занимает процессор, а тег picture проверяет файлы на диске (images.py),
+# и цикл событий не должен ждать их.
+#
+# Контекст шаблонов такой же, как у WomenHome, WomenCategory, ShowPost и about.
+
+
+# Общий контекст страниц, как DataMixin.get_user_context.
+async def _user_context(request, **kwargs):
+    with timer(request, 'context_time'):
+        context = kwargs
+        authenticated = (await auser(request)).is_authenticated
+        user_menu = menu.copy()
+        if not authenticated:
+            user_menu.pop(1)
+        context['menu'] = user_menu
+        context['cats'] = await registry.aall()
+        context.setdefault('cat_selected', 0)
+        context['menu_html'] = await amenu_html(user_menu, authenticated)
+        context['sidebar_html'] = await asidebar_html(context['cat_selected'])
+        return context
+
+
+async def _render(request, template_name, context):
+    with timer(request, 'template_time'):
+        return await sync_to_async(render)(request, template_name, context)
+
+
+# Пагинация списка статей, как DataMixin.paginate_queryset и ListView.
+# Возвращает контекст списка. Пустой список при allow_empty=False - ошибка 404.
+async def _paginate(request, queryset, allow_empty=True):
+    per_page = DataMixin.paginate_by
+    if getattr(settings, 'WOMEN_PAGINATION_MODE', 'page') == 'keyset':
+        paginator = KeysetPaginator(queryset, per_page,
+                                    count_timeout=getattr(settings, 'WOMEN_PAGINATION_COUNT_TIMEOUT', None))
+        try:
+            page = await paginator.apage(request.GET.get('cursor'))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        if page.has_other_pages():
+            await paginator.aprefetch_count()
+        context = {'page_window': None}
+    else:
+        paginator = Paginator(queryset, per_page)
+
+        # Номера страниц требуют COUNT и выборки со смещением - выполняем их в потоке.
+        def load():
+            try:
+                page = paginator.page(request.GET.get('page') or 1)
+            except InvalidPage as e:
+                raise Http404(str(e))
+            page.object_list = list(page.object_list)
+            return page
+
+        page = await sync_to_async(load)()
+        context = {'page_window': page_window(page)}
+
+    if not allow_empty and not page.object_list:
+        raise Http404()
+    context.update(paginator=paginator, page_obj=page, is_paginated=page.has_other_pages(),
+                   object_list=page.object_list, posts=page.object_list)
+    return context
+
+
+def _posts():
+    return Women.objects.filter(is_published=True).select_related('cat').defer('content', 'content_html')
+
+
+async def home(request):
+    context = await _paginate(request, _posts())
+    context.update(await _user_context(request, title='Главная страница'))
+    return await _render(request, 'women/index.html', context)
+
+
+async def category(request, cat_slug):
+    cat = await registry.aget_by_slug(cat_slug)
+    if cat is None:
+        raise Http404()
+    context = await _paginate(request, _posts().filter(cat_id=cat.pk), allow_empty=False)
+    context.update(await _user_context(request, title='Категория - ' + str(cat.name), cat_selected=cat.pk))
+    return await _render(request, 'women/index.html', context)
+
+
+async def show_post(request, post_slug):
+    post = await postcache.aget_post(post_slug)
+    if post is None or not (post.is_published or (await auser(request)).is_authenticated):
+        raise Http404()
+    context = await _user_context(request, title=post, post=post, object=post)
+    return await _render(request, 'women/post.html', context)
+
+
+async def about(request):
+    paginator = Paginator(Women.objects.defer('content', 'content_html', 'excerpt_html'), 3)
+
+    def load():
+        page = paginator.get_page(request.GET.get('page'))
+        page.object_list = list(page.object_list)
+        return page
+
+    page_obj = await sync_to_async(load)()
+    await auser(request)
+    return await _render(request, 'women/about.html', {
+        'page_obj': page_obj, 'page_window': page_window(page_obj), 'menu': menu, 'title': 'О сайте',
+        'menu_html': await amenu_html(menu, True), 'sidebar_html': await aabout_sidebar_html()})
@@ -0,0 +1,236 @@
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from io import BytesIO
+
+from captcha.conf import settings as captcha_settings
+from captcha.fields import CaptchaField, CaptchaTextInput
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.forms import MultiValueField
+from django.http import HttpResponse
+from django.urls import reverse
+
+# Капча формы обратной связи из заранее подготовленного пула.
+#
+# CaptchaField из django-simple-captcha при каждом выводе формы записывает
+# строку CaptchaStore в БД, при каждом запросе картинки рисует ее заново,
+# а при каждой проверке удаляет просроченные строки запросом DELETE.
+# Здесь картинки рисует фоновая задача (women/tasks.py) пачками по
+# WOMEN_CAPTCHA_BATCH штук и кладет в общий кэш вместе с ответами:
+#
+#   captcha:c:<key>      - (ответ, PNG) одной капчи
+#   captcha:batch:<n>    - (время создания, [key, ...]) пачка номер n
+#   captcha:made         - сколько пачек создано
+#   captcha:taken        - сколько пачек забрали процессы сайта
+#   captcha:purged       - до какой пачки удалены просроченные
+#
+# Процесс сайта забирает пачку целиком одним атомарным incr и выдает капчи
+# из памяти, поэтому вывод формы не пишет ни в БД, ни в кэш. Каждая капча
+# выдается один раз и проверяется один раз: проверка удаляет ее из кэша,
+# и повторная отправка с тем же ключом отклоняется. Когда в пуле остается меньше
+# половины WOMEN_CAPTCHA_POOL_SIZE, ставится задача пополнения; она же удаляет
+# просроченные пачки целиком (delete_many). Если пул пуст, капча рисуется
+# прямо в запросе.
+#
+# Капча выдается, пока ее пачке меньше WOMEN_CAPTCHA_MAX_AGE секунд, и действует
+# еще CAPTCHA_TIMEOUT минут после этого.
+
+_local = deque()
+_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _lifetime():
+    return _setting('WOMEN_CAPTCHA_MAX_AGE', 30 * 60) + int(captcha_settings.CAPTCHA_TIMEOUT) * 60
+
+
+def _counter(name):
+    return cache.get('captcha:%s' % name) or 0
+
+
+def _incr(name):
+    key = 'captcha:%s' % name
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Счетчика нет (кэш очищен): создаем его, если другой процесс не успел раньше.
+        cache.add(key, 0, None)
+        return cache.incr(key)
+
+
+# Картинка капчи в PNG, как ее рисует captcha.views.captcha_image.
+def _render(challenge):
+    from PIL import Image, ImageDraw, ImageFont
+
+    rnd = random.Random()
+    fontpath = captcha_settings.CAPTCHA_FONT_PATH
+    if isinstance(fontpath, (list, tuple)):
+        fontpath = rnd.choice(fontpath)
+    font = ImageFont.truetype(fontpath, captcha_settings.CAPTCHA_FONT_SIZE)
+    left, top, right, bottom = font.getbbox(challenge)
+    size = ((right - left) * 2, int((bottom - top) * 1.4))
+    mode = 'RGBA' if captcha_settings.CAPTCHA_BACKGROUND_COLOR == 'transparent' else 'RGB'
+    image = Image.new(mode, size, None if mode == 'RGBA' else captcha_settings.CAPTCHA_BACKGROUND_COLOR)
+    foreground = Image.new('RGB', size, captcha_settings.CAPTCHA_FOREGROUND_COLOR)
+
+    xpos = 2
+    for char in challenge:
+        left, top, right, bottom = font.getbbox(' %s ' % char)
+        char_image = Image.new('L', (right - left, bottom - top), 0)
+        ImageDraw.Draw(char_image).text((0, 0), ' %s ' % char, font=font, fill=255)
+        if captcha_settings.CAPTCHA_LETTER_ROTATION:
+            char_image = char_image.rotate(rnd.randrange(*captcha_settings.CAPTCHA_LETTER_ROTATION),
+                                           resample=Image.BICUBIC)
+        char_image = char_image.crop(char_image.getbbox())
+        mask = Image.new('L', size)
+        mask.paste(char_image, (xpos, 4, xpos + char_image.size[0], 4 + char_image.size[1]))
+        image = Image.composite(foreground, image, mask)
+        xpos += 2 + char_image.size[0]
+
+    image = image.crop((0, 0, xpos + 1, size[1]))
+    draw = ImageDraw.Draw(image)
+    for noise in captcha_settings.noise_functions():
+        draw = noise(draw, image)
+    for image_filter in captcha_settings.filter_functions():
+        image = image_filter(image)
+    out = BytesIO()
+    image.save(out, 'PNG')
+    return out.getvalue()
+
+
+def _generate():
+    challenge, response = captcha_settings.get_challenge()()
+    return secrets.token_hex(20), (response.lower(), _render(challenge))
+
+
+# Добавляет пачки, пока в пуле не наберется WOMEN_CAPTCHA_POOL_SIZE капч,
+# и удаляет просроченные. Возвращает количество созданных капч.
+def refill():
+    size = _setting('WOMEN_CAPTCHA_BATCH', 20)
+    target = _setting('WOMEN_CAPTCHA_POOL_SIZE', 200)
+    created = 0
+    while (_counter('made') - _counter('taken')) * size < target:
+        items = dict(_generate() for _ in range(size))
+        keys = list(items)
+        cache.set_many({'captcha:c:%s' % key: item for key, item in items.items()}, _lifetime())
+        # Пачка публикуется после капч, чтобы забравший ее процесс нашел их в кэше.
+        cache.set('captcha:batch:%d' % _incr('made'), (time.time(), keys), _lifetime())
+        created += size
+    purge()
+    return created
+
+
+# Удаляет пачки, капчи которых уже недействительны, вместе с капчами:
+# одна транзакция на пачку вместо запроса на каждую проверку формы.
+def purge():
+    before = time.time() - _lifetime()
+    number, made = _counter('purged'), _counter('made')
+    while number < made:
+        batch = cache.get('captcha:batch:%d' % (number + 1))
+        if batch is not None and batch[0] > before:
+            break
+        number += 1
+        keys = ['captcha:batch:%d' % number]
+        if batch is not None:
+            keys += ['captcha:c:%s' % key for key in batch[1]]
+        cache.delete_many(keys)
+    cache.set('captcha:purged', number, None)
+
+
+# Ставит задачу пополнения не чаще раза в минуту.
+def _schedule_refill():
+    from . import tasks
+    from .jobs import enqueue
+
+    if cache.add('captcha:refilling', True, 60):
+        enqueue(tasks.refill_captcha_pool)
+
+
+# Забирает из пула следующую пачку: [(время создания, key), ...].
+def _take_batch():
+    max_age = _setting('WOMEN_CAPTCHA_MAX_AGE', 30 * 60)
+    while _counter('taken') < _counter('made'):
+        number = _incr('taken')
+        if (_counter('made') - number) * _setting('WOMEN_CAPTCHA_BATCH', 20) \
+                < _setting('WOMEN_CAPTCHA_POOL_SIZE', 200) // 2:
+            _schedule_refill()
+        batch = cache.get('captcha:batch:%d' % number)
+        if batch is not None and batch[0] > time.time() - max_age:
+            return [(batch[0], key) for key in batch[1]]
+    _schedule_refill()
+    return []
+
+
+# Ключ новой капчи для формы.
+def issue():
+    max_age = _setting('WOMEN_CAPTCHA_MAX_AGE', 30 * 60)
+    with _lock:
+        while True:
+            while _local:
+                created, key = _local.popleft()
+                if created > time.time() - max_age:
+                    return key
+            batch = _take_batch()
+            if not batch:
+                break
+            _local.extend(batch)
+    key, item = _generate()
+    cache.set('captcha:c:%s' % key, item, _lifetime())
+    return key
+
+
+# Проверяет ответ и удаляет капчу: каждую капчу можно проверить только один раз.
+def check(key, response):
+    item = cache.get('captcha:c:%s' % key)
+    if item is None or not cache.delete('captcha:c:%s' % key):
+        return False
+    return secrets.compare_digest(item[0], response.strip().lower())
+
+
+def captcha_image(request, key):
+    item = cache.get('captcha:c:%s' % key)
+    if item is None:
+        # Как в django-simple-captcha: 410, чтобы роботы не индексировали старые адреса.
+        return HttpResponse(status=410)
+    response = HttpResponse(item[1], content_type='image/png')
+    response.headers['Cache-Control'] = 'private, max-age=%d' % _lifetime()
+    return response
+
+
+class PooledCaptchaTextInput(CaptchaTextInput):
+
+    def fetch_captcha_store(self, name, value, attrs=None, generator=None):
+        self._key = issue()
+        self._value = [self._key, '']
+        self.id_ = self.build_attrs(attrs).get('id', None)
+
+    def image_url(self):
+        return reverse('captcha_image', kwargs={'key': self._key})
+
+    def audio_url(self):
+        return None
+
+
+class PooledCaptchaField(CaptchaField):
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', PooledCaptchaTextInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, value):
+        # Проверка MultiValueField без обращения CaptchaField к CaptchaStore.
+        MultiValueField.clean(self, value)
+        key, response = value[0], value[1] or ''
+        value[1] = ''
+        if captcha_settings.CAPTCHA_TEST_MODE and response.strip().lower() == 'passed':
+            cache.delete('captcha:c:%s' % key)
+        elif not check(key, response):
+            raise ValidationError(self.error_messages['invalid'], code='invalid')
+        return value
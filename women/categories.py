@@ -0,0 +1,127 @@
+import threading
+import time
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.urls import reverse
+
+from .models import Category
+from .versions import aget_version, bump_version, get_version
+
+
+# Компактная неизменяемая запись о категории для меню и страниц категорий.
+# URL вычисляется один раз при построении списка, а не на каждом выводе.
+class CategoryRecord(NamedTuple):
+    pk: int
+    name: str
+    slug: str
+    url: str
+    count: int
+
+
+# Реестр категорий в памяти процесса.
+# Список категорий строится одним запросом и хранится, пока не изменится версия.
+# Версия лежит в общем кэше и увеличивается при каждом изменении категорий
+# или статей (см. signals.py), поэтому все рабочие процессы узнают об изменении
+# при следующем обращении, без ожидания истечения TTL.
+class CategoryRegistry:
+
+    version_key = 'women:categories:version'
+    data_key = 'women:categories:%s'
+    lock_key = 'women:categories:lock:%s'
+    changed_key = 'women:categories:changed'
+
+    # Списки старых версий больше не читаются и удаляются из кэша по истечении этого времени.
+    data_timeout = 24 * 60 * 60
+
+    # Состояние реестра - один кортеж (версия, записи, по pk, по slug), который
+    # заменяется целиком одним присваиванием. Читатели берут его без блокировки
+    # и видят либо прежний, либо новый список, но не их смесь.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = (None, (), {}, {})
+
+    def _build(self):
+        return tuple(
+            CategoryRecord(pk, name, slug, reverse('category', kwargs={'cat_slug': slug}), count)
+            for pk, name, slug, count in Category.objects.order_by('id')
+            .values_list('pk', 'name', 'slug', 'published_count')
+        )
+
+    # Загружает список категорий текущей версии: из памяти процесса,
+    # из общего кэша (если его уже построил другой процесс) или из БД.
+    # Построением из БД занимается один процесс, остальные недолго ждут результат.
+    def _load(self, version):
+        records = cache.get(self.data_key % version)
+        if records is None:
+            if not cache.add(self.lock_key % version, 1, 10):
+                for _ in range(20):
+                    time.sleep(0.05)
+                    records = cache.get(self.data_key % version)
+                    if records is not None:
+                        return records
+            records = self._build()
+            cache.set(self.data_key % version, records, self.data_timeout)
+        return records
+
+    # Возвращает состояние текущей версии.
+    def _refresh(self):
+        version = get_version(self.version_key)
+        state = self._state
+        if version == state[0]:
+            return state
+        with self._lock:
+            state = self._state
+            if version == state[0]:
+                return state
+            records = self._load(version)
+            state = (version, records, {r.pk: r for r in records}, {r.slug: r for r in records})
+            self._state = state
+            return state
+
+    def version(self):
+        return self._refresh()[0]
+
+    def all(self):
+        return self._refresh()[1]
+
+    def get_by_pk(self, pk):
+        return self._refresh()[2].get(pk)
+
+    def get_by_slug(self, slug):
+        return self._refresh()[3].get(slug)
+
+    # Асинхронные варианты для асинхронных представлений. Если версия не изменилась,
+    # список берется из памяти процесса без перехода в поток.
+    async def _arefresh(self):
+        state = self._state
+        if await aget_version(self.version_key) != state[0]:
+            state = await sync_to_async(self._refresh)()
+        return state
+
+    async def aversion(self):
+        return (await self._arefresh())[0]
+
+    async def aall(self):
+        return (await self._arefresh())[1]
+
+    async def aget_by_slug(self, slug):
+        return (await self._arefresh())[3].get(slug)
+
+    # Время последнего изменения категорий или статей (в секундах epoch).
+    # Используется как Last-Modified списков: удаление статьи не меняет
+    # max(time_update), но меняет содержимое списка.
+    def changed_at(self):
+        return cache.get(self.changed_key)
+
+    async def achanged_at(self):
+        return await cache.aget(self.changed_key)
+
+    # Делает текущий список недействительным во всех процессах.
+    def invalidate(self):
+        bump_version(self.version_key)
+        cache.set(self.changed_key, time.time(), None)
+
+
+registry = CategoryRegistry()
@@ -0,0 +1,193 @@
+import datetime
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+
+from .categories import registry
+from . import pagecache, postcache
+from .pagecache import LAYOUT_KEY
+from .versions import aget_version, get_version
+
+# Проверка условных GET-запросов (If-None-Match / If-Modified-Since).
+#
+# Валидаторы вычисляются без отрисовки шаблона: для статьи - по ее time_update,
+# для главной и страниц категорий - по версиям кэша страниц (pagecache.py)
+# и времени последнего сброса страниц, без запросов к БД: декораторы
+# стоят перед кэшем страниц, и ответ из кэша не должен обращаться к БД.
+# Лента и карта сайта используют list_modified - max(time_update) опубликованных
+# статей (частичные индексы women_pub_updated_idx и women_cat_pub_updated_idx).
+# Если клиент прислал совпадающий валидатор, декоратор condition сразу
+# возвращает ответ 304 без тела, а представление не вызывается.
+#
+# На каждой странице выводится меню с именем пользователя, поэтому в ETag
+# добавляется признак пользователя, а Last-Modified отдается только анонимным.
+
+
+def _user_tag(request):
+    return 'u%s' % request.user.pk if request.user.is_authenticated else 'anon'
+
+
+def _from_timestamp(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+# Время последнего изменения списка: максимум из времени изменения статей
+# и времени последнего изменения категорий/статей (учитывает удаления).
+def list_modified(queryset):
+    modified = queryset.aggregate(last=Max('time_update'))['last']
+    changed_at = registry.changed_at()
+    if changed_at is not None:
+        changed = _from_timestamp(changed_at)
+        modified = max(modified, changed) if modified else changed
+    return modified
+
+
+# Версия страницы списка: версия оформления и версия области страницы.
+def _list_version(scope):
+    return '%s.%s' % pagecache.versions(scope)
+
+
+async def _alist_version(scope):
+    return '%s.%s' % await pagecache.aversions(scope)
+
+
+def _etag(request, modified, version):
+    return '%x-%s-%s' % (int(modified.timestamp() * 1000000), version, _user_tag(request))
+
+
+# Валидаторы вычисляются один раз на запрос: condition вызывает
+# и функцию ETag, и функцию Last-Modified. version - версия данных,
+# которые не отражаются в time_update (меню категорий).
+def _validators(request, key, compute, version):
+    cached = getattr(request, '_women_validators', None)
+    if cached is None or cached[0] != key:
+        modified = compute()
+        etag = None
+        if modified is not None:
+            etag = _etag(request, modified, version())
+        cached = request._women_validators = (key, etag, modified)
+    return cached
+
+
+# Страница статьи зависит от самой статьи и от меню категорий (версия оформления из pagecache.py).
+# Статья берется из кэша статей; для статьи, которую пользователь не может видеть,
+# валидаторов нет - представление вернет 404.
+def _post(request, post_slug):
+    def compute():
+        post = postcache.get_post(post_slug)
+        if post is None or not (post.is_published or request.user.is_authenticated):
+            return None
+        return post.time_update
+    return _validators(request, 'post:' + post_slug, compute, lambda: get_version(LAYOUT_KEY))
+
+
+# Главная и страницы категорий меняются только вместе с версиями их страниц
+# в кэше (см. signals.py и WomenQuerySet), поэтому валидаторы строятся по ним.
+def _list(request, scope):
+    return _validators(request, scope, lambda: _from_timestamp(pagecache.changed_at()),
+                       lambda: _list_version(scope))
+
+
+def _home(request):
+    return _list(request, 'home')
+
+
+# Для неизвестной категории валидаторов нет - представление вернет 404.
+def _category(request, cat_slug):
+    if registry.get_by_slug(cat_slug) is None:
+        return _validators(request, 'cat:' + cat_slug, lambda: None, None)
+    return _list(request, 'cat:' + cat_slug)
+
+
+def post_etag(request, post_slug):
+    return _post(request, post_slug)[1]
+
+
+def post_last_modified(request, post_slug):
+    return None if request.user.is_authenticated else _post(request, post_slug)[2]
+
+
+def home_etag(request):
+    return _home(request)[1]
+
+
+def home_last_modified(request):
+    return None if request.user.is_authenticated else _home(request)[2]
+
+
+def category_etag(request, cat_slug):
+    return _category(request, cat_slug)[1]
+
+
+def category_last_modified(request, cat_slug):
+    return None if request.user.is_authenticated else _category(request, cat_slug)[2]
+
+
+# Асинхронные варианты для асинхронных представлений (async_views.py).
+# Возвращают время изменения и версию, или None, если страницы нет.
+
+async def _apost(request, post_slug):
+    post = await postcache.aget_post(post_slug)
+    if post is None or not (post.is_published or request.user.is_authenticated):
+        return None
+    return post.time_update, await aget_version(LAYOUT_KEY)
+
+
+async def _alist(scope):
+    return _from_timestamp(await pagecache.achanged_at()), await _alist_version(scope)
+
+
+async def _ahome(request):
+    return await _alist('home')
+
+
+async def _acategory(request, cat_slug):
+    if await registry.aget_by_slug(cat_slug) is None:
+        return None
+    return await _alist('cat:' + cat_slug)
+
+
+# Декоратор condition в Django 4.1 поддерживает только синхронные представления.
+# Для асинхронных валидаторы вычисляются асинхронными функциями выше,
+# а дальше проверка выполняется так же, как в condition.
+def _async_condition(view, avalidators):
+    from .utils import auser
+
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        user = await auser(request)
+        result = await avalidators(request, *args, **kwargs)
+        etag = modified = None
+        if result is not None and result[0] is not None:
+            etag = quote_etag(_etag(request, *result))
+            if not user.is_authenticated:
+                modified = int(result[0].timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+
+        if request.method in ('GET', 'HEAD'):
+            if modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(modified)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+        return response
+    return inner
+
+
+def _condition(etag_func, last_modified_func, avalidators):
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_condition(view, avalidators)
+        return condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+    return decorator
+
+
+post_condition = _condition(post_etag, post_last_modified, _apost)
+home_condition = _condition(home_etag, home_last_modified, _ahome)
+category_condition = _condition(category_etag, category_last_modified, _acategory)
@@ -0,0 +1,85 @@
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.http import Http404
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .categories import registry
+from .conditional import list_modified
+from .models import Women
+from .streaming import streaming_response
+
+# Лента последних статей в формате Atom: /feed/ - все статьи,
+# /feed/<slug категории>/ - статьи категории.
+#
+# В ленту попадают WOMEN_FEED_SIZE последних опубликованных статей (по индексам
+# women_pub_created_idx и women_cat_pub_created_idx). Статьи читаются из БД
+# через values().iterator() без создания объектов модели, вместо текста
+# выводится готовый анонс excerpt_html. Название категории берется из реестра
+# категорий. Last-Modified - время последнего изменения статей ленты,
+# повторный запрос без изменений получает ответ 304.
+
+CONTENT_TYPE = 'application/atom+xml; charset=utf-8'
+
+TITLE = 'Известные женщины'
+
+FIELDS = ('title', 'slug', 'cat_id', 'time_create', 'time_update', 'excerpt_html')
+
+
+# Статьи ленты и запись категории из реестра (None для общей ленты).
+def _posts(cat_slug):
+    posts = Women.objects.filter(is_published=True)
+    if cat_slug is None:
+        return posts, None
+    record = registry.get_by_slug(cat_slug)
+    if record is None:
+        raise Http404()
+    return posts.filter(cat_id=record.pk), record
+
+
+# Время изменения ленты сохраняется в запросе: оно же выводится в элементе updated.
+def _modified(request, cat_slug=None):
+    try:
+        posts, record = _posts(cat_slug)
+    except Http404:
+        return None
+    request._women_feed_modified = list_modified(posts)
+    return request._women_feed_modified
+
+
+def _date(value):
+    return value.isoformat(timespec='seconds')
+
+
+@condition(last_modified_func=_modified)
+def feed(request, cat_slug=None):
+    posts, record = _posts(cat_slug)
+    updated = request._women_feed_modified
+    title = TITLE if record is None else '%s - %s' % (TITLE, record.name)
+
+    base = request.build_absolute_uri('/')[:-1]
+    self_url = request.build_absolute_uri()
+    site_url = base + (reverse('home') if record is None else record.url)
+    prefix, suffix = (base + reverse('post', kwargs={'post_slug': 'slug'})).rsplit('slug', 1)
+    rows = posts.values(*FIELDS)[:getattr(settings, 'WOMEN_FEED_SIZE', 50)].iterator(chunk_size=100)
+
+    def chunks():
+        yield '<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="ru">\n' \
+              '<title>%s</title><link href=%s rel="alternate"/><link href=%s rel="self"/><id>%s</id>' \
+              '<updated>%s</updated>\n' % (escape(title), quoteattr(site_url), quoteattr(self_url),
+                                            escape(self_url), _date(updated or timezone.now()))
+        for row in rows:
+            url = prefix + row['slug'] + suffix
+            cat = registry.get_by_pk(row['cat_id'])
+            yield '<entry><title>%s</title><link href=%s rel="alternate"/><id>%s</id>' \
+                  '<published>%s</published><updated>%s</updated>%s' \
+                  '<summary type="html">%s</summary></entry>\n' % (
+                      escape(row['title']), quoteattr(url), escape(url),
+                      _date(row['time_create']), _date(row['time_update']),
+                      '<category term=%s label=%s/>' % (quoteattr(cat.slug), quoteattr(cat.name)) if cat else '',
+                      escape(row['excerpt_html']))
+        yield '</feed>\n'
+
+    return streaming_response(request, chunks(), CONTENT_TYPE)
@@ -1,9 +1,11 @@
-from captcha.fields import CaptchaField
+import secrets
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 
+from .captcha import PooledCaptchaField
 from .models import *
 
 
@@ -107,4 +109,10 @@ class ContactForm(forms.Form):
     name = forms.CharField(label='Имя', max_length=255)
     email = forms.EmailField(label='Email')
     content = forms.CharField(widget=forms.Textarea(attrs={'cols': 60, 'rows': 10}))
-    captcha = CaptchaField(label='Введите символы')
+    # Случайное значение, которое создается при каждом выводе пустой формы.
+    # Повторная отправка той же формы (двойной клик, повтор запроса) не создает
+    # второе письмо, а то же сообщение, набранное заново, отправляется.
+    nonce = forms.CharField(widget=forms.HiddenInput, max_length=64,
+                            initial=lambda: secrets.token_urlsafe(16))
+    # Капча из заранее подготовленного пула (women/captcha.py).
+    captcha = PooledCaptchaField(label='Введите символы')
@@ -0,0 +1,105 @@
+import hashlib
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from .categories import registry
+
+# Готовые HTML-фрагменты общего оформления страниц (base.html):
+# главное меню и список категорий в боковой панели.
+#
+# Фрагменты одинаковы для многих запросов, поэтому шаблоны menu.html
+# и sidebar.html отрисовываются один раз, а результат хранится в кэше.
+# Ключ боковой панели содержит версию реестра категорий, которая меняется
+# при любом изменении категорий и статей (см. signals.py), поэтому
+# устаревший список категорий не выводится.
+#
+# Ключи содержат и версию кода: хэш исходного текста шаблона, а у меню - и хэш
+# его пунктов. После обновления сайта с измененным шаблоном или меню
+# фрагменты прежней версии не используются, хотя еще хранятся в кэше.
+
+MENU_KEY = 'women:fragment:menu:%s:%s'
+SIDEBAR_KEY = 'women:fragment:sidebar:%s:%s:%s'
+
+# Фрагменты старых версий больше не читаются и удаляются из кэша по истечении этого времени.
+TIMEOUT = 24 * 60 * 60
+
+
+# Хэш исходного текста шаблона. В режиме отладки шаблоны меняются
+# без перезапуска процесса, поэтому хэш не запоминается.
+@lru_cache(maxsize=None)
+def _cached_template_version(name):
+    return hashlib.md5(get_template(name).template.source.encode()).hexdigest()[:12]
+
+
+def _template_version(name):
+    if settings.DEBUG:
+        _cached_template_version.cache_clear()
+    return _cached_template_version(name)
+
+
+def _menu_key(menu, authenticated):
+    version = hashlib.md5(('%s%r' % (_template_version('women/menu.html'), menu)).encode()).hexdigest()[:12]
+    return MENU_KEY % (version, 'auth' if authenticated else 'anon')
+
+
+def _sidebar_key(version, cat_selected):
+    return SIDEBAR_KEY % (_template_version('women/sidebar.html'), version, cat_selected)
+
+
+def _fragment(key, render):
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, TIMEOUT)
+    return mark_safe(html)
+
+
+# Пункты главного меню. Набор пунктов зависит только от того,
+# авторизован ли пользователь (см. DataMixin.get_user_context).
+def menu_html(menu, authenticated):
+    return _fragment(_menu_key(menu, authenticated),
+                     lambda: render_to_string('women/menu.html', {'menu': menu}))
+
+
+# Список категорий с выделенной текущей категорией (0 - все категории).
+def sidebar_html(cat_selected):
+    return _fragment(_sidebar_key(registry.version(), cat_selected),
+                     lambda: render_to_string('women/sidebar.html',
+                                              {'cats': registry.all(), 'cat_selected': cat_selected}))
+
+
+# Боковая панель страницы "О сайте": только ссылка "Все категории", без списка категорий.
+def about_sidebar_html():
+    return _fragment(_sidebar_key('about', None),
+                     lambda: render_to_string('women/sidebar.html', {'cats': (), 'cat_selected': None}))
+
+
+# Асинхронные варианты для асинхронных представлений.
+# Отрисовка при промахе (и запись в кэш) выполняется в потоке.
+async def _afragment(key, render):
+    html = await cache.aget(key)
+    if html is None:
+        html = await sync_to_async(_fragment)(key, render)
+    return mark_safe(html)
+
+
+async def amenu_html(menu, authenticated):
+    return await _afragment(_menu_key(menu, authenticated),
+                            lambda: render_to_string('women/menu.html', {'menu': menu}))
+
+
+async def asidebar_html(cat_selected):
+    version = await registry.aversion()
+    return await _afragment(_sidebar_key(version, cat_selected),
+                            lambda: render_to_string('women/sidebar.html',
+                                                     {'cats': registry.all(), 'cat_selected': cat_selected}))
+
+
+async def aabout_sidebar_html():
+    return await _afragment(_sidebar_key('about', None),
+                            lambda: render_to_string('women/sidebar.html', {'cats': (), 'cat_selected': None}))
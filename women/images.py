@@ -0,0 +1,134 @@
+import os
+
+from django.conf import settings
+
+# Производные изображения (renditions) для фото статей.
+#
+# Для каждого размера создаются уменьшенные копии в обычном формате (JPEG,
+# или PNG для изображений с прозрачностью) и в WebP, с плотностью 1x и 2x.
+# Файлы лежат рядом с оригиналами в MEDIA_ROOT:
+#   renditions/<размер>/<плотность>x/photo/%Y/%m/%d/<имя>.<расширение>
+# Шаблонный тег picture (women_tags.py) выводит их через srcset.
+#
+# Модуль не импортирует модели, чтобы функции можно было выполнять
+# в отдельных процессах (ProcessPoolExecutor). При загрузке фото изображения
+# создает фоновая задача (women/tasks.py).
+
+# Ширина в CSS-пикселях для каждого размера (см. styles.css и admin.py).
+RENDITIONS = {
+    'thumb': 150,
+    'post': 300,
+    'admin': 50,
+}
+
+DENSITIES = (1, 2)
+
+RENDITIONS_DIR = 'renditions'
+
+
+def base_format(name):
+    return 'png' if name.lower().endswith('.png') else 'jpeg'
+
+
+# Относительный путь производного изображения внутри MEDIA_ROOT.
+def rendition_name(name, rendition, density=1, fmt=None):
+    fmt = fmt or base_format(name)
+    root = os.path.splitext(name)[0]
+    ext = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp'}[fmt]
+    return '%s/%s/%dx/%s.%s' % (RENDITIONS_DIR, rendition, density, root, ext)
+
+
+def _up_to_date(source, target):
+    try:
+        return os.stat(target).st_mtime >= os.stat(source).st_mtime
+    except FileNotFoundError:
+        return False
+
+
+# Создает все производные изображения для одного фото.
+# Уже актуальные файлы (не старше оригинала) пропускаются.
+# Возвращает количество созданных файлов или None, если оригинала нет.
+def build_renditions(name, media_root=None, force=False):
+    from PIL import Image, ImageOps
+
+    media_root = media_root or settings.MEDIA_ROOT
+    source = os.path.join(media_root, name)
+    if not os.path.exists(source):
+        return None
+
+    targets = []
+    for rendition, width in RENDITIONS.items():
+        for density in DENSITIES:
+            for fmt in (base_format(name), 'webp'):
+                target = os.path.join(media_root, rendition_name(name, rendition, density, fmt))
+                if force or not _up_to_date(source, target):
+                    targets.append((target, width * density, fmt))
+    if not targets:
+        return 0
+
+    # Основные изображения (1x в обычном формате) переименовываются последними:
+    # при сбое посередине сборки не будет основного файла без остальных вариантов.
+    bases = {os.path.join(media_root, rendition_name(name, rendition)) for rendition in RENDITIONS}
+    targets.sort(key=lambda item: item[0] in bases)
+
+    written = []
+    with Image.open(source) as image:
+        # Учитываем ориентацию из EXIF, иначе фото с телефона будут повернуты.
+        image = ImageOps.exif_transpose(image)
+        if base_format(name) == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        for target, width, fmt in targets:
+            copy = image.copy()
+            # Изображения не увеличиваются, только уменьшаются с сохранением пропорций.
+            copy.thumbnail((width, width * 4))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            options = {'quality': 82, 'method': 4} if fmt == 'webp' else {'quality': 85, 'optimize': True}
+            if fmt == 'png':
+                options = {'optimize': True}
+            # Сначала записываем все варианты во временные файлы, затем
+            # переименовываем, чтобы не отдать клиенту наполовину записанный файл.
+            tmp = target + '.tmp'
+            copy.save(tmp, fmt.upper(), **options)
+            written.append((tmp, target))
+    for tmp, target in written:
+        os.replace(tmp, target)
+    return len(targets)
+
+
+# Фото, для которых все производные изображения уже созданы.
+# Запоминаются только готовые фото: имена загруженных файлов уникальны,
+# а отсутствующие изображения проверяются снова, пока их не создаст задача.
+_ready = set()
+
+
+def renditions_ready(name, rendition):
+    if (name, rendition) in _ready:
+        return True
+    for density in DENSITIES:
+        for fmt in (base_format(name), 'webp'):
+            if not os.path.exists(os.path.join(settings.MEDIA_ROOT, rendition_name(name, rendition, density, fmt))):
+                return False
+    _ready.add((name, rendition))
+    return True
+
+
+# Данные для вывода фото: src и srcset в обычном формате и srcset в WebP.
+# Если созданы не все производные изображения, выводится оригинал.
+def picture_sources(photo, rendition):
+    from django.core.files.storage import default_storage
+
+    name = photo.name
+    if not renditions_ready(name, rendition):
+        return {'src': photo.url, 'srcset': '', 'webp_srcset': ''}
+
+    def srcset(fmt):
+        return ', '.join('%s %dx' % (default_storage.url(rendition_name(name, rendition, d, fmt)), d)
+                         for d in DENSITIES)
+
+    return {
+        'src': default_storage.url(rendition_name(name, rendition)),
+        'srcset': srcset(base_format(name)),
+        'webp_srcset': srcset('webp'),
+        'width': RENDITIONS[rendition],
+    }
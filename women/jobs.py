@@ -0,0 +1,181 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import connections
+
+# Очередь фоновых задач в отдельном файле SQLite (WOMEN_JOBS_DATABASE).
+#
+# Представление не выполняет медленную работу (отправку писем, обработку фото)
+# в потоке запроса, а ставит задачу в очередь функцией enqueue() и сразу
+# отвечает. Задачи выполняет команда run_worker в пуле потоков или процессов.
+#
+# Задача - функция, отмеченная декоратором @task (см. women/tasks.py); ее
+# аргументы сохраняются в JSON. Если задача завершилась исключением, она
+# повторяется позже с растущей задержкой (WOMEN_JOBS_RETRY_DELAY * 2^(n-1),
+# но не больше WOMEN_JOBS_RETRY_MAX_DELAY), после WOMEN_JOBS_MAX_ATTEMPTS попыток
+# она помечается как failed и остается в таблице для разбора. Выполненные
+# и окончательно упавшие задачи хранятся WOMEN_JOBS_KEEP секунд.
+#
+# Ключ идемпотентности (key) защищает от повторной постановки той же задачи,
+# например при повторной отправке формы: пока в очереди, в работе или среди
+# выполненных есть задача с этим ключом, новая не добавляется. У упавшей задачи
+# ключ освобождается, и ее можно поставить снова.
+#
+# Очередь хранится не в основной БД: запись в нее не конкурирует с записью
+# статей и не считается изменением данных для реплик (women/routers.py).
+# Если обработчик упал, не завершив задачу, через WOMEN_JOBS_TIMEOUT секунд
+# ее заберет другой обработчик. Это тоже считается попыткой: задача, из-за которой
+# падает обработчик, после max_attempts попыток помечается как failed.
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        task TEXT NOT NULL,
+        args TEXT NOT NULL,
+        key TEXT UNIQUE,
+        state TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        run_at REAL NOT NULL,
+        locked_until REAL,
+        created REAL NOT NULL,
+        finished REAL,
+        error TEXT);
+    CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (run_at) WHERE state = 'queued';
+    CREATE INDEX IF NOT EXISTS jobs_running ON jobs (locked_until) WHERE state = 'running';
+    DROP INDEX IF EXISTS jobs_done;
+    CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished) WHERE state IN ('done', 'failed');
+"""
+
+# Зарегистрированные задачи: имя -> функция.
+_tasks = {}
+
+_threads = threading.local()
+
+
+def task(func):
+    func.task_name = '%s.%s' % (func.__module__, func.__name__)
+    _tasks[func.task_name] = func
+    return func
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# Соединение создается для каждого потока и заново после fork().
+def _connection():
+    conn = getattr(_threads, 'conn', None)
+    if conn is None or _threads.pid != os.getpid():
+        path = str(_setting('WOMEN_JOBS_DATABASE', os.path.join(settings.BASE_DIR, 'jobs.sqlite3')))
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        _threads.conn, _threads.pid = conn, os.getpid()
+    return conn
+
+
+# Ставит задачу в очередь и возвращает ее id (или id уже поставленной задачи
+# с тем же ключом). delay - через сколько секунд задачу можно выполнять.
+# Если задача связана с изменением основной БД, ее нужно ставить после фиксации
+# транзакции (transaction.on_commit), иначе обработчик может не увидеть данных.
+def enqueue(func, *args, key=None, delay=0, max_attempts=None):
+    name = getattr(func, 'task_name', func)
+    if name not in _tasks:
+        raise ValueError('Неизвестная задача: %s' % name)
+    now = time.time()
+    conn = _connection()
+    cursor = conn.execute(
+        'INSERT OR IGNORE INTO jobs (task, args, key, state, max_attempts, run_at, created) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (name, json.dumps(args), key, QUEUED,
+         max_attempts or _setting('WOMEN_JOBS_MAX_ATTEMPTS', 5), now + delay, now))
+    if cursor.rowcount:
+        return cursor.lastrowid
+    return conn.execute('SELECT id FROM jobs WHERE key = ?', (key,)).fetchone()[0]
+
+
+# Забирает до limit готовых к выполнению задач: [(id, task, args), ...].
+# Выбор и пометка выполняются в одной транзакции с блокировкой на запись,
+# поэтому одну задачу не заберут два обработчика.
+def claim(limit):
+    now = time.time()
+    conn = _connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Задачи упавших обработчиков возвращаются в очередь, если попытки не исчерпаны.
+        conn.execute('UPDATE jobs SET state = ?, finished = ?, locked_until = NULL, key = NULL, error = ? '
+                     'WHERE state = ? AND locked_until < ? AND attempts >= max_attempts',
+                     (FAILED, now, 'Обработчик не завершил задачу', RUNNING, now))
+        conn.execute('UPDATE jobs SET state = ? WHERE state = ? AND locked_until < ?', (QUEUED, RUNNING, now))
+        rows = conn.execute('SELECT id, task, args FROM jobs WHERE state = ? AND run_at <= ? '
+                            'ORDER BY run_at LIMIT ?', (QUEUED, now, limit)).fetchall()
+        conn.executemany('UPDATE jobs SET state = ?, attempts = attempts + 1, locked_until = ? WHERE id = ?',
+                         [(RUNNING, now + _setting('WOMEN_JOBS_TIMEOUT', 600), row[0]) for row in rows])
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return rows
+
+
+def complete(job_id):
+    _connection().execute('UPDATE jobs SET state = ?, finished = ?, locked_until = NULL, error = NULL '
+                          'WHERE id = ?', (DONE, time.time(), job_id))
+
+
+# Задача завершилась ошибкой: повтор с задержкой или окончательная ошибка.
+# Возвращает новое состояние задачи.
+def fail(job_id, error):
+    now = time.time()
+    conn = _connection()
+    attempts, max_attempts = conn.execute('SELECT attempts, max_attempts FROM jobs WHERE id = ?',
+                                          (job_id,)).fetchone()
+    if attempts >= max_attempts:
+        conn.execute('UPDATE jobs SET state = ?, finished = ?, locked_until = NULL, key = NULL, error = ? '
+                     'WHERE id = ?', (FAILED, now, error, job_id))
+        return FAILED
+    # Случайная добавка разносит повторы задач, упавших одновременно.
+    delay = min(_setting('WOMEN_JOBS_RETRY_DELAY', 10) * 2 ** (attempts - 1),
+                _setting('WOMEN_JOBS_RETRY_MAX_DELAY', 3600)) * random.uniform(1, 1.25)
+    conn.execute('UPDATE jobs SET state = ?, run_at = ?, locked_until = NULL, error = ? WHERE id = ?',
+                 (QUEUED, now + delay, error, job_id))
+    return QUEUED
+
+
+# Удаляет выполненные и упавшие задачи старше WOMEN_JOBS_KEEP секунд.
+# Возвращает их количество. Состояния записаны в запросе, а не параметрами,
+# чтобы SQLite использовал частичный индекс jobs_finished.
+def cleanup():
+    before = time.time() - _setting('WOMEN_JOBS_KEEP', 7 * 24 * 60 * 60)
+    return _connection().execute("DELETE FROM jobs WHERE state IN ('done', 'failed') AND finished < ?",
+                                 (before,)).rowcount
+
+
+# Количество задач в каждом состоянии.
+def stats():
+    counts = dict.fromkeys((QUEUED, RUNNING, DONE, FAILED), 0)
+    counts.update(_connection().execute('SELECT state, count(*) FROM jobs GROUP BY state'))
+    return counts
+
+
+# Выполняет задачу в потоке или процессе пула. Ошибка возвращается текстом,
+# а не исключением: исключение может не передаваться между процессами.
+def execute(name, args):
+    try:
+        _tasks[name](*json.loads(args))
+        return None
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        # Соединения с БД принадлежат потоку пула, закрываем их после задачи.
+        connections.close_all()
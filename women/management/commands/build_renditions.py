@@ -0,0 +1,47 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from women.images import build_renditions
+from women.models import Women
+
+
+# Команда создает производные изображения (миниатюры, WebP) для уже загруженных фото.
+# Работа распределяется по пулу процессов; актуальные файлы пропускаются,
+# поэтому команду можно запускать повторно.
+# Запуск: python manage.py build_renditions [--workers 4] [--force]
+class Command(BaseCommand):
+    help = 'Создает производные изображения для фото статей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Количество процессов (по умолчанию - число ядер)')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать изображения, даже если они актуальны')
+        parser.add_argument('--chunk-size', type=int, default=16)
+
+    def handle(self, *args, **options):
+        names = Women.objects.exclude(photo='').order_by().values_list('photo', flat=True)\
+            .distinct().iterator(chunk_size=2000)
+
+        created = skipped = missing = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            results = pool.map(_build, ((name, settings.MEDIA_ROOT, options['force']) for name in names),
+                               chunksize=options['chunk_size'])
+            for name, result in results:
+                if result is None:
+                    missing += 1
+                    self.stderr.write('Нет файла: %s' % name)
+                elif result:
+                    created += result
+                else:
+                    skipped += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            'Создано файлов: %d, актуальных фото: %d, отсутствует: %d' % (created, skipped, missing)))
+
+
+def _build(args):
+    name, media_root, force = args
+    return name, build_renditions(name, media_root, force)
@@ -0,0 +1,261 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import slug_re
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from women.images import build_renditions
+from women.models import Category, Women
+
+# Транслитерация для slug из русских заголовков (как в админ-панели).
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'j', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+SLUG_LENGTH = Women._meta.get_field('slug').max_length
+
+FALSE_VALUES = {'0', 'false', 'no', 'нет', ''}
+
+# Результат записи, статья из которой уже есть в БД.
+EXISTING = object()
+
+
+# Команда загружает статьи из файла JSON Lines или CSV. Каждая запись содержит поля
+# title, content, cat (slug категории) и необязательные slug, is_published и photo
+# (путь к файлу фото относительно --photos-dir или абсолютный).
+#
+# Файл читается потоком порциями по --batch-size записей. Текст статей
+# преобразуется в HTML, а фото проверяются и копируются в MEDIA_ROOT в пуле
+# процессов, пока основной процесс вставляет предыдущие порции через bulk_create.
+# Категории и занятые slug загружаются из БД один раз, поэтому на запись
+# не выполняется ни одного запроса. Записи с уже существующим явно указанным slug
+# пропускаются, а для сформированных из заголовка slug подбирается свободный суффикс.
+#
+# После каждой порции в файл контрольной точки записывается количество обработанных
+# записей, и повторный запуск продолжает с этого места. Файл и БД нельзя изменить
+# одной транзакцией, поэтому перед вставкой порции записывается предварительная
+# точка: новое состояние, прежнее состояние и slug первой статьи порции. Если запуск
+# прервался между вставкой и окончательной записью точки, повторный запуск по наличию
+# этого slug в БД узнает, была ли порция зафиксирована, и не вставит ее второй раз.
+#
+# Запуск: python manage.py import_women posts.jsonl [--photos-dir DIR] [--batch-size 2000]
+#         [--workers 4] [--create-categories] [--renditions] [--restart]
+class Command(BaseCommand):
+    help = 'Загружает статьи и фото из файла JSON Lines или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .jsonl или .csv')
+        parser.add_argument('--format', choices=('jsonl', 'csv'), default=None,
+                            help='Формат файла (по умолчанию по расширению)')
+        parser.add_argument('--photos-dir', default=None, help='Каталог с файлами фото')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Количество процессов (по умолчанию - число ядер)')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Создавать отсутствующие категории (название из поля cat_name)')
+        parser.add_argument('--renditions', action='store_true',
+                            help='Сразу создавать производные изображения фото')
+        parser.add_argument('--checkpoint', default=None,
+                            help='Файл контрольной точки (по умолчанию <path>.checkpoint)')
+        parser.add_argument('--restart', action='store_true', help='Начать сначала, не учитывая контрольную точку')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError('Нет файла %s' % path)
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        self.checkpoint_path = options['checkpoint'] or path + '.checkpoint'
+        self.create_categories = options['create_categories']
+        start = time.perf_counter()
+
+        state = {'records': 0, 'imported': 0, 'existing': 0, 'failed': 0}
+        if not options['restart'] and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                state.update(json.load(f))
+            pending = state.pop('pending', None)
+            if pending and not Women.objects.filter(slug=pending['slug']).exists():
+                state = pending['state']
+            self.stdout.write('Продолжение с записи %d' % state['records'])
+
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+        self.slugs = set(Women.objects.values_list('slug', flat=True).iterator(chunk_size=10000))
+        self.suffixes = {}
+
+        photo_args = (options['photos_dir'], settings.MEDIA_ROOT, timezone.now().strftime('photo/%Y/%m/%d'),
+                      options['renditions'])
+        batches = _batches(_read(path, fmt, state['records']), options['batch_size'])
+
+        # Порции подготавливаются в пуле процессов с опережением на две порции
+        # на процесс: так процессы не простаивают, а файл не читается в память целиком.
+        workers = options['workers'] or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            depth = 2 * workers
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.submit(_prepare, batch, photo_args))
+                if len(pending) >= depth:
+                    self.save(pending.popleft().result(), state)
+            while pending:
+                self.save(pending.popleft().result(), state)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Загружено статей: %d, уже было: %d, с ошибками: %d за %.1f с'
+            % (state['imported'], state['existing'], state['failed'], time.perf_counter() - start)))
+
+    # Вставляет подготовленную порцию одной транзакцией и сохраняет контрольную точку.
+    def save(self, batch, state):
+        previous = dict(state)
+        posts = []
+        for number, record, error in batch:
+            if error is None:
+                error = self.build(record, posts)
+            if error is EXISTING:
+                state['existing'] += 1
+            elif error:
+                state['failed'] += 1
+                self.stderr.write('Запись %d: %s' % (number, error))
+
+        state['records'] += len(batch)
+        state['imported'] += len(posts)
+        if posts:
+            self.write_checkpoint(dict(state, pending={'slug': posts[0].slug, 'state': previous}))
+            with transaction.atomic():
+                Women.objects.bulk_create(posts)
+        self.write_checkpoint(state)
+        self.stdout.write('%d записей, загружено %d' % (state['records'], state['imported']))
+
+    def write_checkpoint(self, state):
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    # Создает статью из записи и добавляет ее в posts.
+    # Возвращает None, EXISTING или текст ошибки.
+    def build(self, record, posts):
+        title = (record.get('title') or '').strip()
+        if not title:
+            return 'нет заголовка'
+
+        cat_id = self.category(record)
+        if cat_id is None:
+            return 'нет категории %r' % record.get('cat')
+
+        slug = record.get('slug')
+        if slug:
+            # Статья с этим slug уже есть: например, загружена до прерванного запуска.
+            if slug in self.slugs:
+                return EXISTING
+            if not slug_re.match(slug) or len(slug) > SLUG_LENGTH:
+                return 'неверный slug %r' % slug
+        else:
+            slug = self.unique_slug(title)
+        self.slugs.add(slug)
+
+        posts.append(Women(title=title[:255], slug=slug, content=record['content'],
+                           content_html=record['content_html'], excerpt_html=record['excerpt_html'],
+                           photo=record.get('photo') or '', is_published=record['is_published'],
+                           cat_id=cat_id))
+        return None
+
+    def category(self, record):
+        slug = record.get('cat')
+        if not slug:
+            return None
+        if slug not in self.categories and self.create_categories:
+            cat = Category.objects.create(name=record.get('cat_name') or slug, slug=slug)
+            self.categories[slug] = cat.pk
+        return self.categories.get(slug)
+
+    # Slug из заголовка. Если он занят, добавляется суффикс -2, -3 и т.д.;
+    # последний суффикс запоминается, чтобы одинаковые заголовки не перебирались заново.
+    def unique_slug(self, title):
+        base = slugify(title.lower().translate(TRANSLIT))[:SLUG_LENGTH - 8].strip('-') or 'post'
+        slug, n = base, self.suffixes.get(base, 1)
+        while slug in self.slugs:
+            n += 1
+            slug = '%s-%d' % (base, n)
+        self.suffixes[base] = n
+        return slug
+
+
+# Записи файла, начиная с записи skip, в виде пар (номер записи, словарь).
+def _read(path, fmt, skip):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = csv.DictReader(f) if fmt == 'csv' else (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows, 1):
+            if number > skip:
+                yield number, row
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Выполняется в пуле процессов: формирует HTML статей и проверяет и копирует фото.
+# Возвращает список (номер записи, запись, текст ошибки или None).
+def _prepare(batch, photo_args):
+    result = []
+    for number, record in batch:
+        try:
+            post = Women(content=record.get('content') or '')
+            post.render_content()
+            record['content'], record['content_html'], record['excerpt_html'] = \
+                post.content, post.content_html, post.excerpt_html
+            published = record.get('is_published', True)
+            record['is_published'] = published if isinstance(published, bool) \
+                else str(published).strip().lower() not in FALSE_VALUES
+            if record.get('photo'):
+                record['photo'] = _store_photo(record['photo'], *photo_args)
+            result.append((number, record, None))
+        except Exception as e:
+            result.append((number, record, '%s: %s' % (type(e).__name__, e)))
+    return result
+
+
+# Проверяет, что файл - изображение, и копирует его в MEDIA_ROOT/<upload_dir>.
+# Имя файла в MEDIA_ROOT строится по хэшу содержимого: повторная загрузка
+# того же фото не создает копию. Возвращает имя файла для поля photo.
+def _store_photo(source, photos_dir, media_root, upload_dir, renditions):
+    from PIL import Image
+
+    if photos_dir and not os.path.isabs(source):
+        source = os.path.join(photos_dir, source)
+    with Image.open(source) as image:
+        image.verify()
+
+    digest = hashlib.sha1()
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    name = '%s/%s%s' % (upload_dir, digest.hexdigest()[:16], os.path.splitext(source)[1].lower())
+
+    target = os.path.join(media_root, name)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = '%s.%d.tmp' % (target, os.getpid())
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    if renditions:
+        build_renditions(name, media_root)
+    return name
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from women import search
+from women.models import Women
+
+
+# Команда полностью перестраивает полнотекстовый индекс статей.
+# Индекс с внешним содержимым перестраивается внутри SQLite командой 'rebuild'
+# по таблице women_women, без передачи текста статей через Python.
+# Запуск: python manage.py rebuild_search_index
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс статей (SQLite FTS5)'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stderr.write('Полнотекстовый индекс поддерживается только для SQLite')
+            return
+
+        with transaction.atomic(), connection.cursor() as c:
+            c.execute("INSERT INTO {t} ({t}) VALUES ('rebuild')".format(t=search.TABLE))
+            total = Women.objects.count()
+
+        # Слияние сегментов индекса после массовой вставки ускоряет поиск.
+        with connection.cursor() as c:
+            c.execute("INSERT INTO {t} ({t}) VALUES ('optimize')".format(t=search.TABLE))
+
+        self.stdout.write(self.style.SUCCESS('Проиндексировано статей: %d' % total))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from women.models import Category
+
+
+# Команда сверяет счетчики опубликованных статей в категориях с таблицей статей
+# и исправляет расхождения (например, после изменений напрямую в БД).
+# Запуск: python manage.py reconcile_counters
+class Command(BaseCommand):
+    help = 'Пересчитывает количество опубликованных статей в категориях'
+
+    def handle(self, *args, **options):
+        before = dict(Category.objects.values_list('pk', 'published_count'))
+        Category.objects.recount()
+        after = Category.objects.values_list('pk', 'name', 'published_count')
+
+        fixed = 0
+        for pk, name, count in after:
+            if before.get(pk) != count:
+                fixed += 1
+                self.stdout.write('%s: %s -> %s' % (name, before.get(pk), count))
+
+        self.stdout.write(self.style.SUCCESS('Исправлено счетчиков: %d' % fixed))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+
+from women import pagecache, postcache
+from women.models import Women
+
+
+# Команда заново формирует content_html и excerpt_html у всех статей.
+# Нужна после добавления этих полей и после массовых изменений content
+# через QuerySet.update(), при которых метод save() не вызывается.
+# Запуск: python manage.py render_content [--batch-size 1000]
+class Command(BaseCommand):
+    help = 'Формирует HTML текста и анонса для всех статей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ['content_html', 'excerpt_html']
+        qs = Women.objects.only('id', 'content', *fields).order_by('id')
+
+        # Идем по таблице порциями по первичному ключу,
+        # чтобы не держать в памяти все записи сразу.
+        last_id = 0
+        total = changed = 0
+        while True:
+            batch = list(qs.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            # Обновляем только те записи, у которых HTML действительно изменился.
+            stale = []
+            for post in batch:
+                old = (post.content_html, post.excerpt_html)
+                post.render_content()
+                if (post.content_html, post.excerpt_html) != old:
+                    stale.append(post)
+
+            # Обычный QuerySet: WomenQuerySet.bulk_update сбрасывал бы кэши
+            # после каждой порции. Поля поиска не меняются, индекс не нужен.
+            if stale:
+                with transaction.atomic():
+                    models.QuerySet(Women).bulk_update(stale, fields)
+
+            total += len(batch)
+            changed += len(stale)
+
+        # Кэш страниц и статей сбрасывается один раз после всех порций.
+        if changed:
+            pagecache.purge_all()
+            postcache.invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS('Обработано статей: %d, обновлено: %d' % (total, changed)))
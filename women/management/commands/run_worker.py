@@ -0,0 +1,115 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from women import jobs
+from women.jobs import FAILED
+
+# Как часто удаляются старые выполненные задачи (секунды).
+CLEANUP_INTERVAL = 60
+
+
+# Команда выполняет задачи из очереди (см. women/jobs.py) в пуле потоков
+# или процессов. Задачи забираются из очереди, только когда в пуле есть свободное
+# место, поэтому задачи ждут в очереди, а не в памяти обработчика. По SIGTERM
+# или Ctrl+C обработчик перестает брать задачи и дожидается выполняемых.
+# Обработчиков можно запустить несколько, в том числе на одной машине.
+# Запуск: python manage.py run_worker [--workers 4] [--processes] [--once]
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Размер пула (по умолчанию WOMEN_JOBS_WORKERS)')
+        parser.add_argument('--processes', action='store_true',
+                            help='Пул процессов вместо пула потоков (для задач, занимающих процессор)')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Пауза между проверками пустой очереди (секунды)')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и завершиться')
+
+    def handle(self, *args, **options):
+        self.workers = options['workers'] or getattr(settings, 'WOMEN_JOBS_WORKERS', 4)
+        self.processes = options['processes']
+        self.verbosity = options['verbosity']
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+
+        counts = {'done': 0, 'retried': 0, 'failed': 0}
+        running = {}
+        pool = self.create_pool()
+        cleaned = 0
+        try:
+            while True:
+                if time.monotonic() - cleaned > CLEANUP_INTERVAL:
+                    jobs.cleanup()
+                    cleaned = time.monotonic()
+
+                claimed = []
+                if not self.stopping and len(running) < self.workers:
+                    claimed = jobs.claim(self.workers - len(running))
+                for job_id, name, job_args in claimed:
+                    running[pool.submit(jobs.execute, name, job_args)] = (job_id, name, time.perf_counter())
+
+                if not running:
+                    if self.stopping or options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+
+                # Пока пул заполнен, ждем завершения задач; иначе проверяем очередь через poll секунд.
+                done, _ = wait(running, timeout=None if len(running) >= self.workers else options['poll'],
+                               return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job_id, name, start = running.pop(future)
+                    try:
+                        error = future.result()
+                    except BrokenProcessPool:
+                        error, broken = 'Процесс пула завершился аварийно', True
+                    self.finish(job_id, name, error, start, counts)
+                if broken:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    for future, (job_id, name, start) in running.items():
+                        self.finish(job_id, name, 'Процесс пула завершился аварийно', start, counts)
+                    running = {}
+                    pool = self.create_pool()
+        except KeyboardInterrupt:
+            # Невыполненные задачи вернутся в очередь по истечении WOMEN_JOBS_TIMEOUT.
+            self.stopping = True
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            for future, (job_id, name, start) in running.items():
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    self.finish(job_id, name, future.result(), start, counts)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Выполнено: %(done)d, отложено для повтора: %(retried)d, ошибок: %(failed)d' % counts))
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def create_pool(self):
+        if not self.processes:
+            return ThreadPoolExecutor(max_workers=self.workers)
+        # Процессы пула не должны наследовать открытые соединения с БД.
+        connections.close_all()
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    def finish(self, job_id, name, error, start, counts):
+        ms = (time.perf_counter() - start) * 1000
+        if error is None:
+            jobs.complete(job_id)
+            counts['done'] += 1
+            if self.verbosity > 1:
+                self.stdout.write('%s #%d: %.0f ms' % (name, job_id, ms))
+            return
+        state = jobs.fail(job_id, error)
+        counts['failed' if state == FAILED else 'retried'] += 1
+        self.stderr.write('%s #%d: %s (%.0f ms)\n%s' % (
+            name, job_id, 'ошибка' if state == FAILED else 'повтор позже', ms, error))
@@ -0,0 +1,98 @@
+import math
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from women.models import Category, Women
+
+# Слова для синтетического текста статей.
+WORDS = ('родилась жила работала училась стала известной актриса певица учёный писательница '
+         'премия фильм роль книга открытие исследование мир страна город семья детство '
+         'карьера театр музыка история жизнь первая главная лучшая знаменитая новая '
+         'в на с по из для о к и а но что как это был была были год лет время').split()
+
+
+# Команда заполняет БД синтетическими категориями и статьями для замеров
+# производительности (см. benchmarks/bench_load.py). Статьи добавляются через
+# bulk_create порциями в отдельных транзакциях, поэтому даже миллионы записей
+# создаются за минуты. Длина текста статей разная (логнормальное распределение),
+# как у настоящих статей: от коротких заметок до длинных биографий.
+# Тексты (вместе с готовым HTML) генерируются заранее ограниченным набором
+# и повторяются: формирование HTML заняло бы больше времени, чем вставка.
+# Запуск: python manage.py seed_women [--categories 20] [--posts 10000] [--batch-size 2000]
+#        [--superuser admin --password ...]
+class Command(BaseCommand):
+    help = 'Заполняет БД синтетическими статьями для замеров производительности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--words', type=int, default=300, help='Медиана количества слов в статье')
+        parser.add_argument('--texts', type=int, default=1000, help='Количество разных текстов статей')
+        parser.add_argument('--unpublished', type=float, default=0.05, help='Доля неопубликованных статей')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--superuser', default=None,
+                            help='Создать суперпользователя с этим именем (нужен --password)')
+        parser.add_argument('--password', default=None, help='Пароль суперпользователя')
+
+    def text(self, rnd, median):
+        words = min(max(int(rnd.lognormvariate(math.log(median), 0.6)), 20), median * 20)
+        paragraphs = []
+        while words > 0:
+            size = min(words, rnd.randint(40, 120))
+            paragraphs.append(' '.join(rnd.choices(WORDS, k=size)).capitalize() + '.')
+            words -= size
+        return '\n\n'.join(paragraphs)
+
+    def handle(self, *args, **options):
+        if options['superuser'] and not options['password']:
+            raise CommandError('Для --superuser нужно указать --password')
+        rnd = random.Random(options['seed'])
+        start = time.perf_counter()
+
+        # Префикс делает slug уникальными при повторном запуске команды.
+        prefix = 'seed%d' % int(time.time())
+
+        cats = Category.objects.bulk_create([
+            Category(name='Категория %s %d' % (prefix, i), slug='%s-cat-%d' % (prefix, i))
+            for i in range(options['categories'])
+        ])
+        # Не во всех БД bulk_create возвращает первичные ключи, поэтому перечитываем категории.
+        cat_ids = list(Category.objects.filter(slug__startswith=prefix + '-cat-').values_list('pk', flat=True))
+
+        texts = []
+        for _ in range(options['texts']):
+            post = Women(content=self.text(rnd, options['words']))
+            post.render_content()
+            texts.append((post.content, post.content_html, post.excerpt_html))
+
+        # Статьи распределяются по категориям неравномерно, как в жизни.
+        weights = [1 / (i + 1) for i in range(len(cat_ids))]
+
+        total, batch_size = options['posts'], options['batch_size']
+        for offset in range(0, total, batch_size):
+            batch = []
+            for i in range(offset, min(offset + batch_size, total)):
+                # bulk_create не вызывает save(), поэтому HTML статьи берем готовый.
+                content, content_html, excerpt_html = rnd.choice(texts)
+                batch.append(Women(title='%s %d' % (' '.join(rnd.choices(WORDS, k=3)).capitalize(), i),
+                                   slug='%s-%d' % (prefix, i),
+                                   content=content, content_html=content_html, excerpt_html=excerpt_html,
+                                   photo='',
+                                   is_published=rnd.random() >= options['unpublished'],
+                                   cat_id=rnd.choices(cat_ids, weights)[0]))
+
+            with transaction.atomic():
+                Women.objects.bulk_create(batch)
+            self.stdout.write('%d / %d' % (offset + len(batch), total))
+
+        name = options['superuser']
+        if name and not User.objects.filter(username=name).exists():
+            User.objects.create_superuser(name, '%s@example.com' % name, options['password'])
+
+        self.stdout.write(self.style.SUCCESS('Создано категорий: %d, статей: %d за %.1f с'
+                                             % (len(cats), total, time.perf_counter() - start)))
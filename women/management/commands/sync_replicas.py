@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from women.routers import mark_synced, replica_lag, replicas
+
+
+# Команда обновляет реплики основной БД (см. women/routers.py) через онлайн-копирование
+# SQLite (backup API): копия согласована на момент начала копирования, а основная БД
+# во время копирования продолжает принимать чтение и запись.
+# Копия пишется во временный файл и подменяет файл реплики одной операцией,
+# поэтому читатели реплики видят либо старый, либо новый снимок целиком.
+# Рабочие процессы сайта открывают соединение с репликой на каждый запрос
+# (CONN_MAX_AGE = 0, см. women/routers.py) и видят новый снимок со следующего запроса.
+# Запуск: python manage.py sync_replicas [--interval 5] [replica1 ...]
+class Command(BaseCommand):
+    help = 'Копирует основную БД SQLite в файлы реплик'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Реплики (по умолчанию все из WOMEN_DB_REPLICAS)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд (0 - один раз)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Копирование поддерживается только для SQLite')
+        aliases = options['aliases'] or replicas()
+        if not aliases:
+            raise CommandError('Реплики не настроены (переменная окружения WOMEN_DB_REPLICAS)')
+        unknown = set(aliases) - set(replicas())
+        if unknown:
+            raise CommandError('Неизвестные реплики: %s' % ', '.join(sorted(unknown)))
+
+        while True:
+            for alias in aliases:
+                self.sync(alias)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, alias):
+        path = str(connections[alias].settings_dict['NAME'])
+        tmp = path + '.tmp'
+        connection.ensure_connection()
+        # Время снимка фиксируется до начала копирования: запись, закончившаяся
+        # позже, в копию могла не попасть, и реплика будет считаться отстающей.
+        snapshot_time = time.time()
+        start = time.perf_counter()
+        target = sqlite3.connect(tmp)
+        try:
+            connection.connection.backup(target)
+        finally:
+            target.close()
+        os.replace(tmp, path)
+        # Соединение этого процесса (команда могла читать реплику) читало бы старый файл.
+        connections[alias].close()
+        mark_synced(alias, snapshot_time)
+        self.stdout.write('%s: %.0f ms, отставание %.1f с' % (
+            alias, (time.perf_counter() - start) * 1000, replica_lag()[alias]))
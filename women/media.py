@@ -0,0 +1,199 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+# Отдача загруженных файлов (MEDIA_ROOT) без отладочного режима.
+#
+# Если перед Django стоит веб-сервер, передачу файла лучше поручить ему:
+# при WOMEN_MEDIA_ACCEL = 'nginx' ответ содержит только заголовок X-Accel-Redirect
+# с адресом внутреннего location (WOMEN_MEDIA_ACCEL_PREFIX), при 'sendfile' -
+# заголовок X-Sendfile с путем к файлу (Apache mod_xsendfile, lighttpd).
+#
+# Иначе файл отдает сам Django через FileResponse: WSGI-сервер с поддержкой
+# wsgi.file_wrapper передает его системным вызовом sendfile без копирования
+# в Python. Поддерживаются запросы части файла (Range, ответ 206) и условные
+# запросы по ETag и Last-Modified. ETag строится по stat файла (время изменения,
+# размер, inode), поэтому файл не читается для его вычисления.
+#
+# Фото статей лежат в каталогах по дате загрузки (photo/%Y/%m/%d/), и файл
+# с тем же именем не перезаписывается: хранилище дает новому файлу другое имя.
+# Поэтому такие файлы кэшируются браузером на год без проверки (immutable),
+# остальные - на WOMEN_MEDIA_MAX_AGE секунд с проверкой по ETag.
+
+IMMUTABLE_PATH = re.compile(r'^photo/\d{4}/\d{2}/\d{2}/')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Имя статического файла с хэшем содержимого (ManifestStaticFilesStorage): styles.5f2b8a1c3d4e.css.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+# Заранее сжатые копии статических файлов в порядке предпочтения.
+STATIC_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def file_etag(st):
+    return '"%x-%x-%x"' % (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+# Диапазон байтов из заголовка Range: (начало, конец включительно),
+# None - отдать файл целиком, False - диапазон вне файла (ответ 416).
+# Поддерживается один диапазон; при нескольких файл отдается целиком, что допускает RFC 9110.
+def _range(request, size, etag, mtime):
+    header = request.META.get('HTTP_RANGE')
+    if not header or request.method != 'GET':
+        return None
+    # If-Range: диапазон действителен, только если файл не изменился.
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+        return None
+    match = RANGE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        # bytes=-N - последние N байт.
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+# Часть файла для FileResponse. У объекта нет fileno, поэтому wsgi.file_wrapper
+# не отправит через sendfile весь файл вместо диапазона.
+class _FileRange:
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+# Отдает файл full_path. Заголовки кэширования: max_age секунд,
+# immutable - файл по этому адресу никогда не меняется. accel_path - адрес файла
+# для X-Accel-Redirect (если None, файл всегда отдает Django).
+# headers - дополнительные заголовки ответа (например, Content-Encoding).
+def serve_file(request, full_path, max_age, immutable=False, content_type=None, accel_path=None, headers=None):
+    try:
+        st = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404()
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404()
+
+    etag = file_etag(st)
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is None:
+        content_type = content_type or mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        accel = getattr(settings, 'WOMEN_MEDIA_ACCEL', None)
+        byte_range = _range(request, st.st_size, etag, st.st_mtime)
+
+        # Диапазон вне файла отклоняется сразу, и при передаче файла веб-сервером:
+        # ответ тот же, что при отдаче файла Django.
+        if byte_range is False:
+            response = HttpResponse(status=416, content_type=content_type)
+            response.headers['Content-Range'] = 'bytes */%d' % st.st_size
+        elif accel and accel_path is not None:
+            # Файл и допустимые диапазоны передает веб-сервер.
+            response = HttpResponse(content_type=content_type)
+            if accel == 'nginx':
+                response.headers['X-Accel-Redirect'] = quote(accel_path)
+            else:
+                response.headers['X-Sendfile'] = full_path
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+            response.headers['Content-Length'] = st.st_size
+        elif byte_range:
+            start, end = byte_range
+            response = FileResponse(_FileRange(open(full_path, 'rb'), start, end - start + 1),
+                                    status=206, content_type=content_type)
+            response.headers['Content-Length'] = end - start + 1
+            response.headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, st.st_size)
+        else:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+
+        response.headers['Last-Modified'] = http_date(st.st_mtime)
+        response.headers['Accept-Ranges'] = 'bytes'
+
+    response.headers['ETag'] = etag
+    for name, value in (headers or {}).items():
+        response.headers[name] = value
+    if immutable:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+# Представления для MEDIA_URL и STATIC_URL (см. coolsite/urls.py).
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404()
+    prefix = getattr(settings, 'WOMEN_MEDIA_ACCEL_PREFIX', '/protected-media/')
+    return serve_file(request, full_path, getattr(settings, 'WOMEN_MEDIA_MAX_AGE', 24 * 60 * 60),
+                      immutable=bool(IMMUTABLE_PATH.match(path)), accel_path=prefix + path)
+
+
+# Статические файлы из STATIC_ROOT для работы без веб-сервера перед Django.
+# Сжатые копии (.br, .gz) созданы заранее при collectstatic (coolsite/storage.py)
+# и выбираются по Accept-Encoding; ETag у каждой копии свой. Файлы с хэшем
+# содержимого в имени кэшируются на год без проверки.
+def serve_static(request, path):
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404()
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    served, headers = full_path, {}
+    accepted = _accepted_encodings(request)
+    for encoding, suffix in STATIC_ENCODINGS:
+        if os.path.exists(full_path + suffix):
+            # Ответ зависит от Accept-Encoding, даже если отдается несжатый файл.
+            headers['Vary'] = 'Accept-Encoding'
+            if served == full_path and encoding in accepted:
+                served = full_path + suffix
+                headers['Content-Encoding'] = encoding
+
+    return serve_file(request, served, getattr(settings, 'WOMEN_STATIC_MAX_AGE', 60 * 60),
+                      immutable=bool(HASHED_NAME.search(path)), content_type=content_type, headers=headers)
+
+
+# Кодировки из Accept-Encoding, кроме явно запрещенных (q=0).
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.partition(';')
+        try:
+            q = float(params.strip()[2:]) if params.strip().startswith('q=') else 1
+        except ValueError:
+            q = 1
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
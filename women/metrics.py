@@ -0,0 +1,213 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+# Метрики производительности запросов (см. middleware.PerformanceMiddleware).
+#
+# Для каждого запроса собираются количество и время SQL-запросов, время
+# отрисовки шаблона, попадания и промахи кэша и время формирования общего
+# контекста страниц (DataMixin.get_user_context). Данные запроса отдаются
+# в заголовке Server-Timing и накапливаются по имени маршрута в гистограммах,
+# которые выводятся в текстовом формате Prometheus по адресу /metrics/.
+#
+# Метрики хранятся в памяти процесса: каждый рабочий процесс сервера
+# отдает свои значения (метка pid позволяет их различать).
+
+# Границы корзин гистограмм: время обработки запроса (секунды)
+# и количество SQL-запросов на один запрос.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+# Данные одного запроса. Объект хранится в request._women_stats.
+class RequestStats:
+    __slots__ = ('sql_count', 'sql_time', 'template_time', 'context_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.context_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # Обертка для connection.execute_wrapper: считает запросы и их время.
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.sql_count += 1
+
+    def server_timing(self, total):
+        return ', '.join((
+            'db;dur=%.1f;desc="SQL x%d"' % (self.sql_time * 1000, self.sql_count),
+            'tpl;dur=%.1f' % (self.template_time * 1000),
+            'ctx;dur=%.1f' % (self.context_time * 1000),
+            'cache;desc="hit=%d miss=%d"' % (self.cache_hits, self.cache_misses),
+            'total;dur=%.1f' % (total * 1000),
+        ))
+
+
+# Измеряет время блока и прибавляет его к полю статистики запроса.
+# Если статистика не собирается (middleware не подключен), просто выполняет блок.
+@contextmanager
+def timer(request, field):
+    stats = getattr(request, '_women_stats', None)
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(stats, field, getattr(stats, field) + time.perf_counter() - start)
+
+
+# Декоратор метода представления: время метода прибавляется к полю статистики запроса.
+def timed(field):
+    def decorator(method):
+        @wraps(method)
+        def wrapped(self, *args, **kwargs):
+            with timer(self.request, field):
+                return method(self, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _ViewMetrics:
+    __slots__ = ('duration', 'queries', 'sql_time', 'template_time', 'context_time',
+                 'cache_hits', 'cache_misses', 'statuses')
+
+    def __init__(self):
+        self.duration = _Histogram(DURATION_BUCKETS)
+        self.queries = _Histogram(QUERY_BUCKETS)
+        self.sql_time = self.template_time = self.context_time = 0.0
+        self.cache_hits = self.cache_misses = 0
+        self.statuses = {}
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Накопитель метрик процесса. Запись выполняется под блокировкой
+# и занимает несколько операций со словарем и списками.
+class MetricsCollector:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._ratelimits = {}
+
+    def observe(self, view, status, duration, stats):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = _ViewMetrics()
+            metrics.duration.observe(duration)
+            metrics.queries.observe(stats.sql_count)
+            metrics.sql_time += stats.sql_time
+            metrics.template_time += stats.template_time
+            metrics.context_time += stats.context_time
+            metrics.cache_hits += stats.cache_hits
+            metrics.cache_misses += stats.cache_misses
+            status = '%dxx' % (status // 100)
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    # Решение ограничителя частоты запросов (ratelimit.py): 'allowed' или причина отказа.
+    def ratelimit(self, group, result):
+        with self._lock:
+            self._ratelimits[group, result] = self._ratelimits.get((group, result), 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self._ratelimits = {}
+
+    # Текстовый формат Prometheus (text/plain; version=0.0.4).
+    def render(self):
+        with self._lock:
+            views = sorted(self._views.items())
+            pid = os.getpid()
+            lines = []
+
+            def histogram(name, help_text, getter):
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s histogram' % name)
+                for view, metrics in views:
+                    h = getter(metrics)
+                    labels = 'pid="%s",view="%s"' % (pid, _label(view))
+                    total = 0
+                    for bound, count in zip(h.buckets + ('+Inf',), h.counts):
+                        total += count
+                        lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, total))
+                    lines.append('%s_sum{%s} %s' % (name, labels, _number(h.sum)))
+                    lines.append('%s_count{%s} %d' % (name, labels, h.count))
+
+            def counter(name, help_text, getter):
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s counter' % name)
+                for view, metrics in views:
+                    lines.append('%s{pid="%s",view="%s"} %s' % (name, pid, _label(view), _number(getter(metrics))))
+
+            histogram('women_request_duration_seconds', 'Время обработки запроса', lambda m: m.duration)
+            histogram('women_request_sql_queries', 'Количество SQL-запросов на запрос', lambda m: m.queries)
+            counter('women_request_sql_seconds_total', 'Время выполнения SQL-запросов', lambda m: m.sql_time)
+            counter('women_request_template_seconds_total', 'Время отрисовки шаблонов',
+                    lambda m: m.template_time)
+            counter('women_request_context_seconds_total', 'Время DataMixin.get_user_context',
+                    lambda m: m.context_time)
+            counter('women_cache_hits_total', 'Попадания в кэш default', lambda m: m.cache_hits)
+            counter('women_cache_misses_total', 'Промахи кэша default', lambda m: m.cache_misses)
+
+            lines.append('# HELP women_requests_total Количество запросов по классу кода ответа')
+            lines.append('# TYPE women_requests_total counter')
+            for view, metrics in views:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append('women_requests_total{pid="%s",view="%s",status="%s"} %d'
+                                 % (pid, _label(view), status, count))
+
+            lines.append('# HELP women_ratelimit_total Решения ограничителя частоты запросов')
+            lines.append('# TYPE women_ratelimit_total counter')
+            for (group, result), count in sorted(self._ratelimits.items()):
+                lines.append('women_ratelimit_total{pid="%s",group="%s",result="%s"} %d'
+                             % (pid, _label(group), _label(result), count))
+        return '\n'.join(lines) + '\n'
+
+
+collector = MetricsCollector()
+
+
+# Страница метрик доступна только с адресов из INTERNAL_IPS,
+# для остальных ее как будто нет.
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        raise Http404()
+    return HttpResponse(collector.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,86 @@
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from coolsite.cache import request_stats
+
+from .metrics import RequestStats, collector
+
+
+# Учет SQL-запросов к каждой БД на время обработки запроса.
+def _wrap_connections(stats):
+    stack = ExitStack()
+    for conn in connections.all():
+        stack.enter_context(conn.execute_wrapper(stats.sql_wrapper))
+    return stack
+
+
+# Измерение производительности каждого запроса (см. metrics.py).
+#
+# SQL-запросы считаются через execute_wrapper на всех подключениях из DATABASES
+# (основная БД и реплики, см. routers.py), попадания и промахи
+# кэша - бэкендом coolsite.cache.TwoTierCache (контекстная переменная
+# request_stats), время отрисовки - от вызова process_template_response до
+# окончания отрисовки TemplateResponse (шаблоны функций представлений через
+# render() сюда не входят). Результат добавляется в заголовок Server-Timing
+# (настройка WOMEN_SERVER_TIMING) и в метрики процесса по имени маршрута.
+#
+# Middleware подключается первым в MIDDLEWARE, чтобы учитывать время остальных.
+# Работает и в синхронном (WSGI), и в асинхронном (ASGI) режиме.
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'WOMEN_SERVER_TIMING', True)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token, start = self._start(request)
+        try:
+            with _wrap_connections(stats):
+                response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        return self._finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats, token, start = self._start(request)
+        try:
+            with _wrap_connections(stats):
+                response = await self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        return self._finish(request, response, stats, start)
+
+    def _start(self, request):
+        stats = request._women_stats = RequestStats()
+        return stats, request_stats.set(stats), time.perf_counter()
+
+    def _finish(self, request, response, stats, start):
+        duration = time.perf_counter() - start
+        if self.server_timing:
+            response['Server-Timing'] = stats.server_timing(duration)
+
+        match = request.resolver_match
+        collector.observe(match.view_name if match else '<unresolved>', response.status_code, duration, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        stats = getattr(request, '_women_stats', None)
+        if stats is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                stats.template_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
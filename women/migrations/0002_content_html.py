@@ -0,0 +1,44 @@
+# Generated by Django 4.1.4 on 2026-10-18 10:15
+
+from django.db import migrations, models
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+
+# Заполняет новые поля у уже существующих статей. Формирование HTML
+# повторяет Women.render_content на момент миграции (анонс - 50 слов).
+def fill_content_html(apps, schema_editor):
+    Women = apps.get_model('women', 'Women')
+    db = schema_editor.connection.alias
+    posts = Women.objects.using(db).only('pk', 'content')
+    batch = []
+    for post in posts.iterator(chunk_size=500):
+        post.content_html = linebreaks(post.content, autoescape=True)
+        post.excerpt_html = Truncator(post.content_html).words(50, html=True, truncate=' …')
+        batch.append(post)
+        if len(batch) == 500:
+            Women.objects.using(db).bulk_update(batch, ['content_html', 'excerpt_html'])
+            batch = []
+    if batch:
+        Women.objects.using(db).bulk_update(batch, ['content_html', 'excerpt_html'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='women',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='HTML статьи'),
+        ),
+        migrations.AddField(
+            model_name='women',
+            name='excerpt_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Анонс статьи'),
+        ),
+        migrations.RunPython(fill_content_html, migrations.RunPython.noop),
+    ]
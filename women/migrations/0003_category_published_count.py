@@ -0,0 +1,30 @@
+# Generated by Django 4.1.4 on 2026-10-18 10:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# Начальное заполнение счетчиков опубликованных статей.
+def fill_published_count(apps, schema_editor):
+    Category = apps.get_model('women', 'Category')
+    Women = apps.get_model('women', 'Women')
+    published = Women.objects.filter(cat=OuterRef('pk'), is_published=True).order_by()\
+        .values('cat').annotate(total=Count('pk')).values('total')
+    Category.objects.update(published_count=Coalesce(Subquery(published), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0002_content_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='published_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Опубликовано статей'),
+        ),
+        migrations.RunPython(fill_published_count, migrations.RunPython.noop),
+    ]
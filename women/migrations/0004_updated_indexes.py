@@ -0,0 +1,21 @@
+# Generated by Django 4.1.4 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0003_category_published_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='women',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['time_update'], name='women_pub_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='women',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['cat', 'time_update'], name='women_cat_pub_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+# Полнотекстовый индекс FTS5 для поиска по статьям (см. women/search.py).
+# Создается только для SQLite, для других СУБД поиск использует обычный LIKE.
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS women_search "
+        "USING fts5(title, content, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO women_search (rowid, title, content) SELECT id, title, content FROM women_women"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS women_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0004_updated_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.4 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='women',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-time_create', 'title'], name='women_pub_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='women',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['cat', '-time_create', 'title'], name='women_cat_pub_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='women',
+            index=models.Index(fields=['-time_create'], name='women_created_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+
+# Полнотекстовый индекс без копии текста статей (см. women/search.py).
+# Таблица FTS5 с внешним содержимым (content='women_women') хранит только индекс,
+# заголовок и текст для highlight и snippet читаются из women_women.
+# Индекс обновляют триггеры, а не сигналы: он остается согласованным и при
+# массовых операциях, и при изменениях в обход ORM. Триггер обновления
+# срабатывает, только если изменились заголовок или текст статьи.
+TRIGGERS = (
+    "CREATE TRIGGER women_search_ai AFTER INSERT ON women_women BEGIN "
+    "INSERT INTO women_search (rowid, title, content) VALUES (new.id, new.title, new.content); "
+    "END",
+    "CREATE TRIGGER women_search_ad AFTER DELETE ON women_women BEGIN "
+    "INSERT INTO women_search (women_search, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "END",
+    "CREATE TRIGGER women_search_au AFTER UPDATE OF title, content ON women_women "
+    "WHEN old.title IS NOT new.title OR old.content IS NOT new.content BEGIN "
+    "INSERT INTO women_search (women_search, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO women_search (rowid, title, content) VALUES (new.id, new.title, new.content); "
+    "END",
+)
+
+
+def create_external_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS women_search')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE women_search "
+        "USING fts5(title, content, content='women_women', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    for sql in TRIGGERS:
+        schema_editor.execute(sql)
+    schema_editor.execute("INSERT INTO women_search (women_search) VALUES ('rebuild')")
+
+
+# Возврат к таблице из миграции 0005 с собственной копией текста.
+def drop_external_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in ('women_search_ai', 'women_search_ad', 'women_search_au'):
+        schema_editor.execute('DROP TRIGGER IF EXISTS %s' % name)
+    schema_editor.execute('DROP TABLE IF EXISTS women_search')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE women_search "
+        "USING fts5(title, content, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO women_search (rowid, title, content) SELECT id, title, content FROM women_women"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('women', '0006_created_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_external_index, drop_external_index),
+    ]
@@ -1,5 +1,116 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.urls import reverse
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+
+# Количество слов в анонсе статьи на странице списка.
+EXCERPT_WORDS = 50
+
+
+# Поля статьи, от которых зависит счетчик опубликованных статей в категории.
+COUNTER_FIELDS = {'cat', 'cat_id', 'is_published'}
+
+
+# Массовые изменения могут затронуть любые страницы и статьи,
+# поэтому сбрасывается весь кэш страниц и кэш статей.
+def _purge_caches():
+    from . import pagecache, postcache
+    pagecache.purge_all()
+    postcache.invalidate_all()
+
+
+# HTML статьи и анонс для списков из текста статьи (content_html и excerpt_html).
+# Текст экранируется, как при выводе в шаблоне с включенным autoescape.
+def render_html(content):
+    content_html = linebreaks(content, autoescape=True)
+    return content_html, Truncator(content_html).words(EXCERPT_WORDS, html=True, truncate=' …')
+
+
+# Набор запросов для статей. Массовые операции (update, bulk_create, bulk_update)
+# не вызывают save() и сигналы, поэтому после них счетчики затронутых
+# категорий пересчитываются, а кэш страниц и статей сбрасывается явно.
+class WomenQuerySet(models.QuerySet):
+
+    # Заново формирует HTML статей с указанными pk по их текущему content.
+    # Обычный QuerySet - чтобы не сбрасывать кэши повторно.
+    def _render_ids(self, ids):
+        posts = list(models.QuerySet(self.model, using=self.db).filter(pk__in=ids).only('pk', 'content'))
+        for post in posts:
+            post.render_content()
+        models.QuerySet(self.model, using=self.db).bulk_update(posts, ['content_html', 'excerpt_html'])
+
+    def update(self, **kwargs):
+        # Новый текст статьи: HTML формируется сразу и записывается тем же UPDATE.
+        # Если текст задан выражением (F, Concat), HTML формируется после обновления.
+        render = None
+        if 'content' in kwargs:
+            if isinstance(kwargs['content'], str):
+                kwargs['content_html'], kwargs['excerpt_html'] = render_html(kwargs['content'])
+            else:
+                render = list(self.values_list('pk', flat=True))
+
+        if COUNTER_FIELDS.isdisjoint(kwargs):
+            rows = super().update(**kwargs)
+            # Ни одна статья не изменилась - кэши остаются как есть.
+            if not rows:
+                return rows
+            if render:
+                self._render_ids(render)
+            _purge_caches()
+            return rows
+
+        # Запоминаем категории до изменения, а после него добавляем новую.
+        cat_ids = set(self.order_by().values_list('cat_id', flat=True).distinct())
+        rows = super().update(**kwargs)
+        if not rows:
+            return rows
+        if render:
+            self._render_ids(render)
+        cat = kwargs.get('cat_id', kwargs.get('cat'))
+        if cat is not None:
+            cat_ids.add(getattr(cat, 'pk', cat))
+        Category.objects.filter(pk__in=cat_ids).recount()
+        _purge_caches()
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if not objs:
+            return objs
+        for obj in objs:
+            obj.render_content()
+        objs = super().bulk_create(objs, *args, **kwargs)
+        Category.objects.filter(pk__in={obj.cat_id for obj in objs}).recount()
+        _purge_caches()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if not objs:
+            return 0
+        if 'content' in fields:
+            for obj in objs:
+                obj.render_content()
+            fields = list(fields) + [f for f in ('content_html', 'excerpt_html') if f not in fields]
+
+        if COUNTER_FIELDS.isdisjoint(fields):
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            if rows:
+                _purge_caches()
+            return rows
+
+        cat_ids = set(self.model.objects.filter(pk__in=[obj.pk for obj in objs])
+                      .values_list('cat_id', flat=True).distinct())
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if not rows:
+            return rows
+        cat_ids.update(obj.cat_id for obj in objs)
+        Category.objects.filter(pk__in=cat_ids).recount()
+        _purge_caches()
+        return rows
 
 
 # Таблица в БД называется по имени класса.
@@ -20,6 +131,13 @@ class Women(models.Model):
     # что поле может быть пустым
     content = models.TextField(blank=True, verbose_name='Текст статьи')
 
+    # Текст статьи, заранее преобразованный в HTML (как фильтр linebreaks),
+    # и короткий анонс для списков. Заполняются автоматически при сохранении,
+    # поэтому шаблонам не нужно обрабатывать текст на каждом запросе,
+    # а спискам - выбирать из БД весь content.
+    content_html = models.TextField(blank=True, editable=False, verbose_name='HTML статьи')
+    excerpt_html = models.TextField(blank=True, editable=False, verbose_name='Анонс статьи')
+
     # Хранит ссылку на изображение, ключ upload_to задает каталог,
     # в который будут загружаться изображения, '%' - текущий
     photo = models.ImageField(upload_to='photo/%Y/%m/%d/', verbose_name='Фото')
@@ -43,6 +161,9 @@ class Women(models.Model):
     # null=True - указывает что поле необязательное, разрешили принимать значение NULL
     cat = models.ForeignKey('Category', on_delete=models.PROTECT, verbose_name='Категория')
 
+    # Менеджер на основе собственного набора запросов (пересчитывает счетчики категорий).
+    objects = WomenQuerySet.as_manager()
+
     # Магический метод, определяет как будет отображаться экземпляр класса
     # при печати или выводе в приложении.
     def __str__(self):
@@ -56,6 +177,30 @@ class Women(models.Model):
     def get_absolute_url(self):
         return reverse('post', kwargs={'post_slug': self.slug})
 
+    # При загрузке из БД запоминаем категорию, признак публикации и slug,
+    # чтобы при сохранении понять, как изменился счетчик категории
+    # и какие страницы нужно сбросить из кэша (см. signals.py).
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {'cat_id', 'is_published', 'slug'}.issubset(field_names):
+            instance._loaded_state = (instance.cat_id, instance.is_published, instance.slug)
+        return instance
+
+    # Формирует content_html и excerpt_html из content.
+    def render_content(self):
+        self.content_html, self.excerpt_html = render_html(self.content)
+
+    # При каждом сохранении заново формируем HTML статьи.
+    # Если сохраняются только отдельные поля и среди них есть content,
+    # то добавляем к ним и сформированные поля.
+    def save(self, *args, **kwargs):
+        self.render_content()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'content_html', 'excerpt_html'}
+        super().save(*args, **kwargs)
+
     # Вложенный класс Meta, используется админ панелью
     # для настройки отображения модели Women.
     # Атрибут verbose_name отображает название модели (таблицы)
@@ -71,6 +216,43 @@ class Women(models.Model):
         verbose_name_plural = 'Известные женщины'
         ordering = ['-time_create', 'title']
 
+        # Частичные индексы по времени изменения опубликованных статей.
+        # По ним max(time_update) для проверки условных GET-запросов (conditional.py)
+        # находится одним поиском по индексу, без просмотра таблицы.
+        #
+        # Индексы в порядке сортировки списков (ordering плюс первичный ключ,
+        # который SQLite хранит в конце каждого индекса). Главная и страницы
+        # категорий выбирают опубликованные статьи прямо в нужном порядке
+        # и останавливаются после одной страницы, без сортировки во временном B-дереве.
+        # Последний индекс - для фильтра и сортировки по дате в админ-панели,
+        # где выводятся и неопубликованные статьи.
+        indexes = [
+            models.Index(fields=['time_update'], condition=Q(is_published=True),
+                         name='women_pub_updated_idx'),
+            models.Index(fields=['cat', 'time_update'], condition=Q(is_published=True),
+                         name='women_cat_pub_updated_idx'),
+            models.Index(fields=['-time_create', 'title'], condition=Q(is_published=True),
+                         name='women_pub_created_idx'),
+            models.Index(fields=['cat', '-time_create', 'title'], condition=Q(is_published=True),
+                         name='women_cat_pub_created_idx'),
+            models.Index(fields=['-time_create'], name='women_created_idx'),
+        ]
+
+
+class CategoryQuerySet(models.QuerySet):
+
+    # Пересчитывает счетчик опубликованных статей у выбранных категорий
+    # одним запросом UPDATE с подзапросом.
+    def recount(self):
+        published = Women.objects.filter(cat=OuterRef('pk'), is_published=True).order_by()\
+            .values('cat').annotate(total=Count('pk')).values('total')
+        rows = self.update(published_count=Coalesce(Subquery(published), 0))
+
+        # Счетчики изменились в обход сигналов - сбрасываем реестр категорий.
+        from .categories import registry
+        registry.invalidate()
+        return rows
+
 
 # Класс для таблицы с категориями (первичная модель)
 class Category(models.Model):
@@ -79,11 +261,26 @@ class Category(models.Model):
     name = models.CharField(max_length=100, db_index=True, verbose_name='Категория')
     slug = models.SlugField(max_length=255, unique=True, db_index=True, verbose_name='URL')
 
+    # Количество опубликованных статей в категории. Хранится в таблице,
+    # чтобы не выполнять GROUP BY по всем статьям при каждом выводе меню категорий.
+    # Поддерживается сигналами (signals.py) и методами WomenQuerySet,
+    # сверяется командой reconcile_counters.
+    published_count = models.PositiveIntegerField(default=0, editable=False,
+                                                  verbose_name='Опубликовано статей')
+
+    objects = CategoryQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
 
+    # URL берется из реестра категорий, где он вычислен заранее.
+    # Если категории в реестре нет или у нее уже другой slug, строим URL как обычно.
     def get_absolute_url(self):
+        from .categories import registry
+        record = registry.get_by_pk(self.pk)
+        if record is not None and record.slug == self.slug:
+            return record.url
         return reverse('category', kwargs={'cat_slug': self.slug})
 
     class Meta:
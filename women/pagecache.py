@@ -0,0 +1,168 @@
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .versions import aget_version, bump_version, get_version
+
+# Кэш страниц целиком для анонимных посетителей.
+#
+# Ключ страницы содержит версию общего оформления ('layout' - меню категорий)
+# и версию области страницы: 'home' (главная), 'cat:<slug>' (категория),
+# 'post:<slug>' (статья). При изменении статьи или категории увеличиваются
+# версии только затронутых областей (см. signals.py), поэтому страницы можно
+# хранить часами и при этом не показывать устаревшее содержимое.
+
+LAYOUT_KEY = 'women:page:layout'
+SCOPE_KEY = 'women:page:scope:%s'
+CHANGED_KEY = 'women:page:changed'
+
+# В ключ попадают только параметры, от которых зависит содержимое страницы,
+# чтобы произвольные параметры запроса не плодили записи в кэше.
+KEY_PARAMS = ('page', 'cursor')
+
+
+def _timeout():
+    return getattr(settings, 'WOMEN_PAGE_CACHE_TIMEOUT', 6 * 60 * 60)
+
+
+# Версии областей 'post:<slug>' создаются для каждой сохраненной статьи, поэтому
+# хранятся ограниченное время. Страницы истекают за то же время, так что
+# новая версия вместо истекшей не сбрасывает ничего, что еще хранится.
+def _scope_timeout():
+    return _timeout()
+
+
+def versions(scope):
+    return get_version(LAYOUT_KEY), get_version(SCOPE_KEY % scope, _scope_timeout())
+
+
+async def aversions(scope):
+    return await aget_version(LAYOUT_KEY), await aget_version(SCOPE_KEY % scope, _scope_timeout())
+
+
+def _page_key(request, scope, layout, scope_version):
+    params = '&'.join('%s=%s' % (name, request.GET.get(name, '')) for name in KEY_PARAMS)
+    url = hashlib.md5(('%s?%s' % (request.path, params)).encode()).hexdigest()
+    return 'women:page:%s:%s:%s:%s' % (layout, scope, scope_version, url)
+
+
+def page_key(request, scope):
+    return _page_key(request, scope, *versions(scope))
+
+
+async def apage_key(request, scope):
+    return _page_key(request, scope, *await aversions(scope))
+
+
+def _cached_response(cached):
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def _store(key, response):
+    if response.status_code == 200 and not response.cookies and not response.streaming:
+        cache.set(key, (response.content, response['Content-Type']), _timeout())
+    response['X-Page-Cache'] = 'miss'
+
+
+# Декоратор представления. scope - шаблон области страницы,
+# подставляются именованные параметры маршрута, например 'post:{post_slug}'.
+# Авторизованные пользователи видят в меню свое имя, поэтому для них
+# кэш не используется. Сохраняются только успешные ответы без cookies.
+# Для асинхронного представления возвращается асинхронная обертка.
+def anonymous_cache_page(scope):
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_cache_page(view, scope)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, scope.format(**kwargs))
+            cached = cache.get(key)
+            if cached is not None:
+                return _cached_response(cached)
+
+            response = view(request, *args, **kwargs)
+
+            # Ответы классов представлений отрисовываются позже, поэтому
+            # сохраняем их после отрисовки, как это делает cache_page.
+            if hasattr(response, 'render') and callable(response.render):
+                response.add_post_render_callback(lambda response: _store(key, response))
+            else:
+                _store(key, response)
+            return response
+        return wrapped
+    return decorator
+
+
+# Асинхронные представления возвращают уже отрисованный ответ.
+def _async_cache_page(view, scope):
+    from .utils import auser
+
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or (await auser(request)).is_authenticated:
+            return await view(request, *args, **kwargs)
+
+        key = await apage_key(request, scope.format(**kwargs))
+        cached = await cache.aget(key)
+        if cached is not None:
+            return _cached_response(cached)
+
+        response = await view(request, *args, **kwargs)
+        await sync_to_async(_store)(key, response)
+        return response
+    return wrapped
+
+
+# Время последнего сброса страниц (в секундах epoch) - Last-Modified страниц
+# списков (см. conditional.py). Если записи нет (кэш очищен), начинаем
+# с текущего времени: клиенты один раз получат страницу заново.
+def changed_at():
+    changed = cache.get(CHANGED_KEY)
+    if changed is None:
+        cache.add(CHANGED_KEY, time.time(), None)
+        changed = cache.get(CHANGED_KEY)
+    return changed
+
+
+async def achanged_at():
+    changed = await cache.aget(CHANGED_KEY)
+    if changed is None:
+        changed = await sync_to_async(changed_at)()
+    return changed
+
+
+def _mark_changed():
+    cache.set(CHANGED_KEY, time.time(), None)
+
+
+# Сброс кэша страниц. Время изменения, как и версии, записывается
+# сразу и еще раз после фиксации транзакции.
+
+def _changed():
+    _mark_changed()
+    transaction.on_commit(_mark_changed)
+
+
+def purge_scopes(*scopes):
+    for scope in scopes:
+        bump_version(SCOPE_KEY % scope, _scope_timeout())
+    _changed()
+
+
+# Меняется меню категорий или данные во многих областях сразу - сбрасываем все страницы.
+def purge_all():
+    bump_version(LAYOUT_KEY)
+    _changed()
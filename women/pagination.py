@@ -0,0 +1,222 @@
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+# Значения ключа, которые не умеет сериализовать json (даты, Decimal, UUID).
+# В отличие от DjangoJSONEncoder время сохраняется с микросекундами,
+# иначе записи с одинаковым до миллисекунды временем терялись бы между страницами.
+def _encode_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+# Ошибка разбора курсора. Наследуется от InvalidPage, чтобы представления
+# обрабатывали её так же, как и неверный номер страницы (ошибка 404).
+class InvalidCursor(InvalidPage):
+    pass
+
+
+# Пагинация по ключу (keyset / cursor pagination).
+# Вместо OFFSET/LIMIT запоминается ключ сортировки последней записи страницы,
+# а следующая страница выбирается условием "строго после этого ключа".
+# Поэтому глубокие страницы стоят столько же, сколько первая,
+# и не нужен COUNT(*) по всей таблице на каждый запрос.
+class KeysetPaginator:
+
+    # Сколько секунд хранится в кэше количество записей (cached_count).
+    count_timeout = 300
+
+    def __init__(self, object_list, per_page, ordering=None, count_timeout=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        if count_timeout is not None:
+            self.count_timeout = count_timeout
+
+        model = object_list.model
+        opts = model._meta
+
+        # Порядок берется из запроса, а если его нет - из Meta.ordering модели.
+        # В конец всегда добавляется первичный ключ, чтобы ключ сортировки был уникальным.
+        ordering = list(ordering or object_list.query.order_by or opts.ordering)
+        names = [o.lstrip('-') for o in ordering]
+        if 'pk' not in names and opts.pk.name not in names:
+            ordering.append(opts.pk.name)
+
+        # Список пар (поле модели, по убыванию ли сортировка).
+        self.fields = []
+        for o in ordering:
+            name = o.lstrip('-')
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+            self.fields.append((field, o.startswith('-')))
+
+    # Порядок сортировки для запроса. При движении назад он инвертируется.
+    def _ordering(self, backwards=False):
+        return [('-' if desc != backwards else '') + field.attname for field, desc in self.fields]
+
+    # Условие "строго после ключа values" в порядке сортировки:
+    # a <= x AND ((a < x) OR (a = x AND b > y) OR (a = x AND b = y AND id > z) ...)
+    # Первое условие избыточно, но по нему SQLite читает индекс сортировки
+    # как диапазон в нужном порядке, а не объединяет выборки по каждой ветке OR
+    # с последующей сортировкой.
+    def _seek(self, values, backwards=False):
+        condition = Q()
+        for i, (field, desc) in enumerate(self.fields):
+            lookup = 'lt' if desc != backwards else 'gt'
+            part = Q(**{'%s__%s' % (field.attname, lookup): values[i]})
+            for j, (prev_field, _) in enumerate(self.fields[:i]):
+                part &= Q(**{prev_field.attname: values[j]})
+            condition |= part
+        field, desc = self.fields[0]
+        bound = Q(**{'%s__%s' % (field.attname, 'lte' if desc != backwards else 'gte'): values[0]})
+        return bound & condition
+
+    def _key(self, obj):
+        return [getattr(obj, field.attname) for field, _ in self.fields]
+
+    # Курсор - это непрозрачная строка: направление и ключ записи в JSON,
+    # закодированные в base64 без символов, требующих экранирования в URL.
+    def encode_cursor(self, obj, backwards=False):
+        data = {'d': 'p' if backwards else 'n', 'k': self._key(obj)}
+        raw = json.dumps(data, default=_encode_value, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            data = json.loads(raw)
+            values = data['k']
+            if data['d'] not in ('n', 'p') or len(values) != len(self.fields):
+                raise ValueError
+            values = [field.to_python(v) for (field, _), v in zip(self.fields, values)]
+            # Целое вне 64-битного диапазона (например, подделанный id) запрос к БД
+            # не принял бы, и вместо ответа 404 была бы ошибка 500.
+            for (field, _), v in zip(self.fields, values):
+                if isinstance(v, int) and not -2 ** 63 <= v < 2 ** 63:
+                    raise ValueError
+                field.run_validators(v)
+        except (ValueError, TypeError, KeyError, ValidationError):
+            raise InvalidCursor('Неверный курсор страницы')
+        return values, data['d'] == 'p'
+
+    # Запрос страницы, следующей за курсором (или первой, если курсора нет).
+    # Выбирается на одну запись больше, чтобы узнать, есть ли следующая страница.
+    def _page_query(self, cursor):
+        if not cursor:
+            values, backwards = None, False
+        else:
+            values, backwards = self.decode_cursor(cursor)
+
+        qs = self.object_list
+        if values is not None:
+            qs = qs.filter(self._seek(values, backwards))
+        return qs.order_by(*self._ordering(backwards))[:self.per_page + 1], values, backwards
+
+    def page(self, cursor=None):
+        qs, values, backwards = self._page_query(cursor)
+        return self._make_page(list(qs), values, backwards)
+
+    # Асинхронный вариант page() для асинхронных представлений.
+    async def apage(self, cursor=None):
+        qs, values, backwards = self._page_query(cursor)
+        return self._make_page([obj async for obj in qs], values, backwards)
+
+    def _make_page(self, rows, values, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return KeysetPage(rows, self, has_next, has_previous)
+
+    # Количество записей: точный count(), который хранится в кэше count_timeout
+    # секунд и поэтому может отставать от таблицы на это время (шаблон выводит
+    # его со знаком "~"). Ключ строится по тексту SQL-запроса, поэтому у каждой
+    # категории свое значение.
+    def _count_key(self):
+        return 'women:count:' + hashlib.md5(str(self.object_list.query).encode()).hexdigest()
+
+    @cached_property
+    def cached_count(self):
+        key = self._count_key()
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, self.count_timeout)
+        return count
+
+    # Асинхронно вычисляет cached_count заранее, чтобы шаблон
+    # не выполнял запрос к БД внутри цикла событий.
+    async def aprefetch_count(self):
+        key = self._count_key()
+        count = await cache.aget(key)
+        if count is None:
+            count = await self.object_list.acount()
+            await cache.aset(key, count, self.count_timeout)
+        # cached_property хранит значение в __dict__ экземпляра.
+        self.__dict__['cached_count'] = count
+        return count
+
+
+# Страница пагинации по ключу. Ведет себя как последовательность записей,
+# как и обычный объект Page, но вместо номеров страниц содержит курсоры.
+class KeysetPage:
+
+    # Признак для шаблона, по которому выбирается вид блока пагинации.
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Keyset page of %s>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @cached_property
+    def next_cursor(self):
+        if self.has_next():
+            return self.paginator.encode_cursor(self.object_list[-1])
+
+    @cached_property
+    def previous_cursor(self):
+        if self.has_previous():
+            return self.paginator.encode_cursor(self.object_list[0], backwards=True)
+
+
+# Окно номеров страниц вокруг текущей (по on_each_side с каждой стороны).
+# Вычисляется по номеру страницы и их количеству, поэтому не зависит
+# от размера таблицы, в отличие от перебора paginator.page_range в шаблоне.
+def page_window(page, on_each_side=2):
+    first = max(page.number - on_each_side, 1)
+    last = min(page.number + on_each_side, page.paginator.num_pages)
+    return range(first, last + 1)
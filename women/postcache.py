@@ -0,0 +1,110 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Category, Women
+from .versions import aget_version, bump_version, get_version
+
+# Кэш статей для страницы статьи (ShowPost) с чтением через кэш.
+#
+# По slug в кэше лежит id статьи, по id - строка таблицы в виде кортежа
+# значений полей вместе с полями категории. Объект Women собирается из кортежа
+# без обращения к БД. Неизвестные slug тоже кэшируются (на короткое время),
+# поэтому перебор несуществующих адресов не нагружает БД.
+#
+# Ключи содержат общую версию кэша статей: массовые изменения (WomenQuerySet)
+# и изменения категорий увеличивают ее, а сохранение и удаление одной статьи
+# удаляют только ее ключи (см. signals.py).
+
+VERSION_KEY = 'women:post:version'
+SLUG_KEY = 'women:post:%s:slug:%s'
+PK_KEY = 'women:post:%s:pk:%s'
+
+# Поля статьи и категории в порядке хранения в кортеже.
+POST_FIELDS = ('id', 'title', 'slug', 'content', 'content_html', 'excerpt_html', 'photo',
+               'time_create', 'time_update', 'is_published', 'cat_id')
+CATEGORY_FIELDS = ('id', 'name', 'slug')
+
+# Значение для slug, которого нет в БД.
+NOT_FOUND = 0
+
+
+def _timeout():
+    return getattr(settings, 'WOMEN_POST_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _not_found_timeout():
+    return getattr(settings, 'WOMEN_POST_NOT_FOUND_TIMEOUT', 60)
+
+
+def _load_row_query(**lookup):
+    return Women.objects.filter(**lookup).values_list(*POST_FIELDS, *('cat__' + f for f in CATEGORY_FIELDS))
+
+
+def _load_row(**lookup):
+    return _load_row_query(**lookup).first()
+
+
+# Собирает статью с уже загруженной категорией из кортежа значений.
+def _build(row):
+    post = Women.from_db('default', POST_FIELDS, row[:len(POST_FIELDS)])
+    post.cat = Category.from_db('default', CATEGORY_FIELDS, row[len(POST_FIELDS):])
+    return post
+
+
+# Возвращает статью по slug (опубликованную или нет) или None, если ее нет.
+def get_post(slug):
+    version = get_version(VERSION_KEY)
+    pk = cache.get(SLUG_KEY % (version, slug))
+    if pk == NOT_FOUND:
+        return None
+
+    row = cache.get(PK_KEY % (version, pk)) if pk is not None else None
+    if row is None:
+        row = _load_row(slug=slug)
+        if row is None:
+            cache.set(SLUG_KEY % (version, slug), NOT_FOUND, _not_found_timeout())
+            return None
+        cache.set_many({SLUG_KEY % (version, slug): row[0], PK_KEY % (version, row[0]): row}, _timeout())
+    return _build(row)
+
+
+# Асинхронный вариант get_post: при попадании в кэш обходится без потоков,
+# при промахе строка читается асинхронным ORM.
+async def aget_post(slug):
+    version = await aget_version(VERSION_KEY)
+    pk = await cache.aget(SLUG_KEY % (version, slug))
+    if pk == NOT_FOUND:
+        return None
+
+    row = await cache.aget(PK_KEY % (version, pk)) if pk is not None else None
+    if row is None:
+        row = await _load_row_query(slug=slug).afirst()
+        if row is None:
+            await cache.aset(SLUG_KEY % (version, slug), NOT_FOUND, _not_found_timeout())
+            return None
+        await sync_to_async(cache.set_many)({SLUG_KEY % (version, slug): row[0],
+                                             PK_KEY % (version, row[0]): row}, _timeout())
+    return _build(row)
+
+
+def _delete(pk, slugs):
+    version = get_version(VERSION_KEY)
+    keys = [SLUG_KEY % (version, slug) for slug in slugs]
+    if pk is not None:
+        keys.append(PK_KEY % (version, pk))
+    cache.delete_many(keys)
+
+
+# Удаляет из кэша статью и ее адреса (прежний и новый slug). Удаление
+# повторяется после фиксации транзакции, иначе параллельный запрос мог бы
+# успеть положить в кэш еще не зафиксированное состояние (как в versions.py).
+def invalidate_post(pk, *slugs):
+    _delete(pk, slugs)
+    transaction.on_commit(lambda: _delete(pk, slugs))
+
+
+# Сбрасывает кэш всех статей.
+def invalidate_all():
+    bump_version(VERSION_KEY)
@@ -0,0 +1,192 @@
+import hashlib
+import ipaddress
+import math
+import threading
+import time
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .metrics import collector
+
+# Ограничение частоты запросов для представлений, которые вычисляют хэш пароля
+# (вход и регистрация): PBKDF2 занимает процессор на сотни миллисекунд, и поток
+# подбора паролей занял бы все рабочие процессы сервера.
+#
+# Настройка для каждого представления - WOMEN_RATELIMITS[группа]:
+#   'ip': '20/m'        - не больше 20 запросов в минуту с одного адреса
+#                         (адреса IPv6 считаются по сетям /64),
+#   'username_ip': '5/m' - не больше 5 попыток в минуту для одного логина
+#                         с одного адреса: запросы с чужих адресов не блокируют
+#                         этот счетчик владельцу логина,
+#   'username': '30/h'  - не больше 30 попыток в час для одного логина со всех
+#                         адресов вместе: ограничивает подбор пароля к одному
+#                         логину с множества адресов; порог выше, чем у пары
+#                         логин-адрес, чтобы чужие попытки реже мешали владельцу,
+#   'concurrency': 2    - не больше 2 одновременно обрабатываемых запросов
+#                         в процессе: подбор с множества адресов не займет
+#                         все потоки, и остальные страницы сайта не замедлятся.
+#
+# Счетчики хранятся в общем кэше и изменяются атомарным cache.incr. Окно
+# скользящее: количество запросов оценивается как сумма счетчика текущего
+# интервала и доли счетчика предыдущего. Лишний запрос получает ответ 429
+# с заголовком Retry-After до вызова представления, то есть до вычисления хэша,
+# и ничего не записывает в кэш. Ограничиваются только методы из 'methods'
+# (по умолчанию POST), страница с формой открывается без ограничений.
+# Решения учитываются в метрике women_ratelimit_total (/metrics/).
+#
+# Адрес клиента берется из REMOTE_ADDR. Если сайт работает за обратным прокси
+# (nginx), его адреса или сети перечисляются в WOMEN_TRUSTED_PROXIES: для запросов
+# от них адрес клиента - последний адрес в X-Forwarded-For, не принадлежащий
+# доверенным прокси. Заголовок от остальных клиентов не учитывается, иначе
+# ограничение обходилось бы подстановкой случайных адресов.
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+# '5/m' -> (5, 60).
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period]
+
+
+@lru_cache(maxsize=None)
+def _trusted_networks(proxies):
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+
+def _is_trusted(ip):
+    networks = _trusted_networks(tuple(getattr(settings, 'WOMEN_TRUSTED_PROXIES', ())))
+    return any(ip in network for network in networks)
+
+
+def _parse_ip(address):
+    try:
+        return ipaddress.ip_address(address.strip())
+    except ValueError:
+        return None
+
+
+def client_ip(request):
+    address = request.META.get('REMOTE_ADDR', '')
+    ip = _parse_ip(address)
+    if ip is None:
+        return address
+    # Запрос от доверенного прокси: идем по X-Forwarded-For справа налево,
+    # пропуская адреса прокси. Адрес левее первого недоверенного мог подставить клиент.
+    if _is_trusted(ip):
+        for forwarded in reversed(request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')):
+            forwarded_ip = _parse_ip(forwarded)
+            if forwarded_ip is None:
+                break
+            ip = forwarded_ip
+            if not _is_trusted(ip):
+                break
+    if ip.version == 6:
+        return str(ipaddress.ip_network('%s/64' % ip, strict=False).network_address)
+    return str(ip)
+
+
+def _values(request, kind):
+    if kind == 'ip':
+        return client_ip(request)
+    if kind in ('username', 'username_ip'):
+        username = request.POST.get('username', '').strip().lower()
+        if not username:
+            return None
+        return username if kind == 'username' else '%s@%s' % (username, client_ip(request))
+    raise ValueError('Неизвестный ключ ограничения: %s' % kind)
+
+
+def _key(group, kind, value, window):
+    digest = hashlib.sha1(value.encode()).hexdigest()[:20]
+    return 'rl:%s:%s:%s:%d' % (group, kind, digest, window)
+
+
+# Проверяет лимит и учитывает запрос. Возвращает None, если запрос разрешен,
+# иначе через сколько секунд можно повторить.
+def hit(group, kind, value, rate):
+    limit, period = parse_rate(rate)
+    now = time.time()
+    window = int(now // period)
+    elapsed = now - window * period
+    current_key = _key(group, kind, value, window)
+    counts = cache.get_many([_key(group, kind, value, window - 1), current_key])
+    previous = counts.get(_key(group, kind, value, window - 1), 0)
+    current = counts.get(current_key, 0)
+
+    if previous * (1 - elapsed / period) + current < limit:
+        try:
+            current = cache.incr(current_key)
+        except ValueError:
+            if not cache.add(current_key, 1, period * 2):
+                current = cache.incr(current_key)
+            else:
+                current = 1
+        # Одновременные запросы могли обойти проверку: решает атомарный счетчик.
+        if previous * (1 - elapsed / period) + current <= limit:
+            return None
+
+    # Когда доля предыдущего интервала уменьшится настолько, что запрос пройдет.
+    if current < limit and previous:
+        wait = period * (1 - (limit - current) / previous) - elapsed
+    else:
+        wait = period - elapsed
+    return max(1, math.ceil(wait))
+
+
+def _semaphore(group, size):
+    with _semaphores_lock:
+        semaphore = _semaphores.get(group)
+        if semaphore is None or semaphore.size != size:
+            semaphore = _semaphores[group] = threading.BoundedSemaphore(size)
+            semaphore.size = size
+        return semaphore
+
+
+def _too_many(group, reason, retry_after):
+    collector.ratelimit(group, reason)
+    response = HttpResponse('Слишком много попыток. Повторите позже.', status=429,
+                            content_type='text/plain; charset=utf-8')
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+# Декоратор представления. group - имя настройки в WOMEN_RATELIMITS.
+# Пример: path('login/', ratelimit('login')(LoginUserForm.as_view()), name='login').
+def ratelimit(group, methods=('POST',)):
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            config = getattr(settings, 'WOMEN_RATELIMITS', {}).get(group)
+            if not config or request.method not in methods:
+                return view(request, *args, **kwargs)
+
+            for kind in ('ip', 'username_ip', 'username'):
+                rate = config.get(kind)
+                value = rate and _values(request, kind)
+                if value:
+                    retry_after = hit(group, kind, value, rate)
+                    if retry_after is not None:
+                        return _too_many(group, kind, retry_after)
+
+            concurrency = config.get('concurrency')
+            if not concurrency:
+                collector.ratelimit(group, 'allowed')
+                return view(request, *args, **kwargs)
+            semaphore = _semaphore(group, concurrency)
+            if not semaphore.acquire(blocking=False):
+                return _too_many(group, 'concurrency', 1)
+            try:
+                collector.ratelimit(group, 'allowed')
+                return view(request, *args, **kwargs)
+            finally:
+                semaphore.release()
+        return wrapped
+    return decorator
@@ -0,0 +1,175 @@
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import Resolver404, resolve
+
+# Чтение публичных страниц с реплик БД.
+#
+# Реплики - копии основной БД (в настройках WOMEN_DB_REPLICAS), которые
+# обновляет команда sync_replicas. Запросы на чтение моделей приложения women
+# из публичных представлений (помеченных декоратором replica_reads) и их шаблонных
+# тегов отправляются на одну из реплик. Запись, сессии, пользователи
+# и админ-панель всегда работают с основной БД.
+#
+# Реплика используется, только если она не отстает от основной БД больше чем
+# на WOMEN_REPLICA_MAX_LAG секунд: время последней записи в модели women
+# и время снимка каждой реплики хранятся в общем кэше. Иначе чтение идет
+# с основной БД. При нулевом допуске (по умолчанию) реплики отдают только
+# актуальные данные, поэтому кэш страниц не сохранит устаревшую страницу.
+#
+# После записи пользователь на WOMEN_REPLICA_PIN_SECONDS секунд закрепляется
+# за основной БД (cookie), чтобы сразу видеть свои изменения.
+#
+# Команда sync_replicas подменяет файл реплики, а открытое соединение SQLite
+# продолжает читать прежний файл. Поэтому у реплик должен быть CONN_MAX_AGE = 0:
+# рабочие процессы открывают соединение на каждый запрос и видят новый снимок
+# со следующего запроса. Это проверяет проверка check_replica_connections.
+
+PRIMARY = 'default'
+APP_LABEL = 'women'
+
+WRITTEN_KEY = 'women:db:written'
+SYNCED_KEY = 'women:db:synced:%s'
+PIN_COOKIE = 'women_primary'
+
+# Состояние текущего запроса: {'db': True | псевдоним БД, 'wrote': bool}.
+# Изменяемый словарь, а не значения контекстной переменной, потому что запросы
+# к БД из асинхронных представлений выполняются в sync_to_async с копией контекста.
+_request = contextvars.ContextVar('women_replica_request', default=None)
+
+
+def replicas():
+    return getattr(settings, 'WOMEN_DB_REPLICAS', [])
+
+
+@checks.register()
+def check_replica_connections(app_configs, **kwargs):
+    return [
+        checks.Error('У реплики %s должен быть CONN_MAX_AGE = 0' % alias,
+                     hint='Постоянное соединение продолжит читать файл, замененный командой sync_replicas.',
+                     obj=alias, id='women.E001')
+        for alias in replicas() if settings.DATABASES[alias].get('CONN_MAX_AGE', 0) != 0
+    ]
+
+
+# Декоратор представления: его запросы на чтение можно выполнять на реплике.
+def replica_reads(view):
+    view.replica_reads = True
+    return view
+
+
+def _now_written():
+    cache.set(WRITTEN_KEY, time.time(), None)
+
+
+# Отмечает запись в модели women. Время отмечается сразу и еще раз после
+# фиксации транзакции: снимок реплики, сделанный раньше фиксации, ее не содержит.
+# Внутри транзакции время отмечается один раз, а не при каждой записи:
+# массовые вставки обращаются к маршрутизатору для каждого объекта.
+def mark_written(using=PRIMARY):
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block:
+        if any(func is _now_written for _, func in connection.run_on_commit):
+            return
+        _now_written()
+        connection.on_commit(_now_written)
+    else:
+        _now_written()
+
+
+def mark_synced(alias, snapshot_time):
+    cache.set(SYNCED_KEY % alias, snapshot_time, None)
+
+
+# Отставание реплик от основной БД (в секундах, None - реплика еще не синхронизирована).
+def replica_lag():
+    written = cache.get(WRITTEN_KEY) or 0
+    lag = {}
+    for alias in replicas():
+        synced = cache.get(SYNCED_KEY % alias)
+        lag[alias] = None if synced is None else max(written - synced, 0)
+    return lag
+
+
+def _choose_replica():
+    max_lag = getattr(settings, 'WOMEN_REPLICA_MAX_LAG', 0)
+    fresh = [alias for alias, lag in replica_lag().items() if lag is not None and lag <= max_lag]
+    return random.choice(fresh) if fresh else PRIMARY
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _request.get()
+        if state is None or state['db'] is None or model._meta.app_label != APP_LABEL:
+            return None
+        # Реплика выбирается один раз при первом чтении в запросе.
+        if state['db'] is True:
+            state['db'] = _choose_replica()
+        return state['db']
+
+    # Без реплик отмечать запись и закреплять пользователя за основной БД незачем:
+    # иначе каждая запись обращалась бы к кэшу, а ответ получал бы cookie.
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == APP_LABEL and replicas():
+            state = _request.get()
+            if state is not None:
+                state['wrote'] = True
+            mark_written()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # Реплики - копии основной БД, миграции применяются только к ней.
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+# Включает чтение с реплики для безопасных запросов к помеченным представлениям
+# (если пользователь не закреплен за основной БД) и закрепляет пользователя
+# после записи. Работает и в синхронном, и в асинхронном режиме.
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _use_replica(self, request):
+        if not replicas() or request.method not in ('GET', 'HEAD') or PIN_COOKIE in request.COOKIES:
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return getattr(match.func, 'replica_reads', False)
+
+    def _start(self, request):
+        return _request.set({'db': True if self._use_replica(request) else None, 'wrote': False})
+
+    def _finish(self, token, response):
+        if _request.get()['wrote']:
+            response.set_cookie(PIN_COOKIE, '1', max_age=getattr(settings, 'WOMEN_REPLICA_PIN_SECONDS', 30),
+                                httponly=True, samesite='Lax')
+        _request.reset(token)
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self._start(request)
+        return self._finish(token, self.get_response(request))
+
+    async def __acall__(self, request):
+        token = self._start(request)
+        return self._finish(token, await self.get_response(request))
@@ -0,0 +1,100 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Women
+
+# Полнотекстовый поиск по статьям на основе SQLite FTS5.
+#
+# Виртуальная таблица women_search с внешним содержимым (content='women_women')
+# хранит только индекс заголовка и текста статей, rowid в ней совпадает с id статьи.
+# Таблица создается миграцией 0007_search_external_content, обновляется триггерами
+# на women_women при любом изменении заголовка или текста, включая массовые
+# операции, и полностью перестраивается командой rebuild_search_index.
+# Индекс используется публичной страницей /search/ и поиском в админ-панели.
+
+TABLE = 'women_search'
+
+# Вес заголовка в ранжировании bm25 больше веса текста.
+RANK = 'bm25(%s, 10.0, 1.0)' % TABLE
+
+# Служебные символы для выделения найденных слов. Текст статьи экранируется
+# уже после выделения, а затем символы заменяются на теги <mark>.
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+# Преобразует строку пользователя в запрос FTS5: каждое слово берется
+# в кавычки (чтобы операторы и спецсимволы FTS5 не влияли на разбор),
+# последнее слово ищется как префикс.
+def build_match(query):
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = ['"%s"' % w for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _highlight(text):
+    return mark_safe(escape(text).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'))
+
+
+# SQL подзапрос, возвращающий id статей, подходящих под запрос (для админ-панели).
+def matching_ids_sql():
+    return 'SELECT rowid FROM %s WHERE %s MATCH %%s' % (TABLE, TABLE)
+
+
+# Результаты поиска опубликованных статей в порядке релевантности.
+# Объект ведет себя как последовательность (count() и срезы),
+# поэтому его можно передать в стандартный Paginator.
+# Из БД выбирается только запрошенная страница результатов.
+class SearchResults:
+
+    def __init__(self, query):
+        self.query = query
+        self.match = build_match(query)
+
+    def count(self):
+        if not self.match:
+            return 0
+        with connection.cursor() as c:
+            c.execute('SELECT count(*) FROM {t} JOIN women_women w ON w.id = {t}.rowid '
+                      'WHERE {t} MATCH %s AND w.is_published'.format(t=TABLE), [self.match])
+            return c.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        if not self.match:
+            return []
+        start, stop = item.start or 0, item.stop
+        with connection.cursor() as c:
+            c.execute(
+                'SELECT {t}.rowid, highlight({t}, 0, %s, %s), snippet({t}, 1, %s, %s, %s, 24) '
+                'FROM {t} JOIN women_women w ON w.id = {t}.rowid '
+                'WHERE {t} MATCH %s AND w.is_published '
+                'ORDER BY {rank} LIMIT %s OFFSET %s'.format(t=TABLE, rank=RANK),
+                [_MARK_START, _MARK_END, _MARK_START, _MARK_END, '…', self.match,
+                 -1 if stop is None else stop - start, start])
+            rows = c.fetchall()
+
+        # Статьи выбираются одним запросом по id, затем упорядочиваются по релевантности.
+        posts = Women.objects.filter(pk__in=[r[0] for r in rows]).select_related('cat')\
+            .defer('content', 'content_html').in_bulk()
+        results = []
+        for pk, title, snippet in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.title_html = _highlight(title)
+                post.snippet_html = _highlight(snippet)
+                results.append(post)
+        return results
@@ -0,0 +1,96 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.middleware import SessionMiddleware as BaseSessionMiddleware
+from django.utils.cache import patch_cache_control
+
+# Сессии, которые не пишут в БД при чтении страниц.
+#
+# SessionStore хранит сессию в кэше default (первый уровень TwoTierCache -
+# память процесса) вместе со временем ее истечения и читает из таблицы
+# django_session только при промахе кэша. Запись в БД происходит при изменении
+# сессии (вход, выход) и при продлении срока: срок сессии продлевается
+# не на каждом запросе, а не чаще раза в WOMEN_SESSION_REFRESH_INTERVAL секунд -
+# когда с последнего продления прошло больше этого времени. Остальные запросы
+# авторизованного пользователя не обращаются к django_session вообще.
+#
+# SessionMiddleware не добавляет Vary: Cookie к ответам публичных страниц
+# (представления, отмеченные public_page) на GET-запросы без cookie сессии:
+# такие ответы одинаковы для всех анонимных посетителей и могут храниться
+# в общих кэшах. Ответы публичных страниц с cookie сессии помечаются
+# Cache-Control: private. Кэширующий прокси перед сайтом должен
+# пропускать мимо кэша запросы с cookie сессии (SESSION_COOKIE_NAME).
+#
+# Настройка в settings:
+#     SESSION_ENGINE = 'women.sessions'
+#     MIDDLEWARE: 'women.sessions.SessionMiddleware' вместо
+#                 'django.contrib.sessions.middleware.SessionMiddleware'
+
+KEY_PREFIX = 'women.sessions.'
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    # В кэше хранится пара (данные, время истечения в секундах).
+    # Возвращается копия данных: изменения сессии в запросе попадают
+    # в кэш только при сохранении.
+    def load(self):
+        try:
+            cached = self._cache.get(self.cache_key)
+        except Exception:
+            cached = None
+
+        if cached is None:
+            s = self._get_session_from_db()
+            if not s:
+                return {}
+            cached = (self.decode(s.session_data), s.expire_date.timestamp())
+            self._cache.set(self.cache_key, cached, self.get_expiry_age(expiry=s.expire_date))
+
+        data, expires = cached
+        if self._needs_refresh(data, expires):
+            # Middleware сохранит сессию и обновит срок cookie.
+            self.modified = True
+        return dict(data)
+
+    # Срок продлевается только у сессий со сроком по умолчанию (без set_expiry).
+    def _needs_refresh(self, data, expires):
+        if not data or '_session_expiry' in data or settings.SESSION_EXPIRE_AT_BROWSER_CLOSE:
+            return False
+        refreshed = expires - settings.SESSION_COOKIE_AGE
+        return time.time() - refreshed > getattr(settings, 'WOMEN_SESSION_REFRESH_INTERVAL', 24 * 60 * 60)
+
+    def save(self, must_create=False):
+        super(CachedDBStore, self).save(must_create)
+        age = self.get_expiry_age()
+        self._cache.set(self.cache_key, (dict(self._session), time.time() + age), age)
+
+
+# Отмечает представление как публичную страницу (см. SessionMiddleware).
+def public_page(view):
+    view.public_page = True
+    return view
+
+
+class SessionMiddleware(BaseSessionMiddleware):
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._women_public_page = getattr(view_func, 'public_page', False)
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is None or not getattr(request, '_women_public_page', False) \
+                or request.method not in ('GET', 'HEAD'):
+            return super().process_response(request, response)
+
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            # Сессии нет и не появилось: ответ не зависит от cookie.
+            if not session.modified and session.is_empty():
+                session.accessed = False
+            return super().process_response(request, response)
+
+        response = super().process_response(request, response)
+        patch_cache_control(response, private=True)
+        return response
@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import pagecache, postcache, tasks
+from .categories import registry
+from .jobs import enqueue
+from .models import Category, Women
+
+
+# Изменяет счетчик опубликованных статей категории на delta
+# выражением F, чтобы не было гонки между одновременными запросами.
+def _shift_count(cat_id, delta):
+    Category.objects.filter(pk=cat_id).update(published_count=F('published_count') + delta)
+
+
+# Переносит статью между счетчиками категорий при изменении категории
+# или признака публикации. Возвращает True, если у какой-то категории
+# счетчик перешел через ноль (категория появилась в меню или исчезла из него).
+def _update_counts(old, new):
+    if old is not None and old[:2] == new[:2]:
+        return False
+    expected = {}
+    if old is not None and old[1]:
+        _shift_count(old[0], -1)
+        expected[old[0]] = 0
+    if new[1]:
+        _shift_count(new[0], 1)
+        expected[new[0]] = 1
+    if not expected:
+        return False
+    counts = Category.objects.filter(pk__in=expected).values_list('pk', 'published_count')
+    return any(expected[pk] == count for pk, count in counts)
+
+
+def _category_scope(cat_id):
+    record = registry.get_by_pk(cat_id)
+    return 'cat:%s' % record.slug if record else None
+
+
+# Сбрасывает страницы, на которых выводится статья: главную,
+# страницы прежней и новой категории, прежний и новый адрес статьи.
+def _purge_pages(states, layout_changed):
+    if layout_changed:
+        pagecache.purge_all()
+        return
+    scopes = {'home'}
+    for cat_id, is_published, slug in states:
+        scopes.add(_category_scope(cat_id))
+        scopes.add('post:%s' % slug)
+    scopes.discard(None)
+    pagecache.purge_scopes(*scopes)
+
+
+# Перед сохранением определяем прежнее состояние статьи. Обычно оно
+# уже запомнено при загрузке из БД (Women.from_db), иначе читаем его запросом.
+@receiver(pre_save, sender=Women)
+def remember_state(sender, instance, raw, **kwargs):
+    if raw or hasattr(instance, '_loaded_state'):
+        return
+    if instance._state.adding or instance.pk is None:
+        instance._loaded_state = None
+    else:
+        instance._loaded_state = Women.objects.filter(pk=instance.pk)\
+            .values_list('cat_id', 'is_published', 'slug').first()
+
+
+# После сохранения обновляем счетчики категорий и сбрасываем кэш затронутых страниц.
+@receiver(post_save, sender=Women)
+def women_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, '_loaded_state', None)
+    new = (instance.cat_id, instance.is_published, instance.slug)
+    layout_changed = _update_counts(old, new)
+    _purge_pages([s for s in (old, new) if s is not None], layout_changed)
+    postcache.invalidate_post(instance.pk, *{s[2] for s in (old, new) if s is not None})
+    instance._loaded_state = new
+
+    # Производные изображения создает фоновая задача после фиксации транзакции.
+    # Задача для того же фото ставится в очередь один раз.
+    if instance.photo:
+        name = instance.photo.name
+        transaction.on_commit(lambda: enqueue(tasks.build_photo_renditions, name, key='renditions:%s' % name))
+
+
+@receiver(post_delete, sender=Women)
+def women_deleted(sender, instance, **kwargs):
+    state = (instance.cat_id, instance.is_published, instance.slug)
+    layout_changed = _update_counts(state, (instance.cat_id, False, instance.slug))
+    _purge_pages([state], layout_changed)
+    postcache.invalidate_post(instance.pk, instance.slug)
+
+
+# Изменение категории меняет меню на всех страницах,
+# а название и slug категории хранятся в кэше статей вместе со статьей.
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, raw=False, **kwargs):
+    pagecache.purge_all()
+    postcache.invalidate_all()
+
+
+# Любое изменение категории или статьи (количество статей в категории)
+# делает недействительным реестр категорий в памяти процессов.
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Women)
+@receiver(post_delete, sender=Women)
+def invalidate_categories(sender, raw=False, **kwargs):
+    registry.invalidate()
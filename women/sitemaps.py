@@ -0,0 +1,112 @@
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import F, Max
+from django.http import Http404
+from django.urls import reverse
+from django.views.decorators.http import condition
+
+from .categories import registry
+from .conditional import list_modified
+from .models import Women
+from .streaming import streaming_response
+
+# Карта сайта (sitemap.xml) для поисковых роботов.
+#
+# /sitemap.xml - индекс: раздел со страницами сайта (главная и категории)
+# и разделы статей, в каждом не больше WOMEN_SITEMAP_SIZE адресов (протокол
+# допускает 50 000). Статьи делятся на разделы по диапазонам первичного ключа:
+# раздел N содержит статьи с id от N * size до (N + 1) * size - 1, поэтому
+# раздел выбирается поиском по первичному ключу без OFFSET.
+#
+# Разделы формируются потоком: статьи читаются из БД порциями через iterator(),
+# и память не зависит от количества статей. Last-Modified - время последнего
+# изменения статей раздела, повторный запрос без изменений получает ответ 304.
+
+CONTENT_TYPE = 'application/xml; charset=utf-8'
+
+# Сколько статей читается из БД за раз и выводится одной частью ответа.
+CHUNK_SIZE = 2000
+
+
+def _size():
+    return getattr(settings, 'WOMEN_SITEMAP_SIZE', 50000)
+
+
+def _section_posts(section):
+    size = _size()
+    return Women.objects.filter(is_published=True, pk__gte=section * size, pk__lt=(section + 1) * size)
+
+
+# Индекс и раздел страниц (на главной - последние статьи) меняются вместе со статьями.
+def _index_modified(request):
+    return list_modified(Women.objects.filter(is_published=True))
+
+
+def _section_modified(request, section):
+    return list_modified(_section_posts(section))
+
+
+def _lastmod(value):
+    return '<lastmod>%s</lastmod>' % value.isoformat(timespec='seconds')
+
+
+def _urlset(urls):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n' \
+          '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    yield from urls
+    yield '</urlset>\n'
+
+
+@condition(last_modified_func=_index_modified)
+def sitemap_index(request):
+    base = request.build_absolute_uri('/')[:-1]
+    prefix, suffix = (base + reverse('sitemap_posts', kwargs={'section': 0})).rsplit('0', 1)
+
+    # Время последнего изменения каждого раздела - одним запросом с группировкой.
+    sections = Women.objects.filter(is_published=True).order_by()\
+        .values(section=F('pk') / _size()).annotate(last=Max('time_update')).order_by('section')
+
+    def chunks():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n' \
+              '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        yield '<sitemap><loc>%s%s</loc></sitemap>\n' % (base, reverse('sitemap_pages'))
+        for row in sections.iterator(chunk_size=CHUNK_SIZE):
+            yield '<sitemap><loc>%s%d%s</loc>%s</sitemap>\n' % (prefix, row['section'], suffix, _lastmod(row['last']))
+        yield '</sitemapindex>\n'
+
+    return streaming_response(request, chunks(), CONTENT_TYPE)
+
+
+# Главная страница и страницы категорий, в которых есть опубликованные статьи.
+@condition(last_modified_func=_index_modified)
+def sitemap_pages(request):
+    base = request.build_absolute_uri('/')[:-1]
+    urls = [base + reverse('home')]
+    urls += [base + cat.url for cat in registry.all() if cat.count]
+    return streaming_response(request, _urlset('<url><loc>%s</loc></url>\n' % escape(url) for url in urls),
+                              CONTENT_TYPE)
+
+
+@condition(last_modified_func=_section_modified)
+def sitemap_posts(request, section):
+    if not _section_posts(section).exists():
+        raise Http404()
+
+    # Адрес статьи - шаблон с подставленным slug: reverse() для каждой статьи
+    # занимал бы больше времени, чем чтение из БД.
+    template = request.build_absolute_uri(reverse('post', kwargs={'post_slug': 'slug'}))
+    prefix, suffix = template.rsplit('slug', 1)
+    rows = _section_posts(section).order_by('pk').values_list('slug', 'time_update')\
+        .iterator(chunk_size=CHUNK_SIZE)
+
+    def urls():
+        chunk = []
+        for slug, time_update in rows:
+            chunk.append('<url><loc>%s%s%s</loc>%s</url>\n' % (prefix, slug, suffix, _lastmod(time_update)))
+            if len(chunk) >= CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk)
+
+    return streaming_response(request, _urlset(urls()), CONTENT_TYPE)
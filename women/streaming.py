@@ -0,0 +1,59 @@
+import contextvars
+import tempfile
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+
+# Потоковые ответы, тело которых читается из БД по мере отправки (sitemaps.py, feeds.py).
+#
+# Под WSGI тело ответа перебирается в потоке запроса и отправляется по частям.
+# Под ASGI Django 4.1 перебирает тело StreamingHttpResponse прямо в цикле
+# событий: запросы к БД там запрещены, а ожидание другого потока остановило бы
+# все запросы процесса. Поэтому под ASGI тело формируется целиком еще в потоке
+# представления (синхронные представления выполняются через sync_to_async)
+# во временный файл, который до SPOOL_SIZE байт хранится в памяти, а дальше
+# на диске. Цикл событий только читает готовый файл, память не растет.
+#
+# Под WSGI тело перебирается уже после выхода из промежуточных слоев, когда
+# ReplicaMiddleware сбросил состояние запроса. Поэтому перебор выполняется
+# в копии контекста представления: запросы тела идут на ту же реплику
+# (routers.py). Статистика запроса (PerformanceMiddleware) к этому моменту
+# уже записана, и заголовок Server-Timing отправлен, так что запросы тела
+# в ней не учитываются.
+
+SPOOL_SIZE = 1024 * 1024
+
+
+def _spooled(chunks):
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    for chunk in chunks:
+        body.write(chunk.encode())
+    body.seek(0)
+    return body
+
+
+# Перебирает chunks в контексте, скопированном при вызове (а не при первом next).
+def _in_context(chunks):
+    context = contextvars.copy_context()
+    iterator = iter(chunks)
+
+    def run():
+        try:
+            while True:
+                try:
+                    chunk = context.run(next, iterator)
+                except StopIteration:
+                    return
+                yield chunk
+        finally:
+            # Клиент отключился: закрываем и исходный генератор (курсор БД).
+            if hasattr(iterator, 'close'):
+                context.run(iterator.close)
+    return run()
+
+
+# chunks - итератор строк (генератор), который читает данные из БД при переборе.
+def streaming_response(request, chunks, content_type):
+    if isinstance(request, ASGIRequest):
+        return FileResponse(_spooled(chunks), content_type=content_type)
+    return StreamingHttpResponse(_in_context(chunks), content_type=content_type)
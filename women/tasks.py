@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mail
+
+from . import captcha
+from .images import build_renditions
+from .jobs import task
+
+# Фоновые задачи, которые представления ставят в очередь (см. women/jobs.py).
+# Задачи могут выполняться повторно (после ошибки или падения обработчика),
+# поэтому повторное выполнение не должно ничего портить.
+
+
+# Сообщение из формы обратной связи пересылается администратору сайта.
+@task
+def send_contact_message(name, email, content):
+    send_mail('Обратная связь: %s' % name, '%s <%s>\n\n%s' % (name, email, content),
+              settings.DEFAULT_FROM_EMAIL, [settings.WOMEN_CONTACT_EMAIL], fail_silently=False)
+
+
+# Приветственное письмо новому пользователю.
+@task
+def send_welcome_email(user_id):
+    user = get_user_model().objects.filter(pk=user_id).only('username', 'email').first()
+    if user is None or not user.email:
+        return
+    send_mail('Добро пожаловать на сайт', 'Здравствуйте, %s! Вы зарегистрировались на сайте.' % user.username,
+              settings.DEFAULT_FROM_EMAIL, [user.email], fail_silently=False)
+
+
+# Производные изображения для загруженного фото статьи (уже актуальные пропускаются).
+@task
+def build_photo_renditions(name):
+    build_renditions(name, settings.MEDIA_ROOT)
+
+
+# Пополнение пула капч формы обратной связи и удаление просроченных.
+@task
+def refill_captcha_pool():
+    captcha.refill()
@@ -1,7 +1,9 @@
+from operator import attrgetter
+
 from django import template
-from django.db.models import *
 
-from women.models import *
+from women.categories import registry
+from women.images import picture_sources
 
 
 # Создаем экземпляр класса Library, через который будет происходить
@@ -16,14 +18,15 @@ register = template.Library()
 @register.simple_tag(name='getcats')
 def get_categories(sort=None):
 
-    # Функция просто возвращает выбранные категории из БД.
+    # Функция просто возвращает выбранные категории из реестра категорий.
     # Если фильтра нет, то возвращается весь список.
     if not sort:
-        return Category.objects.annotate(total=Count('women')).filter(total__gte=0)
+        return registry.all()
 
-    # Иначе будет выполнена функция filter.
+    # Иначе возвращается категория с указанным pk.
     else:
-        return Category.objects.filter(pk=sort)
+        record = registry.get_by_pk(int(sort))
+        return [record] if record else []
 
 # Включающий тег, позволяет дополнительно формировать свой собственный
 # шаблон на основе некоторых данных и возвращать фрагмент HTML-страницы.
@@ -33,20 +36,14 @@ def get_categories(sort=None):
 @register.inclusion_tag('women/list_categories.html')
 def show_categories(sort=None, cat_selected=0):
 
-    # Если сортировка не определена, то возвращается весь список.
-    if sort is None:
-
-        # При помощи annotate применяем Count к каждому объекту Category
-        # (подсчитываем в таблице women количество записей связанное с каждой категорией).
-        # Функция annotate добавляет локальный атрибут total к каждому объекту созданного списка.
-        # Затем отбираем только те категории, у которых количество связаных записей больше.
-        cats = Category.objects.annotate(total=Count('women')).filter(total__gt=0)
-
-    # Иначе вызывается функция order_by (сортировка по указанному полю).
-    else:
+    # Из реестра категорий отбираем только те категории,
+    # у которых есть опубликованные статьи (count больше нуля).
+    cats = [c for c in registry.all() if c.count > 0]
 
-        # То же самое, но дополнительно сортируем по заданному параметру.
-        cats = Category.objects.annotate(total=Count('women')).filter(total__gt=0).order_by(sort)
+    # Если сортировка определена, дополнительно сортируем по заданному полю записи.
+    # Знак '-' перед именем поля означает сортировку по убыванию.
+    if sort is not None:
+        cats.sort(key=attrgetter(sort.lstrip('-')), reverse=sort.startswith('-'))
 
     # Параметр cat_selected передается шаблону (фрагменту),
     # чтобы проверить, какая рубрика выбрана и отобразить
@@ -54,6 +51,15 @@ def show_categories(sort=None, cat_selected=0):
     return {"cats": cats, "cat_selected": cat_selected}
 
 
+# Выводит фото статьи через производные изображения нужного размера
+# (обычный формат и WebP, плотность 1x и 2x), см. images.py.
+@register.inclusion_tag('women/picture.html')
+def picture(photo, rendition, css_class='', alt=''):
+    context = picture_sources(photo, rendition)
+    context.update(css_class=css_class, alt=alt)
+    return context
+
+
 @register.simple_tag(name='getmenu')
 def get_menu():
     menu = [{'title': "О сайте", 'url_name': 'about'},
@@ -1,3 +1,1499 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.core.paginator import InvalidPage
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet, Value
+from django.db.models.functions import Concat
+from django.http import FileResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from coolsite.cache import TwoTierCache
+
+from . import images, jobs, search
+from .models import *
+from .pagination import KeysetPaginator
+from .views import WomenCategory, WomenHome
+
+
+# Проверка планов запросов списков статей (EXPLAIN QUERY PLAN в SQLite).
+# Запросы главной и страниц категорий должны читать статьи по индексу
+# в порядке сортировки: полный просмотр таблицы (SCAN без индекса)
+# или сортировка во временном B-дереве означают, что индексы из Meta.indexes
+# перестали подходить к запросу.
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть только в SQLite')
+class QueryPlanTests(TestCase):
+
+    # Просмотр таблицы без индекса: "SCAN women_women", но не "SCAN ... USING INDEX".
+    FULL_SCAN = re.compile(r'^SCAN \w+$')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        Women.objects.bulk_create(
+            Women(title='Статья %d' % i, slug='post-%d' % i, cat=cls.cat, is_published=i % 5 != 0)
+            for i in range(20))
+
+    def view_queryset(self, view_class, **kwargs):
+        view = view_class()
+        view.setup(RequestFactory().get('/'), **kwargs)
+        return view.get_queryset()
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as c:
+            c.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[3] for row in c.fetchall()]
+
+    def assertIndexedPlan(self, queryset):
+        plan = self.plan(queryset)
+        for step in plan:
+            self.assertIsNone(self.FULL_SCAN.match(step), 'Просмотр таблицы: %s' % plan)
+            self.assertNotIn('TEMP B-TREE', step, 'Сортировка без индекса: %s' % plan)
+
+    # Первая страница, следующая и предыдущая страницы по курсору.
+    def assertIndexedPages(self, queryset):
+        paginator = KeysetPaginator(queryset, 3)
+        last = paginator.page().object_list[-1]
+        for cursor in (None, paginator.encode_cursor(last), paginator.encode_cursor(last, backwards=True)):
+            with self.subTest(cursor=cursor):
+                self.assertIndexedPlan(paginator._page_query(cursor)[0])
+
+    def test_home(self):
+        queryset = self.view_queryset(WomenHome)
+        self.assertIndexedPlan(queryset[:3])
+        self.assertIndexedPages(queryset)
+
+    def test_category(self):
+        queryset = self.view_queryset(WomenCategory, cat_slug=self.cat.slug)
+        self.assertIndexedPlan(queryset[3:6])
+        self.assertIndexedPages(queryset)
+
+    # Список статей в админ-панели с фильтром по дате.
+    def test_admin_date_filter(self):
+        first = Women.objects.order_by('time_create').first()
+        queryset = Women.objects.filter(time_create__gte=first.time_create)
+        self.assertIn('women_created_idx', ' '.join(self.plan(queryset)))
+
+
+def _cache_child(location, results):
+    cache = TwoTierCache(location, {})
+    results.put(cache.get('shared'))
+    cache.set('shared', 'child')
+    cache.incr('counter', 5)
+    results.put('done')
+
+
+# Двухуровневый кэш (coolsite/cache.py) на отдельном каталоге.
+class TwoTierCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+
+    def make_cache(self, **options):
+        return TwoTierCache(self.location, {'OPTIONS': options})
+
+    def rows(self, cache):
+        conn = cache._connection()
+        return (conn.execute('SELECT count(*) FROM cache').fetchone()[0],
+                conn.execute('SELECT entries FROM cache_meta').fetchone()[0])
+
+    def test_get_set_delete(self):
+        cache = self.make_cache()
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', [1, 2])
+        self.assertEqual(cache.get('key'), [1, 2])
+        self.assertTrue(cache.delete('key'))
+        self.assertFalse(cache.delete('key'))
+        self.assertIsNone(cache.get('key'))
+
+    def test_expiry(self):
+        cache = self.make_cache()
+        cache.set('key', 1, 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('key'))
+        self.assertTrue(cache.add('key', 2))
+        self.assertEqual(cache.get('key'), 2)
+
+    def test_add_and_incr(self):
+        cache = self.make_cache()
+        self.assertTrue(cache.add('key', 1))
+        self.assertFalse(cache.add('key', 2))
+        self.assertEqual(cache.incr('key', 4), 5)
+        self.assertEqual(cache.get('key'), 5)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_many(self):
+        cache = self.make_cache()
+        cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        cache.delete_many(['a', 'b'])
+        self.assertEqual(cache.get_many(['a', 'b']), {})
+        self.assertEqual(self.rows(cache), (0, 0))
+
+    # Перезапись ключа не должна увеличивать счетчик записей.
+    def test_overwrite_keeps_entry_count(self):
+        cache = self.make_cache(MAX_ENTRIES=100)
+        for i in range(150):
+            cache.set('key', i)
+        cache.set_many({'key': 'last'})
+        self.assertEqual(self.rows(cache), (1, 1))
+
+    def test_cull_keeps_persistent_keys_when_not_full(self):
+        cache = self.make_cache(MAX_ENTRIES=100)
+        for i in range(150):
+            cache.set('other', i)
+        cache.set('version', 5, None)
+        for i in range(60):
+            cache.set('other', i)
+        self.assertEqual(cache.get('version'), 5)
+
+    def test_cull_removes_expired_first(self):
+        cache = self.make_cache(MAX_ENTRIES=10)
+        cache.set('persistent', 1, None)
+        for i in range(9):
+            cache.set('expiring:%d' % i, i, 0.05)
+        time.sleep(0.1)
+        cache.set('new', 1)
+        self.assertEqual(cache.get('persistent'), 1)
+        self.assertEqual(self.rows(cache), (2, 2))
+
+    def test_cull_removes_oldest(self):
+        cache = self.make_cache(MAX_ENTRIES=10)
+        for i in range(30):
+            cache.set('key:%d' % i, i)
+        self.assertIsNone(cache.get('key:0'))
+        self.assertEqual(cache.get('key:29'), 29)
+        count, entries = self.rows(cache)
+        self.assertEqual(count, entries)
+        self.assertLessEqual(count, 11)
+
+    # incr переносит ключ в конец очереди вытеснения и сохраняет срок жизни.
+    def test_incr_refreshes_cull_order(self):
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        cache.set('version', 1, 300)
+        for i in range(20):
+            cache.set('key:%d' % i, i)
+            cache.incr('version')
+        self.assertEqual(cache.get('version'), 21)
+        self.assertIsNone(cache.get('key:0'))
+        conn = cache._connection()
+        expires = conn.execute('SELECT expires FROM cache WHERE key = ?', (cache.make_key('version'),)).fetchone()[0]
+        self.assertAlmostEqual(expires, time.time() + 300, delta=10)
+        self.assertEqual(*self.rows(cache))
+
+    # Запись в другом процессе делает недействительной копию в памяти этого процесса.
+    def test_cross_process_invalidation(self):
+        cache = self.make_cache()
+        cache.set('shared', 'parent')
+        cache.set('counter', 1)
+        self.assertEqual(cache.get('shared'), 'parent')
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        process = context.Process(target=_cache_child, args=(self.location, results))
+        process.start()
+        self.assertEqual(results.get(timeout=10), 'parent')
+        self.assertEqual(results.get(timeout=10), 'done')
+        process.join()
+        self.assertEqual(cache.get('shared'), 'child')
+        self.assertEqual(cache.get('counter'), 6)
+
+    # Изменение полученного значения не меняет значение в кэше (как и у других бэкендов Django).
+    def test_get_returns_copy(self):
+        cache = self.make_cache()
+        cache.set('key', {'a': [1]})
+        for _ in range(2):
+            value = cache.get('key')
+            value['b'] = 2
+            value['a'].append(2)
+        self.assertEqual(cache.get('key'), {'a': [1]})
+        value = async_to_sync(cache.aget)('key')
+        value['b'] = 2
+        self.assertEqual(async_to_sync(cache.aget)('key'), {'a': [1]})
+
+    def test_clear(self):
+        cache = self.make_cache()
+        cache.set('key', 1)
+        self.assertEqual(cache.get('key'), 1)
+        cache.clear()
+        self.assertIsNone(cache.get('key'))
+
+
+# Кэш default на временном каталоге: тесты страниц не видят записей
+# других тестов и рабочего кэша сайта.
+class IsolatedCacheMixin:
+
+    def setUp(self):
+        super().setUp()
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        caches = override_settings(CACHES={'default': {'BACKEND': 'coolsite.cache.TwoTierCache',
+                                                       'LOCATION': location}})
+        caches.enable()
+        self.addCleanup(caches.disable)
+
+
+# Условные запросы к главной и страницам категорий (conditional.py).
+class ListConditionTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        self.post = Women.objects.create(title='Статья', slug='post', content='Текст',
+                                         cat=self.cat, is_published=True)
+
+    # Ответ из кэша страниц и ответ 304 не обращаются к БД.
+    def test_cached_hit_without_queries(self):
+        for url in ('/', '/category/aktrisy/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'hit')
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_posts(self):
+        etag = self.client.get('/')['ETag']
+        self.post.title = 'Новый заголовок'
+        self.post.save()
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Новый заголовок')
+
+    def test_unknown_category(self):
+        self.assertEqual(self.client.get('/category/missing/').status_code, 404)
+
+
+# HTML статьи (content_html, excerpt_html) при массовых операциях.
+class ContentHtmlTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        self.post = Women.objects.create(title='Статья', slug='post', content='Старый', cat=self.cat)
+
+    def html(self):
+        return Women.objects.values_list('content_html', 'excerpt_html').get(pk=self.post.pk)
+
+    def test_update(self):
+        Women.objects.filter(pk=self.post.pk).update(content='Первый\n\n<b>второй</b>')
+        self.assertEqual(self.html()[0], '<p>Первый</p>\n\n<p>&lt;b&gt;второй&lt;/b&gt;</p>')
+
+    def test_update_expression(self):
+        Women.objects.filter(pk=self.post.pk).update(content=Concat('content', Value(' текст')))
+        self.assertEqual(self.html(), ('<p>Старый текст</p>', '<p>Старый текст</p>'))
+
+    def test_bulk_update(self):
+        self.post.content = 'Новый'
+        Women.objects.bulk_update([self.post], ['content'])
+        self.assertEqual(self.html(), ('<p>Новый</p>', '<p>Новый</p>'))
+
+    def test_bulk_create(self):
+        Women.objects.bulk_create([Women(title='Вторая', slug='second', content='Текст', cat=self.cat)])
+        self.assertEqual(Women.objects.get(slug='second').content_html, '<p>Текст</p>')
+
+    # Пустые массовые операции не сбрасывают кэш страниц и статей.
+    def test_empty_keeps_caches(self):
+        with mock.patch('women.models._purge_caches') as purge:
+            Women.objects.bulk_update([], ['content'])
+            Women.objects.bulk_update([], ['cat'])
+            Women.objects.bulk_create([])
+            Women.objects.filter(pk=0).update(content='Текст')
+            Women.objects.filter(pk=0).update(is_published=False)
+        purge.assert_not_called()
+
+    # render_content обновляет статьи порциями и сбрасывает кэш один раз.
+    def test_render_content_purges_once(self):
+        for i in range(5):
+            Women.objects.create(title='Статья %d' % i, slug='post-%d' % i, content='Текст', cat=self.cat)
+        QuerySet(Women).update(content_html='', excerpt_html='')
+        with mock.patch('women.pagecache.purge_all') as purge:
+            call_command('render_content', batch_size=2, stdout=io.StringIO())
+        purge.assert_called_once_with()
+        self.assertEqual(self.html(), ('<p>Старый</p>', '<p>Старый</p>'))
+
+
+# Миграция 0002 заполняет HTML у статей, созданных до нее.
+class ContentHtmlMigrationTests(TransactionTestCase):
+
+    def test_backfill(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('women', '0001_initial')])
+        apps = executor.loader.project_state(('women', '0001_initial')).apps
+        cat = apps.get_model('women', 'Category').objects.create(name='Актрисы', slug='aktrisy')
+        apps.get_model('women', 'Women').objects.create(title='Статья', slug='post', content='Текст', cat_id=cat.pk)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('women'))
+        self.assertEqual(list(Women.objects.values_list('content_html', 'excerpt_html')),
+                         [('<p>Текст</p>', '<p>Текст</p>')])
+
+
+# Счетчики опубликованных статей в категориях (signals.py, WomenQuerySet, CategoryQuerySet.recount).
+class PublishedCountTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first = Category.objects.create(name='Актрисы', slug='aktrisy')
+        self.second = Category.objects.create(name='Певицы', slug='pevicy')
+
+    def create(self, slug, cat=None, is_published=True):
+        return Women.objects.create(title=slug, slug=slug, cat=cat or self.first, is_published=is_published)
+
+    def assertCounts(self, first, second):
+        self.assertEqual(
+            dict(Category.objects.values_list('slug', 'published_count')),
+            {'aktrisy': first, 'pevicy': second})
+
+    def test_create(self):
+        self.create('a')
+        self.create('b', is_published=False)
+        self.assertCounts(1, 0)
+
+    def test_publish_unpublish(self):
+        post = self.create('a', is_published=False)
+        post.is_published = True
+        post.save()
+        self.assertCounts(1, 0)
+        post.is_published = False
+        post.save()
+        self.assertCounts(0, 0)
+
+    def test_category_change(self):
+        post = self.create('a')
+        post.cat = self.second
+        post.save()
+        self.assertCounts(0, 1)
+
+    # Объект, загруженный без полей счетчика, тоже переносится между категориями.
+    def test_category_change_deferred(self):
+        self.create('a')
+        post = Women.objects.only('pk').get(slug='a')
+        post.cat = self.second
+        post.save()
+        self.assertCounts(0, 1)
+
+    def test_delete(self):
+        self.create('a')
+        self.create('b').delete()
+        self.assertCounts(1, 0)
+        Women.objects.all().delete()
+        self.assertCounts(0, 0)
+
+    def test_update(self):
+        self.create('a')
+        self.create('b')
+        self.create('c', is_published=False)
+        Women.objects.filter(slug__in=['a', 'c']).update(cat=self.second)
+        self.assertCounts(1, 1)
+        Women.objects.update(is_published=True)
+        self.assertCounts(1, 2)
+
+    def test_bulk_create(self):
+        Women.objects.bulk_create([
+            Women(title='a', slug='a', cat=self.first),
+            Women(title='b', slug='b', cat=self.second),
+            Women(title='c', slug='c', cat=self.second, is_published=False),
+        ])
+        self.assertCounts(1, 1)
+
+    def test_recount(self):
+        self.create('a')
+        Category.objects.update(published_count=10)
+        Category.objects.all().recount()
+        self.assertCounts(1, 0)
+
+
+# Кэш страниц для анонимных посетителей (pagecache.py).
+class PageCacheTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first = Category.objects.create(name='Актрисы', slug='aktrisy')
+        self.second = Category.objects.create(name='Певицы', slug='pevicy')
+        self.post = Women.objects.create(title='Статья', slug='post', content='Текст', cat=self.first)
+        Women.objects.create(title='Другая', slug='other', content='Текст', cat=self.second)
+
+    def cache_state(self, url):
+        return self.client.get(url)['X-Page-Cache']
+
+    def warm(self, *urls):
+        for url in urls:
+            self.client.get(url)
+            self.assertEqual(self.cache_state(url), 'hit')
+
+    # Изменение статьи сбрасывает главную, ее категорию и ее страницу, но не чужие.
+    def test_purge_by_scope(self):
+        urls = ('/', '/category/aktrisy/', '/category/pevicy/', '/post/post/', '/post/other/')
+        self.warm(*urls)
+        self.post.content = 'Новый текст'
+        self.post.save()
+        self.assertEqual({url: self.cache_state(url) for url in urls}, {
+            '/': 'miss', '/category/aktrisy/': 'miss', '/category/pevicy/': 'hit',
+            '/post/post/': 'miss', '/post/other/': 'hit'})
+        self.assertContains(self.client.get('/post/post/'), 'Новый текст')
+
+    # Переход статьи в другую категорию сбрасывает страницы обеих категорий.
+    def test_purge_category_change(self):
+        Women.objects.create(title='Третья', slug='third', content='Текст', cat=self.first)
+        self.warm('/category/aktrisy/', '/category/pevicy/')
+        self.post.cat = self.second
+        self.post.save()
+        self.assertEqual(self.cache_state('/category/aktrisy/'), 'miss')
+        self.assertEqual(self.cache_state('/category/pevicy/'), 'miss')
+
+    # Версии областей статей хранятся ограниченное время, версия оформления - без ограничения.
+    @override_settings(WOMEN_PAGE_CACHE_TIMEOUT=600)
+    def test_scope_version_timeout(self):
+        from django.core.cache import cache
+        from . import pagecache
+
+        def expires(key):
+            return cache._connection().execute('SELECT expires FROM cache WHERE key = ?',
+                                               (cache.make_key(key),)).fetchone()[0]
+
+        self.post.save()
+        self.client.get('/post/other/')
+        for scope in ('post:post', 'post:other'):
+            self.assertAlmostEqual(expires(pagecache.SCOPE_KEY % scope), time.time() + 600, delta=10)
+        self.assertIsNone(expires(pagecache.LAYOUT_KEY))
+
+    # Изменение категории меняет меню на всех страницах.
+    def test_purge_all(self):
+        self.warm('/', '/post/other/')
+        self.second.name = 'Исполнительницы'
+        self.second.save()
+        self.assertEqual(self.cache_state('/post/other/'), 'miss')
+        self.assertContains(self.client.get('/'), 'Исполнительницы')
+
+    # Параметры, не влияющие на страницу, не создают новых записей.
+    def test_ignores_unknown_params(self):
+        self.warm('/')
+        self.assertEqual(self.cache_state('/?utm_source=mail'), 'hit')
+
+    def test_not_cached_for_authenticated(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('reader', password='secret-pass'))
+        for url in ('/', '/post/post/'):
+            with self.subTest(url=url):
+                self.client.get(url)
+                self.assertFalse(self.client.get(url).has_header('X-Page-Cache'))
+        self.client.logout()
+        self.assertEqual(self.cache_state('/'), 'miss')
+
+
+# Кэш статей (postcache.py).
+class PostCacheTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        from . import postcache
+        self.postcache = postcache
+        self.cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        self.post = Women.objects.create(title='Статья', slug='post', content='Текст', cat=self.cat)
+
+    def test_hit_without_queries(self):
+        self.assertEqual(self.postcache.get_post('post').title, 'Статья')
+        with self.assertNumQueries(0):
+            post = self.postcache.get_post('post')
+        self.assertEqual((post.pk, post.cat.slug), (self.post.pk, 'aktrisy'))
+
+    @override_settings(WOMEN_POST_NOT_FOUND_TIMEOUT=0.1)
+    def test_not_found_expires(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.postcache.get_post('missing'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.postcache.get_post('missing'))
+        time.sleep(0.2)
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.postcache.get_post('missing'))
+
+    # Новая статья с ранее запрошенным адресом видна сразу, без ожидания истечения.
+    def test_create_clears_not_found(self):
+        self.assertIsNone(self.postcache.get_post('new'))
+        Women.objects.create(title='Новая', slug='new', cat=self.cat)
+        self.assertEqual(self.postcache.get_post('new').title, 'Новая')
+
+    def test_slug_change(self):
+        self.postcache.get_post('post')
+        self.post.slug = 'renamed'
+        self.post.save()
+        self.assertIsNone(self.postcache.get_post('post'))
+        self.assertEqual(self.postcache.get_post('renamed').pk, self.post.pk)
+
+    def test_delete(self):
+        self.postcache.get_post('post')
+        self.post.delete()
+        self.assertIsNone(self.postcache.get_post('post'))
+
+    def test_bulk_update_and_category_change(self):
+        self.postcache.get_post('post')
+        Women.objects.filter(pk=self.post.pk).update(title='Другой заголовок')
+        self.assertEqual(self.postcache.get_post('post').title, 'Другой заголовок')
+        self.cat.name = 'Актрисы кино'
+        self.cat.save()
+        self.assertEqual(self.postcache.get_post('post').cat.name, 'Актрисы кино')
+
+
+# Ограничение частоты входа (ratelimit.py).
+class RateLimitTests(IsolatedCacheMixin, TestCase):
+
+    def login(self, username, address='10.0.0.1'):
+        return self.client.post('/login/', {'username': username, 'password': 'wrong'}, REMOTE_ADDR=address)
+
+    @override_settings(WOMEN_RATELIMITS={'login': {'ip': '2/m'}})
+    def test_ip_limit(self):
+        self.assertEqual(self.login('anna').status_code, 200)
+        self.assertEqual(self.login('boris').status_code, 200)
+        response = self.login('vera')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+        self.assertEqual(self.login('vera', '10.0.0.2').status_code, 200)
+        # Страница с формой открывается без ограничений.
+        self.assertEqual(self.client.get('/login/', REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+    # Попытки для логина считаются отдельно для каждого адреса.
+    @override_settings(WOMEN_RATELIMITS={'login': {'username_ip': '2/m'}})
+    def test_username_limit_per_address(self):
+        self.login('anna')
+        self.login(' Anna ')
+        self.assertEqual(self.login('anna').status_code, 429)
+        self.assertEqual(self.login('boris').status_code, 200)
+        self.assertEqual(self.login('anna', '10.0.0.2').status_code, 200)
+
+    # Общий счетчик логина учитывает попытки со всех адресов.
+    @override_settings(WOMEN_RATELIMITS={'login': {'username_ip': '2/m', 'username': '3/m'}})
+    def test_username_limit_all_addresses(self):
+        self.assertEqual(self.login('anna', '10.0.0.1').status_code, 200)
+        self.assertEqual(self.login('anna', '10.0.0.2').status_code, 200)
+        self.assertEqual(self.login('anna', '10.0.0.3').status_code, 200)
+        self.assertEqual(self.login('anna', '10.0.0.4').status_code, 429)
+        self.assertEqual(self.login('boris', '10.0.0.4').status_code, 200)
+
+    # X-Forwarded-For учитывается только от доверенного прокси.
+    @override_settings(WOMEN_RATELIMITS={'login': {'ip': '1/m'}}, WOMEN_TRUSTED_PROXIES=['10.1.0.0/16'])
+    def test_trusted_proxy(self):
+        def login(forwarded, address='10.1.0.1'):
+            return self.client.post('/login/', {'username': 'anna', 'password': 'wrong'},
+                                    REMOTE_ADDR=address, HTTP_X_FORWARDED_FOR=forwarded).status_code
+
+        self.assertEqual(login('192.0.2.1'), 200)
+        self.assertEqual(login('192.0.2.1'), 429)
+        # Адрес левее клиента подставлен им самим, прокси из цепочки пропускаются.
+        self.assertEqual(login('198.51.100.7, 192.0.2.1, 10.1.0.2'), 429)
+        self.assertEqual(login('192.0.2.2'), 200)
+        # Недоверенный адрес: заголовок игнорируется, считается REMOTE_ADDR.
+        self.assertEqual(login('192.0.2.3', '10.0.0.9'), 200)
+        self.assertEqual(login('192.0.2.4', '10.0.0.9'), 429)
+
+    # Адреса IPv6 из одной сети /64 считаются одним адресом.
+    @override_settings(WOMEN_RATELIMITS={'login': {'ip': '1/m'}})
+    def test_ipv6_network(self):
+        self.assertEqual(self.login('anna', '2001:db8::1').status_code, 200)
+        self.assertEqual(self.login('anna', '2001:db8::2').status_code, 429)
+        self.assertEqual(self.login('anna', '2001:db8:0:1::1').status_code, 200)
+
+
+# Сессии и заголовки кэширования публичных страниц (sessions.py).
+class SessionHeadersTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        Women.objects.create(title='Статья', slug='post', content='Текст', cat=cat)
+
+    def vary(self, response):
+        return {v.strip().lower() for v in response.get('Vary', '').split(',') if v.strip()}
+
+    def test_anonymous_public_page(self):
+        for url in ('/', '/post/post/', '/about/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertNotIn('cookie', self.vary(response))
+                self.assertNotIn('private', response.get('Cache-Control', ''))
+                self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    # Страницы не из public_page по-прежнему зависят от cookie.
+    def test_other_pages_vary(self):
+        self.assertIn('cookie', self.vary(self.client.get('/login/')))
+
+    def test_session_cookie_private(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('reader', password='secret-pass'))
+        response = self.client.get('/')
+        self.assertIn('cookie', self.vary(response))
+        self.assertIn('private', response['Cache-Control'])
+
+    # Чтение сессии из кэша не обращается к БД.
+    def test_session_read_without_queries(self):
+        from django.contrib.auth.models import User
+        user = User.objects.create_user('reader', password='secret-pass')
+        self.client.force_login(user)
+        self.client.get('/about/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/about/')
+        self.assertEqual([q['sql'] for q in queries if 'django_session' in q['sql']], [])
+
+
+# Карта сайта и лента (streaming.py): под WSGI ответ отправляется по частям,
+# под ASGI тело готово до возврата в цикл событий.
+class StreamingTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        Women.objects.create(title='Статья', slug='post', content='Текст', cat=cat)
+
+    def test_wsgi_streams(self):
+        response = self.client.get('/sitemap-posts-0.xml')
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertIn(b'/post/post/', b''.join(response.streaming_content))
+
+    # Тело перебирается после выхода из ReplicaMiddleware, но в контексте представления.
+    def test_wsgi_keeps_router_state(self):
+        from .routers import _request
+        from .streaming import streaming_response
+
+        def chunks():
+            yield str(_request.get()['db'])
+
+        token = _request.set({'db': 'replica', 'wrote': False})
+        response = streaming_response(RequestFactory().get('/'), chunks(), 'text/plain')
+        _request.reset(token)
+        self.assertEqual(b''.join(response.streaming_content), b'replica')
+
+    async def test_asgi_body_ready(self):
+        for url in ('/sitemap.xml', '/sitemap-posts-0.xml', '/feed/'):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertIsInstance(response, FileResponse)
+                body = b''.join(response.streaming_content)
+                self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertIn(b'/post/post/', body)
+
+
+@jobs.task
+def _noop_job(*args):
+    pass
+
+
+# Очередь фоновых задач (jobs.py) в отдельном файле.
+class JobQueueTests(SimpleTestCase):
+
+    jobs = jobs
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        database = override_settings(WOMEN_JOBS_DATABASE=os.path.join(location, 'jobs.sqlite3'))
+        database.enable()
+        self.addCleanup(database.disable)
+        jobs._threads.conn = None
+        self.addCleanup(setattr, jobs._threads, 'conn', None)
+
+    def state(self, job_id):
+        return self.jobs._connection().execute('SELECT state, attempts, key FROM jobs WHERE id = ?',
+                                               (job_id,)).fetchone()
+
+    def test_key_deduplicates(self):
+        first = self.jobs.enqueue(_noop_job, 1, key='k')
+        self.assertEqual(self.jobs.enqueue(_noop_job, 2, key='k'), first)
+        (job_id, name, args), = self.jobs.claim(10)
+        self.assertIsNone(self.jobs.execute(name, args))
+        self.jobs.complete(job_id)
+        self.assertEqual(self.jobs.enqueue(_noop_job, 3, key='k'), first)
+
+    # У окончательно упавшей задачи ключ освобождается.
+    def test_failed_frees_key(self):
+        first = self.jobs.enqueue(_noop_job, key='k', max_attempts=1)
+        self.jobs.claim(10)
+        self.assertEqual(self.jobs.fail(first, 'error'), self.jobs.FAILED)
+        self.assertEqual(self.state(first), (self.jobs.FAILED, 1, None))
+        self.assertNotEqual(self.jobs.enqueue(_noop_job, key='k'), first)
+
+    def test_retry(self):
+        job_id = self.jobs.enqueue(_noop_job, max_attempts=2)
+        self.jobs.claim(10)
+        self.assertEqual(self.jobs.fail(job_id, 'error'), self.jobs.QUEUED)
+        self.assertEqual(self.jobs.claim(10), [])
+
+    # Задача, обработчик которой не вернулся, повторяется, пока не исчерпаны попытки.
+    @override_settings(WOMEN_JOBS_TIMEOUT=-1)
+    def test_stale_running(self):
+        job_id = self.jobs.enqueue(_noop_job, key='crash', max_attempts=2)
+        self.assertEqual(len(self.jobs.claim(10)), 1)
+        self.assertEqual(len(self.jobs.claim(10)), 1)
+        self.assertEqual(self.jobs.claim(10), [])
+        self.assertEqual(self.state(job_id), (self.jobs.FAILED, 2, None))
+
+    @override_settings(WOMEN_JOBS_KEEP=-1)
+    def test_cleanup(self):
+        done = self.jobs.enqueue(_noop_job)
+        failed = self.jobs.enqueue(_noop_job, max_attempts=1)
+        queued = self.jobs.enqueue(_noop_job, delay=60)
+        self.jobs.claim(10)
+        self.jobs.complete(done)
+        self.jobs.fail(failed, 'error')
+        self.assertEqual(self.jobs.cleanup(), 2)
+        self.assertEqual(self.jobs.stats(), {'queued': 1, 'running': 0, 'done': 0, 'failed': 0})
+        self.assertIsNotNone(self.state(queued))
+
+
+# Загрузка статей командой import_women и продолжение после прерванного запуска.
+class ImportWomenTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        Category.objects.create(name='Актрисы', slug='aktrisy')
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.path = os.path.join(location, 'posts.jsonl')
+        with open(self.path, 'w') as f:
+            for i in range(5):
+                f.write(json.dumps({'title': 'Статья %d' % i, 'content': 'Текст', 'cat': 'aktrisy'}) + '\n')
+
+    def run_import(self):
+        call_command('import_women', self.path, batch_size=2, workers=1, stdout=io.StringIO())
+
+    def test_import(self):
+        self.run_import()
+        self.assertEqual(Women.objects.count(), 5)
+        self.assertEqual(Women.objects.get(slug='statya-0').content_html, '<p>Текст</p>')
+
+    # Прерывание после вставки порции, но до записи контрольной точки.
+    def test_resume_after_crash_before_checkpoint(self):
+        from women.management.commands.import_women import Command
+        write_checkpoint = Command.write_checkpoint
+
+        def crash_after_commit(command, state):
+            if 'pending' not in state and state['records'] == 4:
+                raise KeyboardInterrupt
+            write_checkpoint(command, state)
+
+        with mock.patch.object(Command, 'write_checkpoint', crash_after_commit):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_import()
+        self.assertEqual(Women.objects.count(), 4)
+
+        self.run_import()
+        self.assertEqual(sorted(Women.objects.values_list('slug', flat=True)),
+                         ['statya-%d' % i for i in range(5)])
+
+
+# Проверка настроек реплик (routers.py): постоянные соединения читали бы старый файл.
+class ReplicaCheckTests(SimpleTestCase):
+
+    @override_settings(WOMEN_DB_REPLICAS=['default'])
+    def test_conn_max_age(self):
+        from .routers import check_replica_connections
+        self.assertEqual(check_replica_connections(None), [])
+        with mock.patch.dict(settings.DATABASES['default'], CONN_MAX_AGE=60):
+            self.assertEqual([e.id for e in check_replica_connections(None)], ['women.E001'])
+
+    # Без реплик запись не отмечается в кэше.
+    @override_settings(WOMEN_DB_REPLICAS=[])
+    def test_no_replicas_skips_mark_written(self):
+        from .routers import ReplicaRouter
+        with mock.patch('women.routers.mark_written') as mark_written:
+            self.assertEqual(ReplicaRouter().db_for_write(Women), 'default')
+        mark_written.assert_not_called()
+        with override_settings(WOMEN_DB_REPLICAS=['default']), \
+                mock.patch('women.routers.mark_written') as mark_written:
+            ReplicaRouter().db_for_write(Women)
+        mark_written.assert_called_once_with()
+
+
+# Готовые фрагменты меню и боковой панели (fragments.py).
+class FragmentTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        Women.objects.create(title='Статья', slug='post', content='Текст', cat=cat)
+
+    # На странице "О сайте", как и прежде, нет списка категорий.
+    def test_about_sidebar(self):
+        self.assertContains(self.client.get('/'), 'Актрисы')
+        response = self.client.get('/about/')
+        self.assertContains(response, 'Все категории')
+        self.assertNotContains(response, 'Актрисы')
+
+    # Измененное меню не берется из кэша прежней версии.
+    def test_menu_key_changes_with_menu(self):
+        from .fragments import menu_html
+        menu = [{'title': 'О сайте', 'url_name': 'about'}]
+        self.assertIn('О сайте', menu_html(menu, False))
+        menu = [{'title': 'Обратная связь', 'url_name': 'contact'}]
+        self.assertIn('Обратная связь', menu_html(menu, False))
+
+
+# Хранилище сессий (sessions.py): изменения без сохранения не попадают в кэш.
+class SessionStoreTests(IsolatedCacheMixin, TestCase):
+
+    def test_unsaved_changes_not_shared(self):
+        from .sessions import SessionStore
+        store = SessionStore()
+        store['cart'] = {'items': [1]}
+        store.save()
+
+        loaded = SessionStore(store.session_key)
+        loaded['cart']['items'].append(2)
+        loaded['user'] = 'reader'
+        self.assertEqual(SessionStore(store.session_key).load(), {'cart': {'items': [1]}})
+
+        # Сохраненные изменения видны новому хранилищу.
+        loaded.save()
+        self.assertEqual(SessionStore(store.session_key).load(), {'cart': {'items': [1, 2]}, 'user': 'reader'})
+
+
+# Пагинация по ключу (pagination.py).
+class KeysetPaginatorTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        Women.objects.bulk_create(Women(title='Статья %d' % i, slug='post-%d' % i, cat=self.cat)
+                                  for i in range(7))
+        # Одинаковое время создания: порядок задают title и pk.
+        Women.objects.update(time_create=datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc))
+        self.expected = list(Women.objects.order_by('-time_create', 'title', 'pk').values_list('slug', flat=True))
+
+    def paginator(self):
+        return KeysetPaginator(Women.objects.all(), 3)
+
+    def slugs(self, page):
+        return [post.slug for post in page]
+
+    def test_cursor_round_trip(self):
+        paginator = self.paginator()
+        post = Women.objects.get(slug='post-3')
+        values, backwards = paginator.decode_cursor(paginator.encode_cursor(post, backwards=True))
+        self.assertEqual(values, [post.time_create, post.title, post.pk])
+        self.assertTrue(backwards)
+
+    # Проход вперед до последней страницы и назад до первой с равным time_create.
+    def test_next_and_previous(self):
+        paginator = self.paginator()
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([self.slugs(page) for page in pages],
+                         [self.expected[0:3], self.expected[3:6], self.expected[6:7]])
+        self.assertFalse(pages[0].has_previous())
+        self.assertIsNone(pages[0].previous_cursor)
+        self.assertFalse(pages[-1].has_next())
+        self.assertIsNone(pages[-1].next_cursor)
+
+        page = pages[-1]
+        backwards = []
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            backwards.append(self.slugs(page))
+        self.assertEqual(backwards, [self.expected[3:6], self.expected[0:3]])
+
+    def test_single_page(self):
+        page = KeysetPaginator(Women.objects.all(), 10).page()
+        self.assertEqual(self.slugs(page), self.expected)
+        self.assertFalse(page.has_other_pages())
+
+    def test_invalid_cursor(self):
+        paginator = self.paginator()
+        cursors = ['garbage', '!!!', paginator.encode_cursor(Women.objects.first())[:-3]]
+        for data in ({'d': 'x', 'k': []}, {'d': 'n', 'k': ['x', 'y', 'z']}, [1], 5,
+                     {'d': 'n', 'k': ['2026-01-01T00:00:00+00:00', 'a', 10 ** 30]}):
+            cursors.append(base64.urlsafe_b64encode(json.dumps(data).encode()).decode())
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(InvalidPage):
+                    paginator.page(cursor)
+                self.assertEqual(self.client.get('/', {'cursor': cursor}).status_code, 404)
+
+    # Количество записей хранится в кэше count_timeout секунд.
+    def test_cached_count(self):
+        self.assertEqual(self.paginator().cached_count, 7)
+        Women.objects.create(title='Новая', slug='new', cat=self.cat)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.paginator().cached_count, 7)
+
+
+# Производные изображения фото (images.py) во временном MEDIA_ROOT.
+class RenditionsTests(SimpleTestCase):
+
+    name = 'photos/2026/01/01/photo.jpg'
+
+    def setUp(self):
+        from PIL import Image
+
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        images._ready.clear()
+        self.addCleanup(images._ready.clear)
+        os.makedirs(os.path.dirname(self.path(self.name)))
+        Image.new('RGB', (800, 600), 'red').save(self.path(self.name))
+        self.photo = mock.Mock(url='/media/' + self.name)
+        self.photo.name = self.name
+
+    def path(self, name):
+        return os.path.join(self.media_root, name)
+
+    def test_build(self):
+        from PIL import Image
+
+        count = len(images.RENDITIONS) * len(images.DENSITIES) * 2
+        self.assertEqual(images.build_renditions(self.name), count)
+        with Image.open(self.path(images.rendition_name(self.name, 'post', 2, 'webp'))) as image:
+            self.assertEqual((image.format, image.width), ('WEBP', 600))
+        with Image.open(self.path(images.rendition_name(self.name, 'thumb'))) as image:
+            self.assertEqual((image.format, image.width), ('JPEG', 150))
+        # Актуальные файлы не создаются заново, временных файлов не остается.
+        self.assertEqual(images.build_renditions(self.name), 0)
+        self.assertEqual(images.build_renditions(self.name, force=True), count)
+        for root, dirs, files in os.walk(self.media_root):
+            self.assertFalse([f for f in files if f.endswith('.tmp')])
+        self.assertIsNone(images.build_renditions('photos/missing.jpg'))
+
+    # Основное изображение переименовывается после остальных вариантов.
+    def test_base_replaced_last(self):
+        with mock.patch('os.replace', wraps=os.replace) as replace:
+            images.build_renditions(self.name)
+        targets = [call.args[1] for call in replace.call_args_list]
+        bases = {self.path(images.rendition_name(self.name, r)) for r in images.RENDITIONS}
+        self.assertEqual(set(targets[-len(bases):]), bases)
+
+    def test_picture_sources(self):
+        self.assertEqual(images.picture_sources(self.photo, 'post'),
+                         {'src': self.photo.url, 'srcset': '', 'webp_srcset': ''})
+        images.build_renditions(self.name)
+        sources = images.picture_sources(self.photo, 'post')
+        self.assertEqual(sources['width'], 300)
+        self.assertTrue(sources['src'].endswith('renditions/post/1x/photos/2026/01/01/photo.jpg'))
+        self.assertIn('renditions/post/2x/photos/2026/01/01/photo.webp 2x', sources['webp_srcset'])
+
+    # Без любого из вариантов выводится оригинал, готовое фото больше не проверяется на диске.
+    def test_picture_sources_checks_all_variants(self):
+        images.build_renditions(self.name)
+        os.remove(self.path(images.rendition_name(self.name, 'post', 2, 'webp')))
+        self.assertEqual(images.picture_sources(self.photo, 'post')['src'], self.photo.url)
+        images.build_renditions(self.name)
+        self.assertEqual(images.picture_sources(self.photo, 'post')['width'], 300)
+        with mock.patch('os.path.exists') as exists:
+            images.picture_sources(self.photo, 'post')
+        exists.assert_not_called()
+
+
+# Форма обратной связи (ContactFormView): повторная отправка не создает второе письмо.
+class ContactFormTests(IsolatedCacheMixin, TestCase):
+
+    def nonce(self):
+        response = self.client.get('/contact/')
+        self.assertEqual(response.status_code, 200)
+        return re.search(r'name="nonce" value="([^"]+)"', response.content.decode()).group(1)
+
+    def send(self, nonce, content='Текст'):
+        from .forms import ContactForm
+        from .views import ContactFormView
+
+        form = ContactForm()
+        form.cleaned_data = {'name': 'Анна', 'email': 'anna@example.com', 'content': content, 'nonce': nonce}
+        with mock.patch('women.views.enqueue') as enqueue:
+            ContactFormView().form_valid(form)
+        return enqueue.call_args.kwargs['key']
+
+    def test_nonce_per_render(self):
+        self.assertNotEqual(self.nonce(), self.nonce())
+
+    def test_idempotency_key(self):
+        first, second = self.nonce(), self.nonce()
+        self.assertEqual(self.send(first), self.send(first))
+        # То же сообщение из новой формы отправляется снова.
+        self.assertNotEqual(self.send(first), self.send(second))
+        self.assertNotEqual(self.send(first), self.send(first, 'Другой текст'))
+
+
+# Полнотекстовый поиск (search.py): индекс обновляется триггерами при любых изменениях статей.
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Индекс FTS5 есть только в SQLite')
+class SearchTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        self.post = Women.objects.create(title='Анджелина Джоли', slug='jolie', cat=self.cat,
+                                         content='Американская актриса <кино>')
+        Women.objects.create(title='Скрытая', slug='hidden', content='актриса', cat=self.cat, is_published=False)
+
+    def found(self, query):
+        return [post.slug for post in search.SearchResults(query)[:10]]
+
+    def test_results(self):
+        results = search.SearchResults('актр')
+        self.assertEqual(results.count(), 1)
+        post, = results[0:10]
+        self.assertEqual(post.slug, 'jolie')
+        self.assertEqual(post.snippet_html, 'Американская <mark>актриса</mark> &lt;кино&gt;')
+        self.assertEqual(self.found('джоли'), ['jolie'])
+        self.assertEqual(self.found('"*'), [])
+
+    def test_index_follows_changes(self):
+        self.post.title = 'Одри Хепберн'
+        self.post.save()
+        self.assertEqual(self.found('джоли'), [])
+        self.assertEqual(self.found('хепберн'), ['jolie'])
+        Women.objects.filter(pk=self.post.pk).update(content=Concat('content', Value(' театра')))
+        self.assertEqual(self.found('театра'), ['jolie'])
+        Women.objects.bulk_create([Women(title='Мэрилин Монро', slug='monroe', content='Текст', cat=self.cat)])
+        self.assertEqual(self.found('монро'), ['monroe'])
+        self.post.delete()
+        self.assertEqual(self.found('хепберн'), [])
+
+    # Сохранение без изменения заголовка и текста не трогает индекс.
+    def test_save_without_text_changes(self):
+        def changes():
+            with connection.cursor() as c:
+                c.execute('SELECT total_changes()')
+                return c.fetchone()[0]
+
+        before = changes()
+        self.post.save()
+        self.assertEqual(changes() - before, 1)
+        self.post.title = 'Одри Хепберн'
+        before = changes()
+        self.post.save()
+        self.assertGreater(changes() - before, 1)
+
+    def test_rebuild_command(self):
+        with connection.cursor() as c:
+            c.execute("INSERT INTO women_search (women_search) VALUES ('delete-all')")
+        self.assertEqual(self.found('джоли'), [])
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('2', out.getvalue())
+        self.assertEqual(self.found('джоли'), ['jolie'])
+
+    def test_admin_search(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get('/admin/women/women/', {'q': 'актриса'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get('/admin/women/women/', {'q': 'джоли'})
+        self.assertEqual([post.slug for post in response.context['cl'].result_list], ['jolie'])
+
+    def test_search_view(self):
+        response = self.client.get('/search/', {'q': 'Джоли'})
+        self.assertContains(response, '<mark>Джоли</mark>')
+        self.assertEqual(self.client.get('/search/').status_code, 200)
+
+
+# Асинхронные представления публичных страниц (async_views.py) через AsyncClient.
+# Маршруты women/urls.py загружаются еще раз с WOMEN_ASYNC_VIEWS = True.
+class AsyncViewsTests(IsolatedCacheMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import importlib.util
+        spec = importlib.util.find_spec('women.urls')
+        urls = importlib.util.module_from_spec(spec)
+        with override_settings(WOMEN_ASYNC_VIEWS=True):
+            spec.loader.exec_module(urls)
+        cls.enterClassContext(override_settings(ROOT_URLCONF=urls))
+
+    def setUp(self):
+        super().setUp()
+        self.cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        Women.objects.create(title='Анджелина Джоли', slug='jolie', content='Текст', cat=self.cat)
+        Women.objects.create(title='Черновик', slug='draft', content='Текст', cat=self.cat, is_published=False)
+
+    async def test_home(self):
+        response = await self.async_client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Анджелина Джоли', response.content.decode())
+        self.assertNotIn('Черновик', response.content.decode())
+
+    async def test_category(self):
+        response = await self.async_client.get('/category/aktrisy/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Категория - Актрисы', response.content.decode())
+        self.assertEqual((await self.async_client.get('/category/missing/')).status_code, 404)
+
+    async def test_show_post(self):
+        response = await self.async_client.get('/post/jolie/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Анджелина Джоли', response.content.decode())
+        self.assertEqual((await self.async_client.get('/post/draft/')).status_code, 404)
+
+    async def test_about(self):
+        response = await self.async_client.get('/about/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Все категории', response.content.decode())
+        self.assertIn('Анджелина Джоли', response.content.decode())
+
+    # Меню и боковая панель отрисовываются один раз и дальше берутся из кэша.
+    async def test_cached_fragments(self):
+        await self.async_client.get('/')
+        with mock.patch('women.fragments.render_to_string') as render_to_string:
+            response = await self.async_client.get('/post/jolie/')
+        render_to_string.assert_not_called()
+        self.assertIn('Актрисы', response.content.decode())
+
+
+# Отдача загруженных файлов (media.py): диапазоны, условные запросы и X-Accel-Redirect.
+class ServeMediaTests(SimpleTestCase):
+
+    name = 'docs/file.txt'
+    data = b'0123456789'
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root, WOMEN_MEDIA_ACCEL=None, WOMEN_MEDIA_MAX_AGE=600)
+        media.enable()
+        self.addCleanup(media.disable)
+        for name in (self.name, 'photo/2026/01/01/a b.jpg'):
+            os.makedirs(os.path.join(media_root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(media_root, name), 'wb') as f:
+                f.write(self.data)
+        self.factory = RequestFactory()
+
+    def get(self, path=None, method='get', **headers):
+        from .media import serve_media
+        request = getattr(self.factory, method)('/media/', **headers)
+        response = serve_media(request, path or self.name)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        if hasattr(response, 'close'):
+            response.close()
+        return response, content
+
+    def test_full(self):
+        response, content = self.get()
+        self.assertEqual((response.status_code, content), (200, self.data))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=600')
+        self.assertTrue(response['ETag'] and response['Last-Modified'])
+
+    def test_immutable_photo(self):
+        response, _ = self.get('photo/2026/01/01/a b.jpg')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_range(self):
+        for header, body in (('bytes=2-5', b'2345'), ('bytes=-3', b'789'), ('bytes=7-', b'789'),
+                             ('bytes=8-100', b'89')):
+            with self.subTest(header=header):
+                response, content = self.get(HTTP_RANGE=header)
+                self.assertEqual((response.status_code, content), (206, body))
+                self.assertEqual(response['Content-Length'], str(len(body)))
+                self.assertTrue(response['Content-Range'].endswith('/10'))
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.get(HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    # Диапазон отдается, только если If-Range совпадает с текущей версией файла.
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+        response, content = self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, content), (206, b'01'))
+        response, content = self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"')
+        self.assertEqual((response.status_code, content), (200, self.data))
+
+    def test_not_modified(self):
+        response, _ = self.get()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])[0].status_code, 304)
+
+    def test_head(self):
+        response, content = self.get(method='head')
+        self.assertEqual((response.status_code, content), (200, b''))
+        self.assertEqual(response['Content-Length'], '10')
+
+    def test_missing(self):
+        from django.http import Http404
+        for path in ('docs/missing.txt', 'docs', '../secret.txt'):
+            with self.subTest(path=path), self.assertRaises(Http404):
+                self.get(path)
+
+    @override_settings(WOMEN_MEDIA_ACCEL='nginx')
+    def test_accel_redirect(self):
+        response, content = self.get('photo/2026/01/01/a b.jpg')
+        self.assertEqual((response.status_code, content), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/photo/2026/01/01/a%20b.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        # Недопустимый диапазон и условные запросы обрабатываются как без веб-сервера.
+        response, _ = self.get(HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+
+    @override_settings(WOMEN_MEDIA_ACCEL='sendfile')
+    def test_sendfile(self):
+        response, content = self.get()
+        self.assertEqual(content, b'')
+        self.assertEqual(response['X-Sendfile'], os.path.join(settings.MEDIA_ROOT, self.name))
+
+
+# Статические файлы: хэши и сжатые копии при collectstatic (coolsite/storage.py)
+# и выбор копии по Accept-Encoding при отдаче (media.serve_static).
+class StaticFilesTests(SimpleTestCase):
+
+    css = 'body { color: red; }\n' * 50
+
+    def setUp(self):
+        source, self.static_root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        for location in (source, self.static_root):
+            self.addCleanup(shutil.rmtree, location)
+        os.makedirs(os.path.join(source, 'site'))
+        for name, data in (('site/styles.css', self.css), ('site/tiny.css', 'a{}')):
+            with open(os.path.join(source, name), 'w') as f:
+                f.write(data)
+        static = override_settings(STATIC_ROOT=self.static_root, STATICFILES_DIRS=[source],
+                                   STATICFILES_STORAGE='coolsite.storage.CompressedManifestStorage')
+        static.enable()
+        self.addCleanup(static.disable)
+        self.source = source
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def path(self, name):
+        return os.path.join(self.static_root, name)
+
+    def get(self, name, encoding=None):
+        from .media import serve_static
+        headers = {'HTTP_ACCEPT_ENCODING': encoding} if encoding is not None else {}
+        response = serve_static(RequestFactory().get('/static/' + name, **headers), name)
+        content = b''.join(response.streaming_content)
+        response.close()
+        return response, content
+
+    def hashed(self, name):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        return staticfiles_storage.stored_name(name)
+
+    def test_collect_compresses(self):
+        import gzip
+        self.collect()
+        styles, tiny = self.hashed('site/styles.css'), self.hashed('site/tiny.css')
+        self.assertRegex(styles, r'^site/styles\.[0-9a-f]{12}\.css$')
+        with open(self.path(styles + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()).decode(), self.css)
+        # Маленькие файлы не сжимаются.
+        self.assertFalse(os.path.exists(self.path(tiny + '.gz')))
+
+    # Без collectstatic выводится исходное имя, при collectstatic отсутствующий файл - ошибка.
+    def test_manifest_fallback(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        self.assertEqual(staticfiles_storage.url('site/missing.css'), '/static/site/missing.css')
+        with open(os.path.join(self.source, 'site/broken.css'), 'w') as f:
+            f.write('body { background: url("missing.png"); }')
+        with self.assertRaises(ValueError):
+            self.collect()
+
+    def test_encoding_selection(self):
+        self.collect()
+        styles = self.hashed('site/styles.css')
+        with open(self.path(styles + '.br'), 'wb') as f:
+            f.write(b'brotli')
+        for accept, encoding in (('gzip, deflate, br', 'br'), ('gzip', 'gzip'), ('br;q=0, gzip', 'gzip'),
+                                 ('', None), (None, None)):
+            with self.subTest(accept=accept):
+                response, content = self.get(styles, accept)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertEqual(response['Content-Type'], 'text/css')
+                if encoding is None:
+                    self.assertEqual(content.decode(), self.css)
+        # Без сжатых копий ответ не зависит от Accept-Encoding.
+        response, _ = self.get(self.hashed('site/tiny.css'), 'gzip')
+        self.assertNotIn('Vary', response)
+        self.assertNotIn('Content-Encoding', response)
+
+    # Файлы с хэшем в имени кэшируются на год без проверки, исходные имена - на WOMEN_STATIC_MAX_AGE.
+    @override_settings(WOMEN_STATIC_MAX_AGE=120)
+    def test_cache_headers(self):
+        self.collect()
+        response, _ = self.get(self.hashed('site/styles.css'), 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        response, _ = self.get('site/styles.css', 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=120')
+
+
+# Реестр категорий в памяти процесса (categories.py).
+class CategoryRegistryTests(IsolatedCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        from .categories import CategoryRegistry
+        self.registry = CategoryRegistry()
+        self.cat = Category.objects.create(name='Актрисы', slug='aktrisy')
+        Category.objects.create(name='Певицы', slug='pevicy')
+
+    def test_lookups(self):
+        self.assertEqual([r.slug for r in self.registry.all()], ['aktrisy', 'pevicy'])
+        record = self.registry.get_by_slug('aktrisy')
+        self.assertEqual((record.pk, record.name, record.url, record.count),
+                         (self.cat.pk, 'Актрисы', '/category/aktrisy/', 0))
+        self.assertIs(self.registry.get_by_pk(self.cat.pk), record)
+        self.assertIsNone(self.registry.get_by_slug('missing'))
+        self.assertIsNone(self.registry.get_by_pk(0))
+
+    def test_async_lookups(self):
+        self.assertEqual(async_to_sync(self.registry.aget_by_slug)('pevicy').name, 'Певицы')
+        self.assertEqual(len(async_to_sync(self.registry.aall)()), 2)
+        self.assertEqual(async_to_sync(self.registry.aversion)(), self.registry.version())
+
+    # Список хранится в памяти, пока не изменится версия в общем кэше.
+    def test_cached_until_invalidated(self):
+        self.registry.all()
+        with self.assertNumQueries(0):
+            self.registry.get_by_slug('aktrisy')
+        Category.objects.filter(pk=self.cat.pk).update(name='Актрисы кино')
+        self.assertEqual(self.registry.get_by_slug('aktrisy').name, 'Актрисы')
+        self.registry.invalidate()
+        self.assertEqual(self.registry.get_by_slug('aktrisy').name, 'Актрисы кино')
+
+    def test_invalidated_by_signals(self):
+        version = self.registry.version()
+        self.cat.name = 'Актрисы кино'
+        self.cat.save()
+        self.assertNotEqual(self.registry.version(), version)
+        self.assertEqual(self.registry.get_by_pk(self.cat.pk).name, 'Актрисы кино')
+
+        post = Women.objects.create(title='Статья', slug='post', content='Текст', cat=self.cat)
+        self.assertEqual(self.registry.get_by_slug('aktrisy').count, 1)
+        post.delete()
+        self.assertEqual(self.registry.get_by_slug('aktrisy').count, 0)
+
+        Category.objects.get(slug='pevicy').delete()
+        self.assertIsNone(self.registry.get_by_slug('pevicy'))
+        self.assertEqual(len(self.registry.all()), 1)
+
+    # Список, построенный одним процессом, берется другими из общего кэша.
+    def test_shared_between_processes(self):
+        from .categories import CategoryRegistry
+        self.registry.all()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(CategoryRegistry().all()), 2)
+
+
+# Пул капч формы обратной связи (captcha.py). Картинки не рисуются.
+@override_settings(WOMEN_CAPTCHA_POOL_SIZE=4, WOMEN_CAPTCHA_BATCH=2, WOMEN_CAPTCHA_MAX_AGE=60)
+class CaptchaPoolTests(IsolatedCacheMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from . import captcha
+        self.captcha = captcha
+        captcha._local.clear()
+        self.addCleanup(captcha._local.clear)
+        for target, kwargs in (('_render', {'return_value': b'png'}), ('_schedule_refill', {})):
+            patcher = mock.patch('women.captcha.%s' % target, **kwargs)
+            setattr(self, target.lstrip('_'), patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def answer(self, key):
+        from django.core.cache import cache
+        return cache.get('captcha:c:%s' % key)[0]
+
+    def test_refill(self):
+        self.assertEqual(self.captcha.refill(), 4)
+        self.assertEqual(self.captcha._counter('made'), 2)
+        self.assertEqual(self.captcha.refill(), 0)
+        # Пачка забрана процессом - пул пополняется до прежнего размера.
+        self.captcha.issue()
+        self.assertEqual(self.captcha.refill(), 2)
+
+    # Капчи выдаются из пула; когда в нем меньше половины, ставится задача пополнения.
+    def test_issue_from_pool(self):
+        self.captcha.refill()
+        with mock.patch('women.captcha._generate') as generate:
+            keys = [self.captcha.issue() for _ in range(4)]
+        generate.assert_not_called()
+        self.assertEqual(len(set(keys)), 4)
+        self.assertTrue(self.schedule_refill.called)
+
+    # Пул пуст: капча рисуется в запросе и ставится задача пополнения.
+    def test_issue_empty_pool(self):
+        key = self.captcha.issue()
+        self.assertTrue(self.answer(key))
+        self.schedule_refill.assert_called_once_with()
+
+    def test_check_once(self):
+        key = self.captcha.issue()
+        answer = self.answer(key)
+        self.assertTrue(self.captcha.check(key, ' %s ' % answer.upper()))
+        self.assertFalse(self.captcha.check(key, answer))
+        # Неверный ответ тоже расходует капчу.
+        key = self.captcha.issue()
+        answer = self.answer(key)
+        self.assertFalse(self.captcha.check(key, 'wrong'))
+        self.assertFalse(self.captcha.check(key, answer))
+        self.assertFalse(self.captcha.check('missing', 'x'))
+
+    # Капчи из устаревшей пачки не выдаются, а purge удаляет пачку вместе с капчами.
+    def test_expiry(self):
+        from django.core.cache import cache
+        self.captcha.refill()
+        keys = cache.get('captcha:batch:1')[1]
+        # Время сдвигается только для captcha.py, записи кэша еще действительны.
+        later = time.time() + 61
+        with mock.patch('women.captcha.time', mock.Mock(time=lambda: later)):
+            self.assertNotIn(self.captcha.issue(), keys)
+        later = time.time() + self.captcha._lifetime() + 1
+        with mock.patch('women.captcha.time', mock.Mock(time=lambda: later)):
+            self.captcha.purge()
+        self.assertEqual(self.captcha._counter('purged'), 2)
+        self.assertEqual(cache.get_many(['captcha:batch:1'] + ['captcha:c:%s' % key for key in keys]), {})
+
+    def test_image(self):
+        key = self.captcha.issue()
+        response = self.captcha.captcha_image(RequestFactory().get('/'), key)
+        self.assertEqual((response.status_code, response.content), (200, b'png'))
+        self.assertEqual(self.captcha.captcha_image(RequestFactory().get('/'), 'missing').status_code, 410)
+
+
+# Окно номеров страниц (pagination.page_window) при нумерованной пагинации.
+class PageWindowTests(SimpleTestCase):
+
+    def window(self, number, count, **kwargs):
+        from django.core.paginator import Paginator
+        from .pagination import page_window
+        return list(page_window(Paginator(range(count), 1).page(number), **kwargs))
+
+    def test_middle(self):
+        self.assertEqual(self.window(5, 10), [3, 4, 5, 6, 7])
+        self.assertEqual(self.window(5, 10, on_each_side=1), [4, 5, 6])
+
+    def test_near_first(self):
+        self.assertEqual(self.window(1, 10), [1, 2, 3])
+        self.assertEqual(self.window(2, 10), [1, 2, 3, 4])
+
+    def test_near_last(self):
+        self.assertEqual(self.window(10, 10), [8, 9, 10])
+        self.assertEqual(self.window(9, 10), [7, 8, 9, 10])
+
+    def test_fewer_pages_than_window(self):
+        self.assertEqual(self.window(2, 3), [1, 2, 3])
+        self.assertEqual(self.window(1, 1), [1])
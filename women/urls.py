@@ -1,9 +1,29 @@
+from django.conf import settings
 from django.urls import path, re_path
 from .views import *
+from . import async_views
 
 # Импортируем декоратор класса для кэширования.
 from django.views.decorators.cache import cache_page
 
+from .captcha import captcha_image
+from .feeds import feed
+from .sitemaps import sitemap_index, sitemap_pages, sitemap_posts
+from .conditional import category_condition, home_condition, post_condition
+from .pagecache import anonymous_cache_page
+from .ratelimit import ratelimit
+from .routers import replica_reads
+from .sessions import public_page
+
+# Под ASGI публичные страницы обслуживаются асинхронными представлениями
+# (async_views.py), декораторы кэша и условных запросов поддерживают оба варианта.
+if settings.WOMEN_ASYNC_VIEWS:
+    home_view, about_view = async_views.home, async_views.about
+    post_view, category_view = async_views.show_post, async_views.category
+else:
+    home_view, about_view = WomenHome.as_view(), about
+    post_view, category_view = ShowPost.as_view(), WomenCategory.as_view()
+
 urlpatterns = [
 
     # name используется для машрутизации (это имя внутри проекта адреса)
@@ -15,13 +35,32 @@ urlpatterns = [
     # path('', cache_page(60)(WomenHome.as_view()), name='home'),
 
     # Чтобы класс связать с маршрутом нужно вызвать спеециальную функцию as_view().
-    path('', WomenHome.as_view(), name='home'),
-    path('about/', about, name='about'),
+    # Страницы списков и статей кэшируются целиком для анонимных посетителей
+    # и сбрасываются при изменении статей и категорий (см. pagecache.py).
+    # Декораторы *_condition отвечают 304 на условные запросы до обращения к кэшу
+    # и до отрисовки шаблона (см. conditional.py).
+    # Публичные страницы, помеченные replica_reads, читают данные с реплик БД (см. routers.py).
+    # Ответы public_page анонимным посетителям не зависят от cookie и не создают сессий (см. sessions.py).
+    # Вход и регистрация ограничены по частоте запросов до проверки пароля (см. ratelimit.py).
+    path('', public_page(replica_reads(home_condition(anonymous_cache_page('home')(home_view)))), name='home'),
+    path('about/', public_page(replica_reads(about_view)), name='about'),
     path('addpage/', AddPage.as_view(), name='add_page'),
     path('contact/', ContactFormView.as_view(), name='contact'),
-    path('login/', LoginUserForm.as_view(), name='login'),
+    path('contact/captcha/<str:key>.png', captcha_image, name='captcha_image'),
+    path('login/', ratelimit('login')(LoginUserForm.as_view()), name='login'),
     path('logout/', logout_user, name='logout'),
-    path('register/', RegisterUser.as_view(), name='register'),
-    path('post/<slug:post_slug>/', ShowPost.as_view(), name='post'),
-    path('category/<slug:cat_slug>/', WomenCategory.as_view(), name='category'),
+    path('register/', ratelimit('register')(RegisterUser.as_view()), name='register'),
+    path('search/', public_page(replica_reads(SearchView.as_view())), name='search'),
+    path('post/<slug:post_slug>/',
+         public_page(replica_reads(post_condition(anonymous_cache_page('post:{post_slug}')(post_view)))), name='post'),
+    path('category/<slug:cat_slug>/',
+         public_page(replica_reads(category_condition(anonymous_cache_page('cat:{cat_slug}')(category_view)))),
+         name='category'),
+
+    # Карта сайта и лента Atom формируются потоком (см. sitemaps.py и feeds.py).
+    path('sitemap.xml', public_page(replica_reads(sitemap_index)), name='sitemap'),
+    path('sitemap-pages.xml', public_page(replica_reads(sitemap_pages)), name='sitemap_pages'),
+    path('sitemap-posts-<int:section>.xml', public_page(replica_reads(sitemap_posts)), name='sitemap_posts'),
+    path('feed/', public_page(replica_reads(feed)), name='feed'),
+    path('feed/<slug:cat_slug>/', public_page(replica_reads(feed)), name='category_feed'),
 ]
@@ -1,11 +1,18 @@
-from django.core.cache import cache
-from django.db.models import Count
-
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.http import Http404
+
+from .categories import registry
+from .fragments import menu_html, sidebar_html
+from .metrics import timed
 from .models import *
+from .pagination import KeysetPaginator, page_window
 
 menu = [{'title': "О сайте", 'url_name': 'about'},
         {'title': "Добавить статью", 'url_name': 'add_page'},
-        {'title': "Обратная связь", 'url_name': 'contact'}]
+        {'title': "Обратная связь", 'url_name': 'contact'},
+        {'title': "Поиск", 'url_name': 'search'}]
 
 
 # Класс мексин для устранения дублирования в классах представлений.
@@ -14,24 +21,50 @@ class DataMixin:
     # Для реализации пагинации дочернего класса.
     paginate_by = 3
 
+    # Режим пагинации: 'page' - по номерам страниц (OFFSET/LIMIT),
+    # 'keyset' - по курсору (ключу сортировки последней записи).
+    # Если не указан, берется из настройки WOMEN_PAGINATION_MODE.
+    pagination_mode = None
+
+    def get_pagination_mode(self):
+        return self.pagination_mode or getattr(settings, 'WOMEN_PAGINATION_MODE', 'page')
+
+    # Переопределяем метод ListView. В режиме 'keyset' вместо Paginator
+    # используется KeysetPaginator, а страница выбирается по параметру cursor.
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size,
+                                    count_timeout=getattr(settings, 'WOMEN_PAGINATION_COUNT_TIMEOUT', None))
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    # Добавляем в контекст готовое окно номеров страниц,
+    # чтобы шаблон не перебирал весь paginator.page_range.
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        if page is not None and not getattr(page, 'is_keyset', False):
+            context['page_window'] = page_window(page)
+        return context
+
     # Этот метод создает контекст для шаблона.
+    # Время его выполнения учитывается в метриках запроса (metrics.py).
+    @timed('context_time')
     def get_user_context(self, **kwargs):
 
 
         # Формируется начальный словарь из переданных именнованных параметров.
         context = kwargs
 
-        # Реализация кэширования на уровне API.
-        # Берем из кэша коллекцию по ключу cats.
-        cats = cache.get('cats')
-
-        # Если коллекция пустая (в кэше ничего нет по ключу cats).
-        if not cats:
-            # Формируется список категорий и добавляем к каждому объекту количество связанных статей.
-            cats = Category.objects.annotate(Count('women'))
-
-            # Коллекция сохраняется в кэше по ключу cats.
-            cache.set('cats', cats, 60)
+        # Список категорий берется из реестра в памяти процесса (categories.py).
+        # Он хранит готовые записи (с URL и количеством опубликованных статей)
+        # и сбрасывается при изменении категорий и статей, а не по времени.
+        cats = registry.all()
 
         # Копируем меню.
         user_menu = menu.copy()
@@ -54,4 +87,18 @@ class DataMixin:
         if 'cat_selected' not in context:
             context['cat_selected'] = 0
 
+        # Готовые HTML-фрагменты меню и списка категорий для base.html
+        # (отрисовываются один раз и берутся из кэша, см. fragments.py).
+        context['menu_html'] = menu_html(user_menu, self.request.user.is_authenticated)
+        context['sidebar_html'] = sidebar_html(context['cat_selected'])
+
         return context
+
+
+# Пользователь запроса для асинхронного кода. request.user - ленивый объект,
+# и при наличии cookie сессии его вычисление читает сессию и пользователя из БД,
+# поэтому оно выполняется в потоке. Без cookie сессия пустая и БД не нужна.
+async def auser(request):
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
@@ -0,0 +1,45 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Версии в общем кэше используются вместо TTL: данные, построенные для одной
+# версии, хранятся под ключом с ее номером, и смена версии делает их недействительными
+# во всех процессах сразу.
+
+# Возвращает текущую версию по ключу. Если ее нет (кэш очищен, запись вытеснена
+# или истекла), начинаем с метки времени в миллисекундах, чтобы не совпасть с одной
+# из прежних версий. timeout - время жизни версии (None - без ограничения) для ключей,
+# которых может быть много, например по одному на статью.
+def get_version(key, timeout=None):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout)
+        version = cache.get(key)
+    return version
+
+
+# Асинхронный вариант для асинхронных представлений (async_views.py).
+# Обычно версия уже есть в кэше; начальное значение создается синхронно в потоке.
+async def aget_version(key, timeout=None):
+    version = await cache.aget(key)
+    if version is None:
+        version = await sync_to_async(get_version)(key, timeout)
+    return version
+
+
+def _incr(key, timeout):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout)
+
+
+# Увеличивает версию сразу и еще раз после фиксации транзакции: иначе процесс,
+# построивший данные между этими моментами, сохранил бы под новой версией
+# еще не зафиксированное состояние БД.
+def bump_version(key, timeout=None):
+    _incr(key, timeout)
+    transaction.on_commit(lambda: _incr(key, timeout))
@@ -1,13 +1,20 @@
+import hashlib
+
 from django.contrib.auth import logout, login
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.http import HttpResponse, HttpResponseNotFound, Http404
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.http import urlencode
 from django.views.generic import ListView, DetailView, CreateView, FormView
 
 # импорт моделей для получения данных из БД
+from . import postcache, search, tasks
+from .fragments import about_sidebar_html
+from .jobs import enqueue
 from .forms import *
 from .utils import *
 from .models import *
@@ -69,7 +76,9 @@ class WomenHome(DataMixin, ListView):
         # Помимо списка из модели со статьями, дополнительно запрашиваем
         # связанные категории с конкретной записью по ключу cat (связанный параметр).
         # В таком случае при выводе рубрик в шаблоне не будет выполняться дополнительный запрос БД.
-        return Women.objects.filter(is_published=True).select_related('cat')
+        # Поля content и content_html в списке не выводятся (используется готовый анонс),
+        # поэтому не выбираем их из БД.
+        return Women.objects.filter(is_published=True).select_related('cat').defer('content', 'content_html')
 
 
 # Функция представления, которая принимает в качестве аргумента http запрос.
@@ -93,8 +102,9 @@ def index(request):
 # Пример реализации пагинации в функции представлении.
 def about(request):
 
-    # Берем список статей из БД.
-    contact_list = Women.objects.all()
+    # Берем список статей из БД. В шаблоне выводятся только заголовки,
+    # поэтому текст статей не выбираем.
+    contact_list = Women.objects.defer('content', 'content_html', 'excerpt_html')
 
     # Создаем объект пагинации на основе спика.
     paginator = Paginator(contact_list, 3)
@@ -109,7 +119,12 @@ def about(request):
     page_obj = paginator.get_page(page_number)
 
     # Рендерим данные на шаблон и возвращаем страницу.
-    return render(request, 'women/about.html', {'page_obj': page_obj, 'menu': menu, 'title': 'О сайте'})
+    # Вместо всего page_range передаем только окно номеров вокруг текущей страницы.
+    # Меню и список категорий выводятся готовыми фрагментами (fragments.py).
+    return render(request, 'women/about.html', {'page_obj': page_obj, 'page_window': page_window(page_obj),
+                                                'menu': menu, 'title': 'О сайте',
+                                                'menu_html': menu_html(menu, True),
+                                                'sidebar_html': about_sidebar_html()})
 
 
 # Класс для создания формы.
@@ -202,12 +217,15 @@ class ContactFormView(DataMixin, FormView):
         c_def = self.get_user_context(title="Обратная связь")
         return dict(list(context.items()) + list(c_def.items()))
 
-    # Метод, который вызывается при успешной проверке формы регистрации.
-    # В данном случае автоматическая авторизация.
+    # Метод, который вызывается при успешной проверке формы.
+    # Письмо отправляет фоновая задача, ответ не ждет почтового сервера.
+    # Ключ по скрытому полю nonce и содержимому формы не дает отправить письмо
+    # дважды при повторной отправке той же формы.
     def form_valid(self, form):
-
-        # Вывод в консоль на сервере.
-        print(form.cleaned_data)
+        data = form.cleaned_data
+        key = 'contact:%s' % hashlib.sha1(
+            '\0'.join((data['nonce'], data['name'], data['email'], data['content'])).encode()).hexdigest()
+        enqueue(tasks.send_contact_message, data['name'], data['email'], data['content'], key=key)
 
         return redirect('home')
 
@@ -228,6 +246,15 @@ class ShowPost(DataMixin, DetailView):
 
     context_object_name = 'post'
 
+    # Статья берется из кэша статей (postcache.py) вместе с категорией,
+    # запрос к БД выполняется только при промахе. Неопубликованные статьи
+    # видны только авторизованным пользователям.
+    def get_object(self, queryset=None):
+        post = postcache.get_post(self.kwargs[self.slug_url_kwarg])
+        if post is None or not (post.is_published or self.request.user.is_authenticated):
+            raise Http404()
+        return post
+
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
 
@@ -265,8 +292,13 @@ class WomenCategory(DataMixin, ListView):
         # Два подчеркивания означает, что мы обращаемся к параметру slug таблицы,
         # на которую ссылается параметр cat. Для устранения дополнительго запроса
         # БД сразу же вызываем select_related чтобы добавить связанную со статьей категория.
-        return Women.objects.filter(cat__slug=self.kwargs['cat_slug'], is_published=True)\
-            .select_related('cat')
+        # Категория ищется в реестре категорий в памяти, без запроса к БД,
+        # а статьи отбираются прямо по внешнему ключу cat_id.
+        self.cat = registry.get_by_slug(self.kwargs['cat_slug'])
+        if self.cat is None:
+            raise Http404()
+        return Women.objects.filter(cat_id=self.cat.pk, is_published=True)\
+            .select_related('cat').defer('content', 'content_html')
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -283,7 +315,7 @@ class WomenCategory(DataMixin, ListView):
 
         # Вызываем функцию из миксина при помощи self.
         # Формируется словарь c_def с общими параметрами для всех представлений.
-        c = Category.objects.get(slug=self.kwargs['cat_slug'])
+        c = self.cat
         c_def = self.get_user_context(title='Категория - ' + str(c.name),
                                       cat_selected=c.pk)
 
@@ -307,6 +339,30 @@ class WomenCategory(DataMixin, ListView):
 #     return render(request, 'women/index.html', context=context)
 
 
+# Поиск по опубликованным статьям через полнотекстовый индекс (search.py).
+# Результаты упорядочены по релевантности, поэтому используется пагинация
+# по номерам страниц, а не по ключу сортировки.
+class SearchView(DataMixin, ListView):
+    template_name = 'women/search.html'
+    context_object_name = 'posts'
+    pagination_mode = 'page'
+
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '').strip()
+        if search.is_supported():
+            return search.SearchResults(self.query)
+        if not self.query:
+            return Women.objects.none()
+        return Women.objects.filter(title__icontains=self.query, is_published=True)\
+            .select_related('cat').defer('content', 'content_html')
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super().get_context_data(**kwargs)
+        c_def = self.get_user_context(title='Поиск', query=self.query,
+                                      query_prefix=urlencode({'q': self.query}) + '&')
+        return dict(list(context.items()) + list(c_def.items()))
+
+
 class RegisterUser(DataMixin, CreateView):
 
     # Атрибут ссылается на форму регистрации.
@@ -334,6 +390,9 @@ class RegisterUser(DataMixin, CreateView):
         # Производится автоматическая авторизация пользователя при помощи встроенной функции login.
         login(self.request, user)
 
+        # Приветственное письмо отправляет фоновая задача после фиксации транзакции.
+        transaction.on_commit(lambda: enqueue(tasks.send_welcome_email, user.pk, key='welcome:%s' % user.pk))
+
         # Перенаправление по маршруту.
         return redirect('home')
 